@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""RPC throughput and latency benchmark of the PSU server.
+
+Starts mainServer.py against the simulated PSU (sim://), drives it with N
+concurrent Pyro4 client proxies and reports calls per second, latency
+percentiles and server CPU use for every combination of Pyro4 serializer and
+server type, for example:
+
+    ./benchServer.py -c 1 8 32 -b 10 1000 -z serpent marshal -y thread multiplex
+"""
+import os
+import sys
+import json
+import time
+import datetime
+import tempfile
+import threading
+import subprocess
+from libs.stylesDict import dtFormat
+
+
+class BenchError(Exception):
+    pass
+
+
+def makeBatch(size):
+    """creates setQueue batch of `size' setv jobs (as built by the GUI)"""
+    batch = [[('maxv', 20.0), 0.05], [('maxi', 10.0), 0.05]]
+    for n in range(size):
+        batch.append([('setv', 1.0 + n % 150 / 10), 10.0,
+                      ('V', '>=', 0.1), ('V', '<=', 20.0),
+                      ('I', '>=', 0.0), ('I', '<=', 10.0)])
+    return batch
+
+
+def _cpuSeconds(pid):
+    """returns user + system CPU time of the process (Linux /proc only)"""
+    try:
+        with open('/proc/{}/stat'.format(pid)) as stat:
+            fields = stat.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def percentile(ordered, fraction):
+    """returns percentile of the sorted list"""
+    if not ordered:
+        return float('nan')
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ServerProcess():
+    """mainServer.py running in a subprocess with the simulated PSU"""
+    def __init__(self, port, servertype, model='12010'):
+        self.port = port
+        self.workdir = tempfile.mkdtemp(prefix='voltlog-bench-')
+        here = os.path.dirname(os.path.abspath(__file__))
+        command = [sys.executable, os.path.join(here, 'mainServer.py'),
+                   '-d', 'sim://{}'.format(model), '-t', '127.0.0.1',
+                   '-p', str(port), '-y', servertype, '-m', '0', '-L', 'ERROR',
+                   '-l', os.path.join(self.workdir, 'server.log'),
+                   '-r', os.path.join(self.workdir, 'records'),
+                   '-z', 'serpent', 'marshal', 'json', 'pickle']
+        self.process = subprocess.Popen(command, cwd=here,
+                                        stdout=subprocess.DEVNULL)
+        self.uri = 'PYRO:psuServer@127.0.0.1:{}'.format(port)
+
+    def waitReady(self, timeout=20):
+        """returns time [s] after which the server answered the first call"""
+        import Pyro4
+        start = time.perf_counter()
+        while time.perf_counter() - start < timeout:
+            if self.process.poll() is not None:
+                raise BenchError('Server exited with {}'.format(
+                                 self.process.returncode))
+            try:
+                with Pyro4.Proxy(self.uri) as proxy:
+                    proxy.getServerTimeNow()
+                return time.perf_counter() - start
+            except Pyro4.errors.CommunicationError:
+                time.sleep(0.05)
+        raise BenchError('Server not ready after {} s'.format(timeout))
+
+    def cpu(self):
+        return _cpuSeconds(self.process.pid)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def _client(uri, serializer, call, deadline, latencies, errors):
+    """client thread: repeats `call' on its own proxy until `deadline'"""
+    import Pyro4
+    with Pyro4.Proxy(uri) as proxy:
+        proxy._pyroSerializer = serializer
+        proxy._pyroBind()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                call(proxy)
+            except Exception:
+                errors.append(sys.exc_info()[1])
+                continue
+            latencies.append(time.perf_counter() - start)
+
+
+def runPhase(server, serializer, clients, name, call, duration):
+    """drives the server with `clients' concurrent proxies
+
+    Returns:
+        dictionary of results"""
+    latencies, errors = [], []  # list.append is thread-safe
+    cpuStart, wallStart = server.cpu(), time.perf_counter()
+    deadline = wallStart + duration
+    threads = [threading.Thread(target=_client, daemon=True,
+                                args=(server.uri, serializer, call, deadline,
+                                      latencies, errors))
+               for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wallStart
+    cpuEnd = server.cpu()
+    latencies.sort()
+    return {'call': name, 'serializer': serializer, 'clients': clients,
+            'calls': len(latencies), 'errors': len(errors),
+            'cps': len(latencies) / wall,
+            'p50': percentile(latencies, 0.50),
+            'p90': percentile(latencies, 0.90),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1] if latencies else float('nan'),
+            'cpu': (cpuEnd - cpuStart) / wall if cpuStart is not None and
+            cpuEnd is not None else None}
+
+
+def _startStop(proxy):
+    """one scheduler start/stop cycle (the scheduler never reaches its
+    start time), the pause lets the previous scheduler thread finish"""
+    start = datetime.datetime.now() + datetime.timedelta(seconds=30)
+    proxy.startScheduler(start.strftime(dtFormat), 1)
+    proxy.stopScheduler()
+    time.sleep(1.1)
+
+
+def phases(batchSizes):
+    """yields (name, call, clients override) of benchmark phases"""
+    yield 'getVIP', lambda proxy: proxy.getVIP(), None
+    yield 'status', lambda proxy: proxy.status(), None
+    for size in batchSizes:
+        batch = makeBatch(size)
+        yield ('setQueue[{}]'.format(size),
+               lambda proxy, batch=batch: proxy.setQueue(batch), None)
+    yield 'start/stop', _startStop, 1  # one controller at a time
+
+
+def report(results, out=sys.stdout):
+    head = '{:<10} {:<10} {:<15} {:>4} {:>9} {:>9} {:>9} {:>9} {:>9} {:>6} {:>5}'
+    row = ('{:<10} {:<10} {:<15} {:>4} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f} '
+           '{:>9.2f} {:>6} {:>5}')
+    print(head.format('server', 'serializer', 'call', 'n', 'calls/s',
+                      'p50[ms]', 'p90[ms]', 'p99[ms]', 'max[ms]', 'cpu%',
+                      'err'), file=out)
+    for r in results:
+        cpu = '-' if r['cpu'] is None else '{:.0f}'.format(100 * r['cpu'])
+        print(row.format(r['servertype'], r['serializer'], r['call'],
+                         r['clients'], r['cps'], 1000 * r['p50'],
+                         1000 * r['p90'], 1000 * r['p99'], 1000 * r['max'],
+                         cpu, r['errors']), file=out)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='PSU server RPC benchmark')
+    parser.add_argument('-c', '--clients', type=int, nargs='+', default=[1, 8],
+                        help='numbers of concurrent clients (default 1 8)')
+    parser.add_argument('-b', '--batch', type=int, nargs='+',
+                        default=[10, 1000],
+                        help='setQueue batch sizes (default 10 1000)')
+    parser.add_argument('-z', '--serializers', nargs='+',
+                        default=['serpent', 'marshal'],
+                        help='Pyro4 serializers (default serpent marshal)')
+    parser.add_argument('-y', '--servertypes', nargs='+',
+                        default=['thread', 'multiplex'],
+                        choices=('thread', 'multiplex'),
+                        help='Pyro4 server types (default thread multiplex)')
+    parser.add_argument('-d', '--duration', type=float, default=3.0,
+                        help='duration of every phase [s] (default 3)')
+    parser.add_argument('-p', '--port', type=int, default=50004,
+                        help='server port, 50000-50004 (default 50004)')
+    parser.add_argument('-o', '--output', help='JSON file with raw results')
+    args = parser.parse_args()
+
+    results = []
+    for servertype in args.servertypes:
+        server = ServerProcess(args.port, servertype)
+        try:
+            ready = server.waitReady()
+            print('# {} server ready after {:.2f} s'.format(servertype, ready))
+            for serializer in args.serializers:
+                for name, call, fixed in phases(args.batch):
+                    for clients in ([fixed] if fixed else args.clients):
+                        result = runPhase(server, serializer, clients, name,
+                                          call, args.duration)
+                        result['servertype'] = servertype
+                        results.append(result)
+        finally:
+            server.stop()
+    report(results)
+    if args.output:
+        with open(args.output, mode='w') as out:
+            json.dump(results, out, indent=1)
+
+if __name__ == '__main__':
+    main()
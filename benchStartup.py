@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""Startup time budgets of the PSU tools.
+
+Measures (median of --repeat runs) and compares with budgets:
+    server help    -> `mainServer.py --help' (argument parsing only)
+    server ready   -> mainServer.py with the simulated PSU answers first RPC
+    client help    -> `psuClient.py --help'
+    GUI window     -> mainGUI.MainPanel window is mapped (needs $DISPLAY)
+    GUI plot       -> matplotlib plot of the GUI is created (needs $DISPLAY)
+    import <entry> -> cumulative import time of the entry module (python -X
+                      importtime), budgets catch eagerly imported heavy
+                      modules
+and prints the slowest imports of every entry point.
+Exits with 1 if any budget is exceeded, for example:
+
+    ./benchStartup.py -r 5 --budget gui-window=1.0
+"""
+import os
+import sys
+import json
+import time
+import subprocess
+from statistics import median
+from benchServer import ServerProcess
+
+here = os.path.dirname(os.path.abspath(__file__))
+budgets = {'server-help': 0.3, 'server-ready': 3.0, 'client-help': 0.3,
+           'gui-window': 1.0, 'gui-plot': 3.0, 'import-mainServer': 0.05,
+           'import-psuClient': 0.05, 'import-mainGUI': 0.1}  # seconds
+entries = {'mainServer': 'import mainServer', 'psuClient': 'import psuClient',
+           'mainGUI': 'import mainGUI'}
+guiProbe = '''
+import sys, time, tkinter as tk
+import mainGUI
+root = tk.Tk()
+panel = mainGUI.MainPanel(root)
+panel.grid(row=0, column=0)
+root.wait_visibility()
+print('gui-window', flush=True)
+def check():
+    if panel.matFrame is None:
+        root.after(5, check)
+        return
+    print('gui-plot', flush=True)
+    root.destroy()
+root.after(5, check)
+root.mainloop()
+'''
+
+
+def timeCommand(*args):
+    """returns wall time [s] of the python command"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + list(args), cwd=here, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def timeGui():
+    """returns times [s] of GUI startup events (see guiProbe)"""
+    start = time.perf_counter()
+    probe = subprocess.Popen([sys.executable, '-c', guiProbe], cwd=here,
+                             stdout=subprocess.PIPE, universal_newlines=True)
+    times = {}
+    for line in probe.stdout:
+        times[line.strip()] = time.perf_counter() - start
+    if probe.wait():
+        raise subprocess.CalledProcessError(probe.returncode, 'guiProbe')
+    return times
+
+
+def timeServer(port):
+    server = ServerProcess(port, 'thread')
+    try:
+        return server.waitReady()
+    finally:
+        server.stop()
+
+
+def importProfile(statement, top=None):
+    """returns `top' (default all) slowest imports (cumulative
+    microseconds, module)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             statement], cwd=here, check=True,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, module = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), module.rstrip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def importTime(entry):
+    """returns cumulative import time [s] of the `entry' module"""
+    for cumulative, module in importProfile(entries[entry]):
+        if module.strip() == entry:
+            return cumulative / 1e6
+    raise ValueError('{} not imported'.format(entry))
+
+
+def measure(args):
+    """returns dictionary of lists of measured times"""
+    times = {name: [] for name in budgets}
+    gui = bool(os.environ.get('DISPLAY')) or sys.platform == 'win32'
+    for n in range(args.repeat):
+        times['server-help'].append(timeCommand('mainServer.py', '--help'))
+        times['client-help'].append(timeCommand('psuClient.py', '--help'))
+        times['server-ready'].append(timeServer(args.port))
+        for entry in entries:
+            times['import-' + entry].append(importTime(entry))
+        if gui:
+            for name, value in timeGui().items():
+                times[name].append(value)
+    return times
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Startup time budgets')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='runs of every measurement (default 3)')
+    parser.add_argument('-b', '--budget', nargs='+', default=[],
+                        metavar='NAME=SECONDS',
+                        help='override budgets ({})'.format(', '.join(
+                            '{}={}'.format(*item) for item in budgets.items())))
+    parser.add_argument('-p', '--port', type=int, default=50004,
+                        help='server port, 50000-50004 (default 50004)')
+    parser.add_argument('-t', '--top', type=int, default=8,
+                        help='slowest imports shown per entry (default 8)')
+    parser.add_argument('-o', '--output', help='JSON file with results')
+    args = parser.parse_args()
+    for item in args.budget:
+        name, _, value = item.partition('=')
+        if name not in budgets:
+            parser.error('unknown budget: {}'.format(name))
+        budgets[name] = float(value)
+
+    for entry, statement in entries.items():
+        print('# slowest imports of {} [ms]'.format(entry))
+        for cumulative, module in importProfile(statement, args.top):
+            print('{:>10.1f}  {}'.format(cumulative / 1000, module))
+    times = measure(args)
+    results = []
+    print('{:<18} {:>10} {:>10}  {}'.format('startup', 'median[s]',
+                                            'budget[s]', 'result'))
+    for name, values in times.items():
+        if not values:
+            print('{:<18} {:>10} {:>10.2f}  skipped (no display)'.format(
+                  name, '-', budgets[name]))
+            continue
+        value = median(values)
+        ok = value <= budgets[name]
+        results.append({'name': name, 'median': value, 'runs': values,
+                        'budget': budgets[name], 'ok': ok})
+        print('{:<18} {:>10.3f} {:>10.2f}  {}'.format(
+              name, value, budgets[name], 'OK' if ok else 'EXCEEDED'))
+    if args.output:
+        with open(args.output, mode='w') as out:
+            json.dump(results, out, indent=1)
+    sys.exit(0 if all(result['ok'] for result in results) else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""One-time converter of pickled job queues (save/*.sav) to program files.
+
+    ./convertSav.py save/*.sav          -> save/<name>.vlp (text)
+    ./convertSav.py -b save/*.sav       -> save/<name>.vlb (binary)
+
+Only convert .sav files you created yourself: loading a pickle can run
+arbitrary code.
+"""
+import os
+import sys
+import pickle
+from libs.jobModel import JobModel, JobModelError
+import libs.programFile as pf
+
+
+def convert(path, binary=False):
+    """converts one .sav file
+
+    Returns:
+        (string) path of the program file"""
+    with open(path, mode='rb') as sav:
+        jobs = JobModel(pickle.load(sav))
+    target = os.path.splitext(path)[0] + (pf.BINARY if binary else pf.TEXT)
+    pf.saveJobs(target, jobs, binary=binary)
+    return target
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='converts pickled job '
+                                     'queues (.sav) to program files')
+    parser.add_argument('files', nargs='+', help='.sav files')
+    parser.add_argument('-b', '--binary', action='store_true',
+                        help='write binary programs (.vlb)')
+    args = parser.parse_args()
+    failed = 0
+    for path in args.files:
+        try:
+            target = convert(path, args.binary)
+        except (OSError, pickle.UnpicklingError, JobModelError,
+                ValueError) as er:
+            print('{}: {}'.format(path, er), file=sys.stderr)
+            failed += 1
+            continue
+        print('{} -> {}'.format(path, target))
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""Exports recorded PSU run (see libs/recorder.py) to CSV or Parquet.
+
+Local run files are read directly, runs stored on the PSU server are streamed
+through its `exportRun' Pyro4 method (option -s)."""
+import sys
+import datetime
+import libs.exporter as exporter
+import libs.recorder as recorder
+from libs.stylesDict import dtFormat
+
+
+def _seconds(string):
+    """converts dtFormat string into seconds since epoch"""
+    return datetime.datetime.strptime(string, dtFormat).timestamp()
+
+
+def _remoteChunks(args):
+    """streams exported run from the PSU server"""
+    import Pyro4
+    import serpent
+    uri = 'PYRO:{}@{}:{}'.format(args.psuid, args.server, args.port)
+    with Pyro4.Proxy(uri) as psuServer:
+        for chunk in psuServer.exportRun(args.run, args.format, args.start,
+                                         args.stop, args.columns, args.every):
+            if isinstance(chunk, dict):  # bytes serialized by serpent
+                chunk = serpent.tobytes(chunk)
+            yield chunk
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Recorded PSU run exporter')
+    parser.add_argument('run', help='run file (or run name with -s option)')
+    parser.add_argument('-o', '--output',
+                        help='output file (default stdout, csv only)')
+    parser.add_argument('-f', '--format', default='csv',
+                        choices=exporter.formats,
+                        help='output format (default csv)')
+    parser.add_argument('--start', help='slice start time ({})'.format(
+                        dtFormat.replace('%', '%%')))
+    parser.add_argument('--stop', help='slice end time ({})'.format(
+                        dtFormat.replace('%', '%%')))
+    parser.add_argument('-c', '--columns', nargs='+',
+                        help='exported columns (default all: time job V I P)')
+    parser.add_argument('-e', '--every', type=int, default=1,
+                        help='decimation: take every n-th sample (default 1)')
+    parser.add_argument('-s', '--server',
+                        help='PSU server host, run is exported by the server')
+    parser.add_argument('-p', '--port', type=int, default=50000,
+                        help='Pyro4 port of the server (default 50000)')
+    parser.add_argument('-i', '--psuid', default='psuServer',
+                        help='Pyro4 id of the server (default psuServer)')
+    args = parser.parse_args()
+
+    binary = exporter.isBinary(args.format)
+    if binary and not args.output:
+        parser.error('{} output needs -o option'.format(args.format))
+    try:
+        if args.server:
+            chunks = _remoteChunks(args)
+        else:
+            start = _seconds(args.start) if args.start else None
+            stop = _seconds(args.stop) if args.stop else None
+            chunks = exporter.iterExportFile(args.run, args.format, start,
+                                             stop, args.columns, args.every)
+        if args.output:
+            out = open(args.output, mode='wb' if binary else 'w')
+        else:
+            out = sys.stdout
+        with out:
+            for chunk in chunks:
+                out.write(chunk)
+    except (exporter.ExportFormatError, exporter.ColumnError,
+            recorder.RunFileError, ValueError, OSError) as err:
+        sys.exit('exportRun: {}'.format(err))
+
+if __name__ == '__main__':
+    main()
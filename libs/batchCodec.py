@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+"""
+Compact binary encoding of the scheduler batch (MainServer.setQueue).
+
+The legacy batch is a list of records [what, how_long, (left, operator,
+right), ...]. The encoded batch keeps the same jobs in fixed-width columns:
+    header -> `<5sBBHI': MAGIC, VERSION, flags (ZLIB), mask of the bound
+              columns present, number of jobs
+    body   -> opcodes (B, index of OPCODES), values (d, NaN for None),
+              how_long (d), then the present bound columns (d, NaN where
+              the job has no such condition), zlib compressed with ZLIB
+Bound columns are the (left, operator) pairs of BOUNDS. Several conditions
+of one job on the same pair are reduced to the tightest one, as
+condition.get_list_range does, so the job stop ranges (job.Job.subs) stay
+the same.
+
+The server checks the whole decoded batch at once (min/max of the columns
+against the PSU model ranges) and builds the jobs only when the scheduler
+takes them (see job.JobQueue), so an upload of 100000 jobs costs
+milliseconds instead of seconds of condition objects.
+"""
+import zlib
+import math
+import base64
+import struct
+import operator
+import itertools
+from array import array
+from libs.modelsDict import models, accumulated
+import libs.condition as condition
+import libs.job as job
+
+MAGIC = b'VLBAT'
+VERSION = 1
+ZLIB = 1
+OPCODES = ('setv', 'maxv', 'maxi')
+BOUNDS = (('V', '>='), ('V', '<='), ('I', '>='), ('I', '<='), ('P', '>='),
+          ('P', '<='), ('Ah', '<='), ('Wh', '<='), ('dV', '>='),
+          ('dV', '<='), ('dI', '>='), ('dI', '<='))
+_header = struct.Struct('<5sBBHI')
+_columns = {bound: index for index, bound in enumerate(BOUNDS)}
+_opcodes = {name: code for code, name in enumerate(OPCODES)}
+_valueRanges = {'setv': 'V', 'maxv': 'V', 'maxi': 'I'}  # model range
+_nan = float('nan')
+
+
+class BatchCodecError(Exception):
+    pass
+
+
+def encodeColumns(opcodes, values, seconds, bounds, compress=True):
+    """encodes batch columns
+
+    Arguments:
+        opcodes  -> (bytes) OPCODES indexes of the jobs
+        values   -> (array('d')) values of the jobs (NaN for None)
+        seconds  -> (array('d')) how_long of the jobs
+        bounds   -> (dictionary) {(left, operator): array('d')} bound columns
+                    of BOUNDS, NaN where the job has no such condition
+        compress -> (boolean, optional) zlib compression of the body
+
+    Returns:
+        bytes"""
+    count = len(opcodes)
+    mask = 0
+    body = [bytes(opcodes), values.tobytes(), seconds.tobytes()]
+    for index, bound in enumerate(BOUNDS):
+        if bound in bounds:
+            if len(bounds[bound]) != count:
+                raise BatchCodecError('Wrong length of {} column'.format(
+                                      ''.join(bound)))
+            mask |= 1 << index
+            body.append(bounds[bound].tobytes())
+    if len(values) != count or len(seconds) != count:
+        raise BatchCodecError('Wrong length of the job columns')
+    body = b''.join(body)
+    flags = 0
+    if compress:
+        body = zlib.compress(body, 6)
+        flags |= ZLIB
+    return _header.pack(MAGIC, VERSION, flags, mask, count) + body
+
+
+def encodeBatch(batch, compress=True):
+    """encodes legacy batch (see MainServer.setQueue)
+
+    Arguments:
+        batch    -> list of records [what, how_long, (left, operator,
+                    right), ...]
+        compress -> (boolean, optional) zlib compression of the body
+
+    Returns:
+        bytes"""
+    opcodes = bytearray()
+    values = array('d')
+    seconds = array('d')
+    rows = []  # {(left, operator): right} of the jobs
+    for number, (what, how_long, *conds) in enumerate(batch):
+        tightest = {}
+        try:
+            opcodes.append(_opcodes[what[0]])
+            values.append(_nan if what[1] is None else what[1])
+            seconds.append(how_long)
+            for left, operator_, right in conds:
+                if (left, operator_) not in _columns:
+                    raise BatchCodecError('Unknown condition of job {}: '
+                                          '{}{}'.format(number, left,
+                                                        operator_))
+                old = tightest.get((left, operator_), right)
+                tightest[(left, operator_)] = max(old, right) if \
+                    operator_ == '>=' else min(old, right)
+        except KeyError as error:
+            raise BatchCodecError('Unknown job {}: {}'.format(number, error))
+        except (TypeError, ValueError) as error:
+            raise BatchCodecError('Wrong job {}: {}'.format(number, error))
+        rows.append(tightest)
+    bounds = {bound: array('d', (row.get(bound, _nan) for row in rows))
+              for bound in BOUNDS if any(bound in row for row in rows)}
+    return encodeColumns(opcodes, values, seconds, bounds, compress)
+
+
+def encodeJobs(jobs, first=(), limits=(), compress=True):
+    """encodes `setv' jobs of the job model (no per job work for the model
+    in memory), see psuClient.makeBatch
+
+    Arguments:
+        jobs     -> jobModel.JobModel object
+        first    -> (sequence, optional) legacy records before the jobs
+                    (max V and max I jobs)
+        limits   -> (sequence, optional) conditions added to every job of
+                    the model, e.x.: (('Ah', '<=', 2.0),)
+        compress -> (boolean, optional) zlib compression of the body
+
+    Returns:
+        bytes"""
+    if jobs.source is not None:  # lazy binary program
+        data = {name: array('d') for name in jobs.columns}
+        for row in jobs.rows():
+            for name, value in zip(jobs.columns, row):
+                data[name].append(value)
+    else:
+        data = jobs.data
+    count = len(data['V'])
+    head = len(first)
+    opcodes = bytearray(_opcodes[what[0]] for what, *rest in first)
+    opcodes += bytes([_opcodes['setv']]) * count
+    values = array('d', (_nan if what[1] is None else what[1]
+                         for what, *rest in first)) + data['V']
+    seconds = array('d', (rest[0] for what, *rest in first)) + \
+        data['seconds']
+    bounds = {}
+    for bound, name in jobs.exits.items():
+        bounds[bound] = array('d', [_nan]) * head + data[name]
+    for left, operator_, right in limits:
+        if (left, operator_) not in _columns:
+            raise BatchCodecError('Unknown condition: {}{}'.format(left,
+                                                                   operator_))
+        column = bounds.get((left, operator_))
+        if column is None:
+            bounds[(left, operator_)] = array('d', [_nan]) * head + \
+                array('d', [right]) * count
+        else:  # tightest of the conditions
+            tighten = max if operator_ == '>=' else min
+            column[head:] = array('d', (tighten(value, right) for value in
+                                        column[head:]))
+    return encodeColumns(opcodes, values, seconds, bounds, compress)
+
+
+def encodedBytes(batch):
+    """returns bytes of the encoded batch or None for the legacy batch,
+    serpent (Pyro4 default serializer) sends bytes as a base64 dictionary"""
+    if isinstance(batch, (bytes, bytearray, memoryview)):
+        return bytes(batch)
+    if isinstance(batch, dict) and batch.get('encoding') == 'base64':
+        return base64.b64decode(batch['data'])
+    return None
+
+
+class DecodedBatch():
+    """columns of the encoded batch"""
+    def __init__(self, data):
+        """Arguments:
+            data -> (bytes) encoded batch"""
+        if len(data) < _header.size:
+            raise BatchCodecError('Not an encoded batch')
+        magic, version, flags, mask, count = _header.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise BatchCodecError('Not an encoded batch')
+        body = data[_header.size:]
+        if flags & ZLIB:
+            try:
+                body = zlib.decompress(body)
+            except zlib.error as error:
+                raise BatchCodecError('Damaged batch: {}'.format(error))
+        present = [bound for index, bound in enumerate(BOUNDS)
+                   if mask & 1 << index]
+        if len(body) != count * (1 + 8 * (2 + len(present))):
+            raise BatchCodecError('Damaged batch: wrong size')
+        self.count = count
+        self.opcodes = body[:count]
+        view = memoryview(body)[count:].cast('d')  # no copy
+        self.values = view[:count]
+        self.seconds = view[count:2 * count]
+        self.bounds = {bound: view[(2 + n) * count:(3 + n) * count]
+                       for n, bound in enumerate(present)}
+
+    def __len__(self):
+        return self.count
+
+    def validate(self, model):
+        """checks all jobs against the ranges of the PSU `model' (the same
+        errors as condition.Condition and job.Job)"""
+        if self.count == 0:
+            return
+        if max(self.opcodes) >= len(OPCODES):
+            raise BatchCodecError('Unknown job opcode')
+        if not math.isfinite(sum(self.seconds)) or min(self.seconds) < 0:
+            raise job.WrongConditionSet('how_long must be positive')
+        ranges = models[model]
+        for code, what in enumerate(OPCODES):
+            # values of the opcode only (mask of the opcodes, C loops)
+            mask = self.opcodes.translate(bytes(int(index == code)
+                                                for index in range(256)))
+            if not any(mask):
+                continue
+            span = _span(array('d', itertools.compress(self.values, mask)))
+            if span is None:
+                continue  # None values only
+            low, high = span
+            left = _valueRanges[what]
+            if low < ranges[left + 'min'] or high > ranges[left + 'max']:
+                raise condition.OffLimitsError('Wrong {} value: {}'.format(
+                    what, low if low < ranges[left + 'min'] else high))
+        spans = {}
+        for (left, operator_), column in self.bounds.items():
+            span = spans[(left, operator_)] = _span(column)
+            if span is None:
+                continue
+            low, high = span
+            minimum = ranges[left + 'min']
+            maximum = math.inf if left in accumulated else ranges[left + 'max']
+            if low < minimum or high > maximum:
+                raise condition.OffLimitsError('Wrong {} value: {}'.format(
+                    left, low if low < minimum else high))
+        for left, operator_ in BOUNDS[::2]:
+            lows = spans.get((left, '>='))
+            highs = spans.get((left, '<='))
+            if lows is None or highs is None or lows[1] < highs[0]:
+                continue  # no job can have an empty range
+            if any(map(operator.ge, self.bounds[(left, '>=')],
+                       self.bounds[(left, '<=')])):  # NaN is False
+                raise condition.CompactRangeError('Empty {} range'.format(
+                                                  left))
+
+    def job(self, index, psu, model):
+        """builds job.Job object of the job with the `index'"""
+        what = OPCODES[self.opcodes[index]]
+        value = self.values[index]
+        conds = [condition.Condition(model, left, operator_, column[index])
+                 for (left, operator_), column in self.bounds.items()
+                 if column[index] == column[index]]  # not NaN
+        try:
+            return job.Job(psu, (what, None if value != value else value),
+                           self.seconds[index], conds)
+        except Exception as error:  # range reduced to nothing by rounding
+            raise BatchCodecError('Wrong job {}: {!r}'.format(index, error))
+
+    def records(self):
+        """yields jobs as the legacy batch records"""
+        for index in range(self.count):
+            value = self.values[index]
+            record = [(OPCODES[self.opcodes[index]],
+                       None if value != value else value),
+                      self.seconds[index]]
+            record.extend((left, operator_, column[index]) for
+                          (left, operator_), column in self.bounds.items()
+                          if column[index] == column[index])
+            yield record
+
+
+def _span(column):
+    """returns (min, max) of the bound column without NaNs (no bound), None
+    if it has no values"""
+    start = 0
+    while start < len(column) and column[start] != column[start]:
+        start += 1  # jobs without the bound (max V, max I) lead the batch
+    column = column[start:]
+    if not column:
+        return None
+    if column.tobytes() == column[:1].tobytes() * len(column):
+        return column[0], column[0]  # constant
+    # NaN is never less or greater, so min and max skip it unless it is the
+    # first value
+    return min(column), max(column)
+
+
+def decodeBatch(data, model=None):
+    """decodes encoded batch, checks it for the PSU `model' if given
+
+    Returns:
+        DecodedBatch object"""
+    batch = DecodedBatch(data)
+    if model is not None:
+        batch.validate(model)
+    return batch
+
+if __name__ == '__main__':
+    import time
+    batch = [[('maxv', 20.0), 0.05], [('maxi', 10.0), 0.05]]
+    batch += [[('setv', 1 + n % 100 / 10), 10.0, ('V', '>=', 0.1),
+               ('V', '<=', 20.0), ('I', '>=', 0.0), ('I', '<=', 10.0)]
+              for n in range(100000)]
+    for compress in (False, True):
+        start = time.perf_counter()
+        data = encodeBatch(batch, compress)
+        encoded = time.perf_counter() - start
+        start = time.perf_counter()
+        decodeBatch(data, '12010')
+        print('{} jobs: {} bytes (compress {}), encoded in {:.3f} s, decoded '
+              'and checked in {:.4f} s'.format(len(batch), len(data),
+                                               compress, encoded,
+                                               time.perf_counter() - start))
+    assert list(decodeBatch(data).records()) == \
+        [[tuple(record[0]), record[1]] + list(record[2:]) for record in batch]
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""
+Capture and replay of the PSU serial traffic.
+
+CapturePort wraps any transport of the PSU (see transport.openPort) and
+logs every read and write with its monotonic timestamp into a binary file:
+    header -> `<5sBd': MAGIC, VERSION, wall clock time of the capture start
+    record -> `<dBH': seconds since the start, READ or WRITE, data length,
+              followed by the data (empty reads are read timeouts)
+Records are packed into a buffered file under the port lock, so a 3 byte
+frame costs 14 bytes and a few microseconds. The file is flushed at most
+once per `flush' seconds and on close.
+
+ReplayPort plays a capture back (`replay://<file>?speed=10' port name):
+writes are matched against the captured ones, reads return the captured
+frames after the captured response delay (time from the last write) divided
+by `speed' (0 means no delays). See replayCapture.py for the replay of whole
+captured sessions through VoltcraftPSU.
+"""
+import time
+import struct
+import logging
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'VLCAP'
+VERSION = 1
+WRITE, READ = 0, 1
+_header = struct.Struct('<5sBd')
+_record = struct.Struct('<dBH')
+
+
+class CaptureError(Exception):
+    pass
+
+
+class CapturePort():
+    """transport wrapper logging the traffic into the capture file"""
+    def __init__(self, port, path, flush=1.0):
+        """Arguments:
+            port  -> transport object (pyserial-like read, write, ...)
+            path  -> (string) capture file, overwritten
+            flush -> (float, optional) max time [s] of unflushed records"""
+        self.port = port
+        self.path = path
+        self.flush = flush
+        self.file = open(path, mode='wb', buffering=1 << 16)
+        self.start = time.monotonic()
+        self.flushed = self.start
+        self._lock = Lock()
+        self.file.write(_header.pack(MAGIC, VERSION, time.time()))
+
+    def _log(self, kind, data):
+        now = time.monotonic()
+        with self._lock:
+            if self.file.closed:
+                return
+            self.file.write(_record.pack(now - self.start, kind, len(data)))
+            self.file.write(data)
+            if now - self.flushed > self.flush:
+                self.file.flush()
+                self.flushed = now
+
+    def read(self, size=1):
+        data = self.port.read(size)
+        self._log(READ, data)
+        return data
+
+    def write(self, data):
+        data = bytes(data)
+        self._log(WRITE, data)
+        return self.port.write(data)
+
+    def flushInput(self):
+        self.port.flushInput()
+
+    def flushOutput(self):
+        self.port.flushOutput()
+
+    def close(self):
+        with self._lock:
+            self.file.close()
+        self.port.close()
+
+
+def readCapture(path):
+    """returns (wall clock start, list of (time, kind, data) records)"""
+    with open(path, mode='rb') as capture:
+        header = capture.read(_header.size)
+        if len(header) < _header.size:
+            raise CaptureError('Not a capture file: {}'.format(path))
+        magic, version, started = _header.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise CaptureError('Not a capture file: {}'.format(path))
+        records = []
+        while True:
+            head = capture.read(_record.size)
+            if len(head) < _record.size:  # truncated by crash is fine
+                break
+            t, kind, size = _record.unpack(head)
+            data = capture.read(size)
+            if len(data) < size:
+                break
+            records.append((t, kind, data))
+    return started, records
+
+
+class ReplayPort():
+    """transport serving the captured traffic"""
+    def __init__(self, path, speed=1.0, timeout=0.5):
+        """Arguments:
+            path    -> (string) capture file
+            speed   -> (float, optional) speed up of the captured delays,
+                       0 serves the frames without delays
+            timeout -> (float, optional) read timeout [s] after the end of
+                       the capture, as in pyserial"""
+        self.started, self.records = readCapture(path)
+        self.speed = speed
+        self.timeout = timeout
+        self.position = 0
+        self.mismatches = 0  # writes different from the captured ones
+        self.anchor = (time.monotonic(), 0.0)  # last write: replay, capture
+        self._lock = Lock()
+
+    @property
+    def finished(self):
+        return self.position >= len(self.records)
+
+    def write(self, data):
+        data = bytes(data)
+        with self._lock:
+            if not self.finished and self.records[self.position][1] == WRITE:
+                t, kind, captured = self.records[self.position]
+                self.position += 1
+                self.anchor = (time.monotonic(), t)
+                if captured == data:
+                    return len(data)
+                logger.debug('replay write %s, captured %s', data, captured)
+            self.mismatches += 1
+        return len(data)
+
+    def read(self, size=1):
+        with self._lock:
+            while not self.finished and self.records[self.position][1] == WRITE:
+                self.position += 1  # captured write not repeated
+                self.mismatches += 1
+            if self.finished:
+                record = None
+            else:
+                record = self.records[self.position]
+                self.position += 1
+        if record is None:
+            time.sleep(self.timeout)
+            return b''
+        if self.speed:
+            replayed, captured = self.anchor
+            delay = replayed + (record[0] - captured) / self.speed
+            delay -= time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return record[2][:size]
+
+    def flushInput(self):
+        pass
+
+    def flushOutput(self):
+        pass
+
+    def close(self):
+        pass
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+    from libs.simulator import SimulatedPort
+    path = os.path.join(tempfile.mkdtemp(), 'demo.vlc')
+    port = CapturePort(SimulatedPort(), path)
+    start = time.perf_counter()
+    for n in range(100):
+        port.write(b'\xae\x00\x00')
+        port.read(3)
+    print('captured 100 queries in {:.3f} s'.format(time.perf_counter() -
+                                                    start))
+    port.close()
+    print('{} bytes, {} records'.format(os.path.getsize(path),
+                                        len(readCapture(path)[1])))
+    for speed in (1, 10, 0):
+        replay = ReplayPort(path, speed=speed)
+        start = time.perf_counter()
+        for n in range(100):
+            replay.write(b'\xae\x00\x00')
+            replay.read(3)
+        print('replayed at speed {} in {:.3f} s, {} mismatches'.format(
+              speed, time.perf_counter() - start, replay.mismatches))
@@ -1,5 +1,5 @@
 #!/usr/bin/env python
-from libs.modelsDict import models, operators, lefts
+from libs.modelsDict import models, operators, lefts, accumulated, slopes
 
 
 class WrongOperatorError(Exception):
@@ -81,8 +81,8 @@ class Condition():
     def __init__(self, model, left, operator, right):
         """Arguments:
             model    ->    (string) PSU model
-            left     ->    (string) variable (I, V)
-            operator ->    (string) >=, <=
+            left     ->    (string) variable (V, I, P, Ah, Wh, dV, dI)
+            operator ->    (string) >=, <= (only <= for Ah and Wh)
             right    ->    (float)  parameter"""
         self.model = model
         self.left = left
@@ -110,6 +110,9 @@ class Condition():
 
     @_dec_check_val(dictionary=operators, error_class=WrongOperatorError)
     def setOperator(self, val):
+        if self.left in accumulated and val != '<=':
+            msg = 'Accumulated {} can only be limited with <='.format(self.left)
+            raise WrongOperatorError(msg)
         self.__dict__['operator'] = val
     operator = property(getOperator, setOperator)
 
@@ -129,6 +132,15 @@ class Condition():
             if val < models[self.model]['Pmin'] or val > models[self.model]['Pmax']:
                 msg = 'Wrong P value: {}'.format(val)
                 raise OffLimitsError(msg)
+        elif self.left in accumulated:
+            if val < models[self.model][self.left + 'min']:
+                msg = 'Wrong {} value: {}'.format(self.left, val)
+                raise OffLimitsError(msg)
+            self.__dict__['right'] = round(val, 4)  # mAh, mWh precision
+            return
+        elif self.left in slopes:
+            self.__dict__['right'] = round(val, 6)  # uV/s, uA/s precision
+            return
         self.__dict__['right'] = round(val, 2)
     right = property(getRight, setRight)
 
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+"""
+PSU device side of the server: VoltcraftPSU, scheduler and the job queue.
+
+DeviceWorker runs them in the server process (default). DeviceProcess runs
+a DeviceWorker in its own process (mainServer.py --io-process), so the
+serial I/O, the scheduler and the update thread never wait for the GIL of
+the busy Pyro4 request threads:
+    - commands (DeviceWorker method calls) go over a Pipe, one at a time
+    - snapshot changes come back over another Pipe into the SnapshotCache
+      of the server (observers, getSnapshot)
+    - samples are appended to the shared-memory ring (telemetryRing.py),
+      readable by any process of the host
+    - the running flag is a multiprocessing.Event shared by both processes
+"""
+import logging
+import multiprocessing
+from collections import deque
+from threading import Thread, Lock
+import libs.voltcraftPSU as voltcraftPSU
+import libs.scheduler as scheduler
+import libs.recorder as recorder
+import libs.condition as condition
+import libs.job as job
+import libs.batchCodec as batchCodec
+import libs.tracing as tracing
+from libs.snapshot import SnapshotCache
+from libs.telemetryRing import TelemetryRing
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceProcessError(Exception):
+    pass
+
+
+class DeviceWorker():
+    """PSU device, its scheduler and the job queue"""
+    def __init__(self, port, jobs, job_stats, running, records='records',
+                 capture=None, snapshots=None):
+        """Arguments:
+            port      -> (string) device name or transport url
+            jobs      -> job.JobQueue object to store batch
+            job_stats -> collections.deque object to store out
+            running   -> threading.Event or multiprocessing.Event object,
+                         scheduler running flag
+            records   -> (string, optional) directory of recorded runs
+            capture   -> (string, optional) capture file of the traffic
+            snapshots -> (snapshot.SnapshotCache, optional) published state"""
+        self.records = records
+        self.jobs = jobs
+        self.job_stats = job_stats
+        self.running = running
+        self.device = voltcraftPSU.VoltcraftPSU(port, capture)
+        self.ID = self.device.getID()
+        self.snapshots = snapshots or SnapshotCache()
+        self.scheduler = scheduler.VoltcraftScheduler(device=self.device,
+                                                      jobs=self.jobs,
+                                                      job_stats=job_stats,
+                                                      running=self.running,
+                                                      snapshots=self.snapshots)
+        self.thrSched = None  # scheduler thread of the last run
+
+    def getID(self):
+        return self.ID
+
+    def manualMode(self):
+        self.device.manualMode()
+
+    def remoteMode(self):
+        self.device.remoteMode()
+
+    def psuOff(self):
+        self.device.psuOff()
+
+    def psuOn(self):
+        self.device.psuOn()
+
+    def manualKey(self):
+        self.device.manualKey()
+
+    def remoteKey(self):
+        self.device.remoteKey()
+
+    def getMinMax(self):
+        return self.scheduler.getMinMax()
+
+    def status(self):
+        return list(self.job_stats)
+
+    def setQueue(self, batch):
+        """replaces the job queue with jobs of the `batch' (see
+        MainServer.setQueue)"""
+        self.jobs.clear()
+        encoded = batchCodec.encodedBytes(batch)
+        if encoded is not None:  # checked at once, jobs built when taken
+            model = str(self.ID)
+            decoded = batchCodec.decodeBatch(encoded, model)
+            self.jobs.extendLazy(len(decoded), lambda index: decoded.job(
+                                 index, self.device, model))
+            logger.debug('#\t\t\t %s encoded jobs', len(decoded))
+            return
+        debug = logger.isEnabledFor(logging.DEBUG)  # getInfo() is not free
+        for j in self._buildJobs(batch):
+            self.jobs.append(j)
+            if debug:
+                logger.debug('#\t\t\t job :%s', j.getInfo())
+
+    def checkQueue(self, batch):
+        """checks jobs of the `batch' (see setQueue) like setQueue does,
+        the job queue is not changed
+
+        Returns:
+            number of jobs"""
+        encoded = batchCodec.encodedBytes(batch)
+        if encoded is not None:
+            return len(batchCodec.decodeBatch(encoded, str(self.ID)))
+        return sum(1 for _ in self._buildJobs(batch))
+
+    def _buildJobs(self, batch):
+        """yields job.Job objects of the legacy `batch'"""
+        for rawJob in batch:
+            what, how_long, *rawConds = rawJob
+            conds = []
+            for rawCond in rawConds:
+                cond = condition.Condition(str(self.ID), rawCond[0],
+                                           rawCond[1], rawCond[2])
+                conds.append(cond)
+            yield job.Job(self.device, what, how_long, conds)
+
+    def setTracing(self, enabled):
+        tracing.enable(enabled)
+
+    def traceEvents(self, clear=False):
+        """returns trace events of the process (see tracing.events)"""
+        traceEvents = tracing.events('psuDevice')
+        if clear:
+            tracing.clear()
+        return traceEvents
+
+    def startScheduler(self, start, frequency):
+        """starts the scheduler thread
+
+        Arguments:
+            start     -> (datetime.datetime) start of the first job
+            frequency -> (float) frequency of the PSU callups"""
+        if self.running.is_set() or (self.thrSched is not None and
+                                     self.thrSched.is_alive()):
+            raise scheduler.SchedulerRunningError('Scheduler is already '
+                                                  'running')
+        self.scheduler.setStart(start)
+        self.scheduler.setFrequency(frequency)
+        self.scheduler._checkScheduler()  # run file only for accepted start
+        self.scheduler.setRecorder(recorder.RunRecorder(self.records,
+                                                        self.ID, start))
+        #  scheduler spans carry the correlation id of the start call
+        self.thrSched = Thread(target=tracing.bind(self.scheduler.run),
+                               name='scheduler', daemon=True)
+        self.thrSched.start()
+
+
+class _ForwardingCache(SnapshotCache):
+    """snapshot cache of the device process, sends changes to the server and
+    samples to the telemetry ring"""
+    def __init__(self, events, ring):
+        SnapshotCache.__init__(self)
+        self.events = events
+        self.ring = ring
+        self._sendLock = Lock()
+
+    def publish(self, **changes):
+        snap = SnapshotCache.publish(self, **changes)
+        with self._sendLock:  # scheduler and update threads
+            if 'time' in changes:
+                self.ring.append(snap.time, snap.V, snap.I, snap.P, snap.job)
+            self.events.send(changes)
+        return snap
+
+
+def _serve(commands, events, running, port, records, capture, ringName,
+           log, metricsPort):
+    """main function of the device process"""
+    if log:
+        from libs.logSetup import setupLogging
+        path, level, structured = log
+        setupLogging(path, (logging.getLogger('libs'),), level=level,
+                     structured=structured)
+    if metricsPort:  # scheduler and PSU metrics live here
+        import libs.metrics as metrics
+        metrics.serve(metricsPort)
+    ring = TelemetryRing(ringName, untrack=False)
+    try:
+        worker = DeviceWorker(port, job.JobQueue(), deque(), running, records,
+                              capture, _ForwardingCache(events, ring))
+    except Exception as error:
+        commands.send((False, error))
+        return
+    commands.send((True, worker.ID))
+    while True:
+        try:
+            name, args, cid = commands.recv()
+        except EOFError:  # server closed
+            break
+        tracing.correlate(cid)  # of the server request
+        try:
+            with tracing.span(name, 'device'):
+                result = getattr(worker, name)(*args)
+            commands.send((True, result))
+        except Exception as error:
+            logger.exception('device process: %s%s', name, args)
+            commands.send((False, error))
+    running.clear()
+
+
+class DeviceProcess():
+    """DeviceWorker in the separate process, calls of its methods are
+    forwarded over the pipe"""
+    def __init__(self, port, running, records='records', capture=None,
+                 ringName='voltlog', ringSize=65536, log=None,
+                 metricsPort=None):
+        """Arguments:
+            port        -> (string) device name or transport url
+            running     -> multiprocessing.Event object (see processEvent)
+            records     -> (string, optional) directory of recorded runs
+            capture     -> (string, optional) capture file of the traffic
+            ringName    -> (string, optional) shared memory name of the
+                           telemetry ring
+            ringSize    -> (int, optional) samples kept in the ring
+            log         -> (tuple, optional) (path, level, structured) log
+                           of the device process (see logSetup.setupLogging)
+            metricsPort -> (int, optional) local HTTP port of the metrics
+                           endpoint of the device process"""
+        self.running = running
+        self.snapshots = SnapshotCache()
+        self.ring = TelemetryRing(ringName, ringSize)
+        self._lock = Lock()
+        self.closed = False
+        self.commands, child = _context.Pipe()
+        events, childEvents = _context.Pipe(duplex=False)
+        self.process = _context.Process(target=_serve, name='psuDevice',
+                                        args=(child, childEvents, running,
+                                              port, records, capture,
+                                              ringName, log, metricsPort),
+                                        daemon=True)
+        self.process.start()
+        child.close()
+        childEvents.close()
+        ok, result = self.commands.recv()
+        if not ok:
+            self.close()
+            raise result
+        self.ID = result
+        self.receiver = Thread(target=self._receive, args=(events,),
+                               name='deviceEvents', daemon=True)
+        self.receiver.start()
+
+    def _receive(self, events):
+        while True:
+            try:
+                changes = events.recv()
+            except EOFError:
+                if not self.closed:
+                    self.process.join(timeout=1)
+                    logger.error('device process finished (exit code %s)',
+                                 self.process.exitcode)
+                self.snapshots.publish(running=False, online=False)
+                return
+            self.snapshots.publish(**changes)
+
+    def call(self, name, *args):
+        """calls DeviceWorker method `name' in the device process"""
+        with tracing.locked(self._lock, 'device'):  # Pyro4 request threads
+            try:
+                with tracing.span('device ' + name, 'device'):
+                    self.commands.send((name, args, tracing.correlation()))
+                    ok, result = self.commands.recv()
+            except (EOFError, OSError) as error:
+                raise DeviceProcessError('Device process is not running: '
+                                         '{}'.format(error))
+        if not ok:
+            raise result
+        return result
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args: self.call(name, *args)
+
+    def close(self):
+        self.closed = True
+        self.commands.close()
+        self.process.join(timeout=5)
+        self.ring.close()
+
+
+#spawned device process: no inherited Pyro4 threads, sockets or log queues
+_context = multiprocessing.get_context('spawn')
+
+
+def processEvent():
+    """returns running flag shared with the DeviceProcess"""
+    return _context.Event()
+
+if __name__ == '__main__':
+    import time
+    import datetime
+    running = processEvent()
+    device = DeviceProcess('sim://12010', running, records='/tmp/records',
+                           ringName='voltlog-demo')
+    print('PSU model {}, limits {}'.format(device.ID, device.getMinMax()))
+    device.setQueue([[('setv', 5.0), 4, ('V', '>=', 4.0)]])
+    device.startScheduler(datetime.datetime.now() +
+                          datetime.timedelta(seconds=1.1), 1)
+    time.sleep(0.5)
+    while running.is_set():
+        time.sleep(0.5)
+    print(device.snapshots.get())
+    print(device.ring.read())
+    device.close()
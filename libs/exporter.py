@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""
+Streaming export of recorded runs (see libs.recorder).
+
+Runs are converted block by block, so memory use does not depend on the
+length of the recording. CSV is produced as text chunks, Parquet (columnar,
+requires optional `pyarrow' package) as binary chunks - one row group per
+block of the run file.
+"""
+import io
+from operator import itemgetter
+from libs.recorder import fields, RunReader
+
+
+class ExportFormatError(Exception):
+    pass
+
+
+class ColumnError(Exception):
+    pass
+
+
+formats = ('csv', 'parquet')
+_csvFields = {'time': '%.3f', 'job': '%d', 'V': '%.2f', 'I': '%.3f',
+              'P': '%.2f'}
+
+
+def checkColumns(columns=None):
+    """validates list of exported columns
+
+    Arguments:
+        columns -> (list of strings, optional) subset of recorder.fields,
+                   all columns if None
+
+    Returns:
+        tuple of column names"""
+    if not columns:
+        return fields
+    for col in columns:
+        if col not in fields:
+            msg = 'Unknown column: {}, should be one of: {}'
+            raise ColumnError(msg.format(col, ', '.join(fields)))
+    return tuple(columns)
+
+
+def isBinary(fmt):
+    """True if chunks of the `fmt' format are bytes, False if strings"""
+    if fmt not in formats:
+        raise ExportFormatError('Unknown export format: {}'.format(fmt))
+    return fmt != 'csv'
+
+
+def iterExport(reader, fmt='csv', start=None, stop=None, columns=None,
+               every=1):
+    """streams chunks of the exported run
+
+    Arguments:
+        reader  -> recorder.RunReader object
+        fmt     -> (string, optional) one of `formats'
+        start   -> (float, optional) slice start, seconds since epoch
+        stop    -> (float, optional) slice end, seconds since epoch
+        columns -> (list of strings, optional) exported columns
+        every   -> (int, optional) decimation, every n-th sample is taken
+
+    Returns:
+        iterator of strings (csv) or bytes (parquet)"""
+    isBinary(fmt)
+    columns = checkColumns(columns)
+    if every < 1:
+        raise ValueError('Decimation must be a positive int: {}'.format(every))
+    blocks = reader.iterRows(start, stop, every)
+    if fmt == 'csv':
+        return _iterCsv(blocks, columns)
+    return _iterParquet(blocks, columns, *_arrow())
+
+
+def iterExportFile(path, *args, **kwargs):
+    """same as iterExport but opens the run file and closes it when
+    the returned iterator is exhausted (or closed)
+
+    Arguments:
+        path -> (string) run file
+        (the rest as for iterExport)
+
+    Returns:
+        iterator of strings (csv) or bytes (parquet)"""
+    reader = RunReader(path)
+    try:
+        chunks = iterExport(reader, *args, **kwargs)
+    except Exception:
+        reader.close()
+        raise
+    return _closing(reader, chunks)
+
+
+def _closing(reader, chunks):
+    with reader:
+        yield from chunks
+
+
+def _iterCsv(blocks, columns):
+    indexes = [fields.index(col) for col in columns]
+    getter = itemgetter(*indexes)  # scalar for one column: still formatable
+    line = ','.join(_csvFields[col] for col in columns) + '\n'
+    yield ','.join(columns) + '\n'
+    for rows in blocks:
+        yield ''.join([line % getter(row) for row in rows])
+
+
+class _ChunkSink(io.RawIOBase):
+    """write-only file object collecting the writer output between drains"""
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _arrow():
+    """imports optional pyarrow modules"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ExportFormatError('Parquet export requires pyarrow package.')
+    return pyarrow, pyarrow.parquet
+
+
+def _iterParquet(blocks, columns, pa, pq):
+    types = {'time': pa.float64(), 'job': pa.int32(), 'V': pa.float32(),
+             'I': pa.float32(), 'P': pa.float32()}
+    schema = pa.schema([(col, types[col]) for col in columns])
+    indexes = [fields.index(col) for col in columns]
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for rows in blocks:
+        cols = list(zip(*rows))
+        table = pa.Table.from_arrays([pa.array(cols[i], type=schema.field(n).type)
+                                      for i, n in zip(indexes, columns)],
+                                     schema=schema)
+        writer.write_table(table)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
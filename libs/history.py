@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Timestamped history of PSU readings for plotting.
+
+Samples are kept in growable typed arrays (8 bytes per value), so a day of
+2 s samples takes about 1 MB. Decimator reduces any time window to at most
+two points (min and max) per pixel column, spikes are never lost. Completed
+columns are cached, every refresh processes new samples only.
+"""
+from array import array
+from bisect import bisect_left
+
+
+class History():
+    def __init__(self, names=('V', 'I', 'P'), limit=2000000):
+        """Arguments:
+            names -> (tuple of strings, optional) names of sampled values
+            limit -> (int, optional) max number of samples, the oldest
+                     quarter is dropped when exceeded"""
+        self.names = names
+        self.limit = limit
+        self.t = array('d')  # seconds since epoch, ascending
+        self.columns = {name: array('d') for name in names}
+        self.generation = 0  # changes when old samples are dropped
+
+    def __len__(self):
+        return len(self.t)
+
+    def append(self, t, *values):
+        """appends sample, `values' ordered as `names'"""
+        for name, value in zip(self.names, values):
+            self.columns[name].append(value)
+        self.t.append(t)  # last: readers use len(self.t)
+        if len(self.t) > self.limit:
+            drop = self.limit // 4
+            del self.t[:drop]
+            for column in self.columns.values():
+                del column[:drop]
+            self.generation += 1
+
+    def clear(self):
+        del self.t[:]
+        for column in self.columns.values():
+            del column[:]
+        self.generation += 1
+
+
+class Decimator():
+    """min/max decimation of one history column to the pixel width"""
+    def __init__(self, history, name):
+        self.history = history
+        self.name = name
+        self.key = None  # (window, columns, generation) of the cache
+
+    def _reset(self, key, left):
+        self.key = key
+        self.xs = array('d')  # decimated points of completed columns
+        self.ys = array('d')
+        self.bucket = 0       # first not completed column
+        self.index = bisect_left(self.history.t, left)  # its first sample
+
+    def points(self, left, right, buckets):
+        """decimates samples from the time window
+
+        Arguments:
+            left, right -> (float) time window, seconds since epoch
+            buckets     -> (int) number of columns (pixel width of the plot)
+
+        Returns:
+            tuple of arrays (times, values)"""
+        t = self.history.t
+        values = self.history.columns[self.name]
+        key = (left, right, buckets, self.history.generation)
+        if key != self.key:
+            self._reset(key, left)
+        width = (right - left) / buckets
+        while self.bucket < buckets:
+            end = left + (self.bucket + 1) * width
+            if not len(t) or t[-1] < end:  # column still gets samples
+                break
+            stop = bisect_left(t, end, self.index)
+            self._emit(self.xs, self.ys, t, values, self.index, stop)
+            self.index = stop
+            self.bucket += 1
+        xs, ys = array('d', self.xs), array('d', self.ys)
+        self._emit(xs, ys, t, values, self.index,
+                   bisect_left(t, right, self.index, len(t)))
+        return xs, ys
+
+    def _emit(self, xs, ys, t, values, start, stop):
+        """appends min and max (in time order) of the samples start:stop"""
+        if stop - start <= 2:
+            xs.extend(t[start:stop])
+            ys.extend(values[start:stop])
+            return
+        segment = values[start:stop]
+        low, high = min(segment), max(segment)
+        first, second = sorted((segment.index(low), segment.index(high)))
+        xs.append(t[start + first])
+        ys.append(segment[first])
+        if second != first:
+            xs.append(t[start + second])
+            ys.append(segment[second])
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Charge (Ah) and energy (Wh) accumulated from timestamped PSU samples.
+
+Samples come at irregular intervals (serial retries, slow device), so every
+interval is integrated with the trapezoidal rule using its own length.
+Updates take O(1) time and memory per sample.
+"""
+
+
+class Integrator():
+    """trapezoidal integral of one sampled value over time"""
+    __slots__ = ('t', 'value', 'total')
+
+    def __init__(self, t=None, value=0.0):
+        """Arguments:
+            t     -> (float, optional) time [s] of the first point, None
+                     starts at the first added sample
+            value -> (float, optional) value at the first point"""
+        self.t = t
+        self.value = value
+        self.total = 0.0  # integral [value * s]
+
+    def add(self, t, value):
+        """adds sample `value' taken at time `t' [s]"""
+        if self.t is not None and t > self.t:
+            self.total += (self.value + value) / 2 * (t - self.t)
+        if self.t is None or t > self.t:
+            self.t, self.value = t, value
+
+    def skip(self, t, value):
+        """continues from sample `value' taken at time `t' [s] without
+        integrating the interval since the previous sample (unknown values)"""
+        self.t, self.value = t, value
+
+
+class ChargeCounter():
+    """accumulated charge and energy of the PSU output"""
+    def __init__(self, t=None, I=0.0, P=0.0):
+        """Arguments:
+            t    -> (float, optional) start time [s], seconds since epoch
+            I, P -> (float, optional) current and power at the start time"""
+        self.charge = Integrator(t, I)
+        self.energy = Integrator(t, P)
+
+    def add(self, t, I, P):
+        """adds sample of current and power taken at time `t' [s]"""
+        self.charge.add(t, I)
+        self.energy.add(t, P)
+
+    def skip(self, t, I, P):
+        """continues from the sample without integrating the gap before it"""
+        self.charge.skip(t, I)
+        self.energy.skip(t, P)
+
+    @property
+    def Ah(self):
+        return self.charge.total / 3600
+
+    @property
+    def Wh(self):
+        return self.energy.total / 3600
+
+    def asDict(self):
+        return {'Ah': self.Ah, 'Wh': self.Wh}
+
+if __name__ == '__main__':
+    import random
+    counter = ChargeCounter()
+    t = 0.0
+    while t < 3600:  # 1 h of 2 A / 10 W with irregular sampling
+        counter.add(t, 2.0, 10.0)
+        t += random.uniform(1, 5)
+    counter.add(3600, 2.0, 10.0)
+    print(counter.asDict())
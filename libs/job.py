@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+from collections import deque
 import libs.condition as condition
 
 
@@ -35,7 +36,8 @@ class Job():
         self.funcs = dict(zip(aliases, (self.psu.setVoltage,
                                         self.psu.setMaxVoltage,
                                         self.psu.setMaxCurrent)))
-        #internal job conditions` dictionary of subsets:
+        #internal job conditions` dictionary of subsets (accumulated Ah and
+        #Wh, slopes dV and dI only if the job has such conditions):
         self.subs = {'V': [], 'I': [], 'P': []}
         #populates subsets according to stop conds lists
         self._pop_subs(self.stop_cond)
@@ -68,16 +70,13 @@ class Job():
             cond_list -> list of condition objects
 
         Returns:"""
-        V, I, P = [], [], []
+        temp_dict = {'V': [], 'I': [], 'P': []}
         for cond in cond_list:  # divide list on local sublists:
-            if cond.left == 'V':
-                V.append(cond)
-            elif cond.left == 'I':
-                I.append(cond)
-            elif cond.left == 'P':
-                P.append(cond)
-
-        temp_dict = {'V': V, 'I': I, 'P': P}
+            if cond.left not in temp_dict:  # accumulated or slope
+                temp_dict.setdefault(cond.left, [])
+                self.subs.setdefault(cond.left, [])
+            temp_dict[cond.left].append(cond)
+
         for ranges in self.subs.items():  # calculate ranges
             if len(temp_dict[ranges[0]]) > 0:  # for nonempty local sublist
                 temp_range = condition.get_list_range(temp_dict[ranges[0]])
@@ -106,6 +105,46 @@ class Job():
         conds = [cond for cond in self.subs.items()]
         return self.psu.model, self.what, self.how_long, conds
 
+class JobQueue():
+    """
+    Scheduler`s input queue (deque-like: append, popleft, clear, len).
+    Jobs of the encoded batches (see batchCodec.py) are built only when the
+    scheduler takes them.
+    """
+    def __init__(self):
+        self.parts = deque()  # Job objects and [batch, next index, build]
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, job):
+        self.parts.append(job)
+        self.size += 1
+
+    def extendLazy(self, count, build):
+        """appends `count' jobs built by the `build(index)' function"""
+        if count:
+            self.parts.append([count, 0, build])
+            self.size += count
+
+    def popleft(self):
+        part = self.parts[0]  # IndexError as deque
+        if isinstance(part, list):
+            count, index, build = part
+            part[1] += 1
+            if part[1] == count:
+                self.parts.popleft()
+            self.size -= 1
+            return build(index)
+        self.parts.popleft()
+        self.size -= 1
+        return part
+
+    def clear(self):
+        self.parts.clear()
+        self.size = 0
+
 if __name__ == '__main__':
     import time
     import voltcraftPSU
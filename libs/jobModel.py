@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+Job list of the scheduler program kept in typed columns.
+
+JobModel is the source of truth of the client job queue: every column is an
+array('d') (8 bytes per value), so a program with 100000 steps takes about
+5 MB. Records in the scheduler batch format are built only on demand (when
+the program is submitted or saved). The model does not depend on tkinter.
+
+A model opened from a binary program file (see programFile.loadJobs) reads
+its rows from the file until the first change, then it is materialized.
+"""
+from array import array
+
+
+class JobModelError(Exception):
+    pass
+
+
+class JobModel():
+    #  column names, the order of append() arguments
+    columns = ('V', 'seconds', 'vExitLeft', 'vExitRight', 'iExitLeft',
+               'iExitRight')
+    #  exit condition of the batch record -> column
+    exits = {('V', '>='): 'vExitLeft', ('V', '<='): 'vExitRight',
+             ('I', '>='): 'iExitLeft', ('I', '<='): 'iExitRight'}
+
+    def __init__(self, records=(), source=None):
+        """Arguments:
+            records -> (iterable, optional) initial batch records
+            source  -> (optional) lazy rows: object with __len__, row(index),
+                       rows() and close() (programFile.ProgramReader)"""
+        self.data = {name: array('d') for name in self.columns}
+        self.source = source
+        self.extend(records)
+
+    def __len__(self):
+        if self.source is not None:
+            return len(self.source)
+        return len(self.data['V'])
+
+    def materialize(self):
+        """loads all rows of the lazy source into the columns"""
+        if self.source is None:
+            return
+        source, self.source = self.source, None
+        with source:
+            for row in source.rows():
+                self.append(*row)
+
+    def append(self, V, seconds, vExitLeft, vExitRight, iExitLeft, iExitRight):
+        """appends `setv' job (all values are converted to floats)"""
+        self.materialize()
+        values = [float(value) for value in (V, seconds, vExitLeft,
+                  vExitRight, iExitLeft, iExitRight)]  # all or nothing
+        for name, value in zip(self.columns, values):
+            self.data[name].append(value)
+
+    def delete(self, index):
+        """removes job with the `index'"""
+        self.materialize()
+        for column in self.data.values():
+            del column[index]
+
+    def clear(self):
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+        for column in self.data.values():
+            del column[:]
+
+    def row(self, index):
+        """returns tuple of column values of the job with the `index'"""
+        if self.source is not None:
+            return self.source.row(index)
+        return tuple(self.data[name][index] for name in self.columns)
+
+    def record(self, index):
+        """returns job with the `index' as the scheduler batch record
+
+        Returns:
+            list -> [what(tuple), how_long(float), ...(tuples)]"""
+        return self._record(self.row(index))
+
+    @staticmethod
+    def _record(row):
+        V, seconds, vLeft, vRight, iLeft, iRight = row
+        return [('setv', V), seconds, ('V', '>=', vLeft), ('V', '<=', vRight),
+                ('I', '>=', iLeft), ('I', '<=', iRight)]
+
+    def rows(self):
+        """yields tuples of column values of all jobs"""
+        if self.source is not None:
+            yield from self.source.rows()  # sequential, faster than row()
+            return
+        for index in range(len(self)):
+            yield self.row(index)
+
+    def records(self):
+        """yields all jobs as the scheduler batch records"""
+        for row in self.rows():
+            yield self._record(row)
+
+    def extend(self, records):
+        """appends jobs from scheduler batch records
+
+        Arguments:
+            records -> iterable of lists [what(tuple), how_long(float),
+                       ...(tuples)] with all four exit conditions"""
+        for record in records:
+            what, seconds, *conditions = record
+            if what[0] != 'setv':
+                raise JobModelError('Unsupported job: {}'.format(what[0]))
+            exits = {}
+            for name, operator, value in conditions:
+                try:
+                    exits[self.exits[(name, operator)]] = value
+                except KeyError:
+                    raise JobModelError('Unsupported exit condition: {}{}'
+                                        .format(name, operator))
+            try:
+                self.append(what[1], seconds, exits['vExitLeft'],
+                            exits['vExitRight'], exits['iExitLeft'],
+                            exits['iExitRight'])
+            except KeyError as er:
+                raise JobModelError('Missing exit condition: {}'.format(er))
+
+if __name__ == '__main__':
+    model = JobModel()
+    for n in range(100000):
+        model.append(1 + n % 150 / 10, 10, 0.1, 20, 0, 10)
+    print(len(model), model.record(len(model) - 1))
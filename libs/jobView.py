@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Virtualized ttk.Treeview of the JobModel.
+
+The treeview holds only as many items as fit in the widget, scrolling just
+rewrites their values, so programs with tens of thousands of steps are
+shown as fast as short ones. Selection is kept as a row index (not as a
+treeview item) and drawn with a tag.
+"""
+import tkinter as tk
+from tkinter import ttk
+
+
+class JobView():
+    """ttk.Treeview with scrollbar showing visible rows of the JobModel"""
+    dataCols = ('activity', 'value', 'how long', 'V exit', 'I exit')
+
+    def __init__(self, parent, model, heads=(), wheel=3):
+        """JobView constructor
+
+        Arguments:
+            parent -> tkinter frame, treeview and scrollbar are gridded in
+                      its (0, 0) and (0, 1) cells
+            model  -> jobModel.JobModel object
+            heads  -> (sequence, optional) tuples of display values of rows
+                      shown above the jobs
+            wheel  -> (int, optional) rows scrolled by one mouse wheel step"""
+        self.model = model
+        self.heads = list(heads)
+        self.wheel = wheel
+        self.offset = 0       # row index of the first visible item
+        self.selected = None  # selected row index (heads first, then jobs)
+        self.tree = ttk.Treeview(parent, columns=self.dataCols,
+                                 show='headings', selectmode='none')
+        self.ysb = ttk.Scrollbar(parent, orient=tk.VERTICAL,
+                                 command=self._yview)
+        for col in self.dataCols:
+            self.tree.heading(col, text=col, anchor='center')
+            self.tree.column(col, stretch=100, width=90, anchor=tk.W)
+        self.tree.tag_configure('selected', background='lightblue')
+        self.tree.grid(row=0, column=0, sticky=tk.NSEW)
+        self.ysb.grid(row=0, column=1, sticky=tk.NS)
+        style = ttk.Style()
+        self.rowheight = int(style.lookup('Treeview', 'rowheight') or 20)
+        self.items = []  # visible treeview items
+        self._setRows(int(self.tree.cget('height')))
+        self.tree.bind('<Configure>', self._resize)
+        self.tree.bind('<Button-1>', self._click)
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.tree.bind(sequence, self._scrollWheel)
+
+    def __len__(self):
+        return len(self.heads) + len(self.model)
+
+    def _setRows(self, rows):
+        """adjusts number of treeview items to `rows'"""
+        while len(self.items) < rows:
+            self.items.append(self.tree.insert('', tk.END))
+        while len(self.items) > rows:
+            self.tree.delete(self.items.pop())
+
+    def _values(self, index):
+        """returns display values of the row `index'"""
+        if index < len(self.heads):
+            return self.heads[index]
+        V, seconds, vLeft, vRight, iLeft, iRight = self.model.row(
+            index - len(self.heads))
+        return ('setv', '{} V'.format(V), '{} s'.format(seconds),
+                '{}>V>{}'.format(vLeft, vRight),
+                '{}>I>{}'.format(iLeft, iRight))
+
+    def refresh(self):
+        """rewrites visible items and the scrollbar, call it after every
+        change of the model or the heads"""
+        total = len(self)
+        rows = len(self.items)
+        self.offset = max(0, min(self.offset, total - rows))
+        if self.selected is not None and self.selected >= total:
+            self.selected = None
+        for row, item in enumerate(self.items):
+            index = self.offset + row
+            if index < total:
+                tags = ('selected',) if index == self.selected else ()
+                self.tree.item(item, values=self._values(index), tags=tags)
+            else:
+                self.tree.item(item, values=(), tags=())
+        if total:
+            self.ysb.set(self.offset / total, min(1, (self.offset + rows) /
+                                                  total))
+        else:
+            self.ysb.set(0, 1)
+
+    def see(self, index):
+        """scrolls the view so the row `index' is visible"""
+        if index < self.offset:
+            self.offset = index
+        elif index >= self.offset + len(self.items):
+            self.offset = index - len(self.items) + 1
+        self.refresh()
+
+    def _yview(self, *args):
+        """scrollbar command handler ('moveto' or 'scroll' arguments)"""
+        if args[0] == 'moveto':
+            self.offset = int(float(args[1]) * len(self))
+        elif args[0] == 'scroll':
+            step = len(self.items) if args[2] == 'pages' else 1
+            self.offset += int(args[1]) * step
+        self.refresh()
+
+    def _scrollWheel(self, event):
+        """mouse wheel handler (MS Windows/OS X delta or X11 buttons)"""
+        up = event.num == 4 or getattr(event, 'delta', 0) > 0
+        self.offset += -self.wheel if up else self.wheel
+        self.refresh()
+        return 'break'
+
+    def _resize(self, event):
+        """keeps as many items as fit into the treeview height"""
+        rows = max(1, (event.height - self.rowheight - 5) // self.rowheight)
+        if rows != len(self.items):
+            self._setRows(rows)
+            self.refresh()
+
+    def _click(self, event):
+        """selects clicked row"""
+        item = self.tree.identify_row(event.y)
+        if item in self.items:
+            index = self.offset + self.items.index(item)
+            self.selected = index if index < len(self) else None
+            self.refresh()
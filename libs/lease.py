@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+"""
+Client leases of the PSU server.
+
+A controlling client (GUI, psuClient.py) acquires a lease and renews it by
+oneway heartbeats (no reply, no waiting). A lease not renewed within its
+ttl expires and the server moves the PSU to the safe state (see
+mainServer.py --safe-state), so a crashed client machine or a dropped
+network can't leave the PSU in the remote mode.
+
+Expiry is found by the hashed timer wheel (one thread, O(1) schedule and
+cancel, no scan of the leases). Heartbeats only move the lease deadline,
+the wheel timer of the lease is re-armed when it fires before the
+deadline, so a renewal costs a time stamp. The safe state is entered at
+most ttl + tick after the last heartbeat.
+"""
+import math
+import time
+import uuid
+import logging
+import itertools
+from threading import Thread, Condition, Lock
+
+logger = logging.getLogger(__name__)
+
+MIN_TTL = 1.0    # [s] shortest lease
+MAX_TTL = 300.0  # [s] longest lease
+
+
+class LeaseError(Exception):
+    pass
+
+
+class TimerWheel():
+    """hashed timer wheel: `slots' buckets of `tick' seconds, timers beyond
+    one turn wait for their rounds in the bucket"""
+    def __init__(self, tick=0.1, slots=512):
+        """Arguments:
+            tick  -> (float, optional) resolution of the timers [s]
+            slots -> (int, optional) number of buckets (one turn)"""
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]  # handle: [rounds, callback]
+        self.where = {}  # handle: slot index
+        self.position = 0  # index of the last expired slot
+        self.stopped = False
+        self._ids = itertools.count(1)
+        self._cond = Condition()
+        self.thread = Thread(target=self._run, name='timerWheel', daemon=True)
+        self.thread.start()
+
+    def __len__(self):
+        return len(self.where)
+
+    def schedule(self, delay, callback):
+        """calls callback() on the wheel thread after `delay' seconds (at
+        most one tick later)
+
+        Returns:
+            handle of the timer (see cancel)"""
+        ticks = max(1, math.ceil(delay / self.tick))
+        with self._cond:
+            handle = next(self._ids)
+            index = (self.position + ticks) % len(self.slots)
+            self.slots[index][handle] = [(ticks - 1) // len(self.slots),
+                                         callback]
+            self.where[handle] = index
+            if len(self.where) == 1:
+                self._cond.notify()  # wheel was idle
+        return handle
+
+    def cancel(self, handle):
+        """removes the timer, returns False if it has already fired"""
+        with self._cond:
+            index = self.where.pop(handle, None)
+            if index is None:
+                return False
+            del self.slots[index][handle]
+            return True
+
+    def _expired(self):
+        """advances the wheel by one slot, returns due callbacks"""
+        self.position = (self.position + 1) % len(self.slots)
+        slot = self.slots[self.position]
+        due = []
+        for handle, timer in list(slot.items()):
+            if timer[0]:
+                timer[0] -= 1  # next turn
+                continue
+            del slot[handle]
+            del self.where[handle]
+            due.append(timer[1])
+        return due
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self.where and not self.stopped:
+                    self._cond.wait()  # no timers, no ticks
+                if self.stopped:
+                    return
+                next_ = time.monotonic() + self.tick
+            while True:  # ticks until the wheel is empty
+                delay = next_ - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                with self._cond:
+                    if self.stopped:
+                        return
+                    due = self._expired()
+                    idle = not self.where
+                for callback in due:
+                    try:
+                        callback()
+                    except Exception:
+                        logger.exception('timer callback failed')
+                if idle:
+                    break
+                next_ += self.tick
+
+    def close(self):
+        with self._cond:
+            self.stopped = True
+            self._cond.notify()
+        self.thread.join(timeout=1)
+
+
+class Lease():
+    def __init__(self, client, ttl):
+        self.id = uuid.uuid4().hex
+        self.client = client
+        self.ttl = ttl
+        self.deadline = time.monotonic() + ttl
+        self.timer = None  # handle of the wheel timer
+
+
+class LeaseManager():
+    """leases of the clients, calls onExpire(lease) on the wheel thread when
+    a lease was not renewed in time"""
+    def __init__(self, onExpire, ttl=10.0, wheel=None):
+        """Arguments:
+            onExpire -> callable(Lease), moves the PSU to the safe state
+            ttl      -> (float, optional) default lease time [s]
+            wheel    -> (TimerWheel, optional) shared timer wheel"""
+        self.onExpire = onExpire
+        self.ttl = ttl
+        self.wheel = wheel or TimerWheel()
+        self.leases = {}  # id: Lease
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self.leases)
+
+    def acquire(self, client='', ttl=None):
+        """grants new lease
+
+        Arguments:
+            client -> (string, optional) name of the client (log)
+            ttl    -> (float, optional) requested lease time [s], limited by
+                      MIN_TTL and MAX_TTL (default self.ttl)
+
+        Returns:
+            Lease object"""
+        ttl = self.ttl if ttl is None else float(ttl)
+        if not ttl == ttl:  # NaN
+            raise LeaseError('Wrong lease time: {}'.format(ttl))
+        lease = Lease(client, min(max(ttl, MIN_TTL), MAX_TTL))
+        with self._lock:
+            self.leases[lease.id] = lease
+            lease.timer = self.wheel.schedule(lease.ttl,
+                                              lambda: self._fired(lease))
+        logger.info('lease %s granted to %s (%.1f s)', lease.id, client,
+                    lease.ttl)
+        return lease
+
+    def renew(self, leaseId):
+        """moves the lease deadline (heartbeat), returns False for unknown
+        (expired or released) lease"""
+        lease = self.leases.get(leaseId)
+        if lease is None:
+            return False
+        lease.deadline = time.monotonic() + lease.ttl
+        return True
+
+    def remaining(self, leaseId):
+        """returns seconds left of the lease or None for unknown lease"""
+        lease = self.leases.get(leaseId)
+        if lease is None:
+            return None
+        return max(lease.deadline - time.monotonic(), 0.0)
+
+    def release(self, leaseId):
+        """ends the lease without the safe state, returns False for unknown
+        lease"""
+        with self._lock:
+            lease = self.leases.pop(leaseId, None)
+            if lease is None:
+                return False
+            self.wheel.cancel(lease.timer)
+        logger.info('lease %s of %s released', lease.id, lease.client)
+        return True
+
+    def _fired(self, lease):
+        """wheel timer of the lease (wheel thread)"""
+        with self._lock:
+            if self.leases.get(lease.id) is not lease:
+                return  # released meanwhile
+            left = lease.deadline - time.monotonic()
+            if left > 0:  # renewed, wait for the new deadline
+                lease.timer = self.wheel.schedule(left,
+                                                  lambda: self._fired(lease))
+                return
+            del self.leases[lease.id]
+        logger.warning('lease %s of %s expired %.2f s after the deadline',
+                       lease.id, lease.client, -left)
+        self.onExpire(lease)
+
+    def close(self):
+        with self._lock:
+            for lease in self.leases.values():
+                self.wheel.cancel(lease.timer)
+            self.leases.clear()
+        self.wheel.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    started = time.monotonic()
+    manager = LeaseManager(lambda lease: print('{} expired after {:.2f} s'.
+                           format(lease.client, time.monotonic() - started)),
+                           ttl=1.0)
+    kept = manager.acquire('kept')
+    manager.acquire('dropped')
+    for _ in range(15):  # kept alive for 3 s
+        time.sleep(0.2)
+        manager.renew(kept.id)
+    time.sleep(1.5)
+    print('{} leases left'.format(len(manager)))
+    manager.close()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Non-blocking logging pipeline.
+
+Loggers get a QueueHandler which only puts the (unformatted) record into a
+bounded in-memory queue, a QueueListener thread formats the records and
+writes them to the rotating log file. Records are dropped (and counted)
+rather than blocking the caller when the writer falls behind a slow disk.
+Use lazy `%'-style arguments: logger.debug('job: %s', job) - disabled
+levels cost nothing and a message with scalar arguments (str, numbers) is
+built by the writer thread only. A record is snapshotted before it is
+queued: a message with other arguments (objects, lists ...) is built on the
+caller`s thread (it shows their state at the call time) and an exception
+is formatted to text (no traceback frames kept alive by the queue).
+"""
+import os
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+import libs.metrics as metrics
+
+
+FORMAT = '{message}\t\t{asctime} {levelname}'
+
+droppedRecords = metrics.counter('log_records_dropped_total',
+                                 'Log records dropped on a full log queue')
+_scalars = (str, bytes, int, float, bool, type(None))  # immutable arguments
+_formatter = logging.Formatter()
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """queue handler which never blocks on the caller`s thread, formats only
+    what can change before the listener thread writes the record"""
+    def prepare(self, record):
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _formatter.formatException(record.exc_info)
+            record.exc_info = None  # releases the traceback frames
+        args = record.args
+        if args and (isinstance(args, dict) or
+                     not all(isinstance(arg, _scalars) for arg in args)):
+            record.msg = record.getMessage()  # state at the call time
+            record.args = None
+        return record  # scalar arguments are formatted by the listener
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            droppedRecords.inc()
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """queue listener whose stop (at exit) never blocks on the full queue"""
+    def enqueue_sentinel(self):
+        while True:
+            try:
+                self.queue.put(self._sentinel, timeout=1.0)  # thread drains
+                return
+            except queue.Full:  # listener stuck, drop the oldest record
+                try:
+                    self.queue.get_nowait()
+                    droppedRecords.inc()
+                except queue.Empty:
+                    pass
+
+
+class JsonFormatter(logging.Formatter):
+    """formats records as JSON lines"""
+    def format(self, record):
+        entry = {'time': record.created, 'level': record.levelname,
+                 'logger': record.name, 'thread': record.threadName,
+                 'function': record.funcName, 'message': record.getMessage()}
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:  # formatted by DroppingQueueHandler
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def setupLogging(path, loggers, level=logging.DEBUG, structured=False,
+                 maxBytes=10 * 2 ** 20, backupCount=5, queueSize=100000):
+    """attaches background writer of the rotating log file to the loggers
+
+    Arguments:
+        path        -> (string) log file (directory is created if needed)
+        loggers     -> list of logging.Logger objects
+        level       -> (int, optional) logging level of the loggers
+        structured  -> (boolean, optional) JSON lines instead of plain text
+        maxBytes    -> (int, optional) log file size triggering rotation
+        backupCount -> (int, optional) number of rotated files kept
+        queueSize   -> (int, optional) max number of records waiting
+
+    Returns:
+        logging.handlers.QueueListener object (already started)"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    fileHandler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=maxBytes, backupCount=backupCount)
+    if structured:
+        fileHandler.setFormatter(JsonFormatter())
+    else:
+        fileHandler.setFormatter(logging.Formatter(FORMAT, style='{'))
+    records = queue.Queue(maxsize=queueSize)
+    queueHandler = DroppingQueueHandler(records)
+    for logger in loggers:
+        logger.setLevel(level)
+        logger.addHandler(queueHandler)
+    listener = DrainingQueueListener(records, fileHandler)
+    listener.start()
+    atexit.register(listener.stop)  # flushes waiting records
+    return listener
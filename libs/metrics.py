@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+"""
+Lightweight process metrics served in the Prometheus text format.
+
+Metrics are created once (at import or construction time) and updated in
+place: counters add to an attribute, histograms increment a preallocated
+bucket list, so recording a sample allocates nothing. Updates are not
+locked - a rare lost increment under thread contention is accepted in
+exchange for leaving the metrics always on.
+"""
+import time
+import functools
+from bisect import bisect_left
+from threading import Thread
+
+
+#default histogram buckets in seconds: serial frames at 2400 bd take ~10 ms
+LATENCY = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0)
+
+registry = {}  # metric name -> metric (or family) object
+
+
+class MetricNameError(Exception):
+    pass
+
+
+def _labelString(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, v) for k, v in labels) + '}'
+
+
+class Counter():
+    """monotonically increasing value"""
+    kind = 'counter'
+
+    def __init__(self, labels=()):
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name):
+        yield name + _labelString(self.labels), self.value
+
+
+class Gauge():
+    """actual value, set directly or computed by `function' when scraped"""
+    kind = 'gauge'
+
+    def __init__(self, labels=(), function=None):
+        self.labels = labels
+        self.function = function
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name):
+        value = self.function() if self.function else self.value
+        yield name + _labelString(self.labels), value
+
+
+class Histogram():
+    """distribution of observed values in fixed buckets"""
+    kind = 'histogram'
+
+    def __init__(self, labels=(), bounds=LATENCY):
+        self.labels = labels
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name):
+        cumulative = 0
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            cumulative += count
+            labels = self.labels + (('le', bound),)
+            yield name + '_bucket' + _labelString(labels), cumulative
+        yield name + '_sum' + _labelString(self.labels), self.sum
+        yield name + '_count' + _labelString(self.labels), self.count
+
+
+class Family():
+    """set of metrics of the same kind distinguished by one label"""
+    def __init__(self, metricClass, label, **options):
+        self.metricClass = metricClass
+        self.kind = metricClass.kind
+        self.label = label
+        self.options = options
+        self.children = {}
+
+    def labels(self, value):
+        """returns (created if needed) metric for the label `value',
+        keep the result instead of calling this for every sample"""
+        child = self.children.get(value)
+        if child is None:
+            child = self.metricClass(((self.label, value),), **self.options)
+            self.children[value] = child
+        return child
+
+    def samples(self, name):
+        for child in list(self.children.values()):
+            yield from child.samples(name)
+
+
+def _register(name, helpText, metric):
+    old = registry.get(name)
+    if old is not None:
+        if old.kind != metric.kind:
+            raise MetricNameError('Metric {} already registered as {}'.format(
+                                  name, old.kind))
+        return old  # modules reloaded or several servers in one process
+    metric.help = helpText
+    registry[name] = metric
+    return metric
+
+
+def counter(name, helpText, label=None):
+    """creates (and registers) counter or family of counters"""
+    metric = Family(Counter, label) if label else Counter()
+    return _register(name, helpText, metric)
+
+
+def gauge(name, helpText, function=None):
+    """creates (and registers) gauge, `function' is called when scraped"""
+    metric = _register(name, helpText, Gauge(function=function))
+    metric.function = function or metric.function  # latest owner wins
+    return metric
+
+
+def histogram(name, helpText, label=None, bounds=LATENCY):
+    """creates (and registers) histogram or family of histograms"""
+    if label:
+        metric = Family(Histogram, label, bounds=bounds)
+    else:
+        metric = Histogram(bounds=bounds)
+    return _register(name, helpText, metric)
+
+
+def render():
+    """returns all registered metrics in the Prometheus text format"""
+    lines = []
+    for name, metric in sorted(registry.items()):
+        lines.append('# HELP {} {}'.format(name, metric.help))
+        lines.append('# TYPE {} {}'.format(name, metric.kind))
+        for sample, value in metric.samples(name):
+            lines.append('{} {}'.format(sample, value))
+    return '\n'.join(lines) + '\n'
+
+
+def instrument(family):
+    """class decorator, times every public method of the class in the
+    histogram `family' labelled with the method name (histogram count is
+    the number of calls)"""
+    def decorator(cls):
+        for name, method in list(vars(cls).items()):
+            if name.startswith('_') or not callable(method):
+                continue
+            setattr(cls, name, _timed(method, family.labels(name)))
+        return cls
+    return decorator
+
+
+def _timed(method, hist):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            hist.observe(time.perf_counter() - start)
+    return wrapper
+
+
+def serve(port, host='127.0.0.1'):
+    """serves registered metrics (GET /metrics) in a daemon thread
+
+    Arguments:
+        port -> (int) TCP port of the HTTP endpoint
+        host -> (string, optional) interface, local only by default
+
+    Returns:
+        http.server.HTTPServer object"""
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):  # keeps server log clean
+            pass
+
+    server = HTTPServer((host, port), Handler)
+    Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
@@ -17,6 +17,10 @@ Dictionary items structure:
         `Vmax' -> (float) max voltage
         `Imax' -> (float) max current
         `init' -> (bytestring) model id transmited by the  PSU
+        `Ahmin', `Ahmax', `Whmin', `Whmax' -> (float) ranges of accumulated
+                 charge and energy of the job (no device limits)
+        `dVmin', `dVmax', `dImin', `dImax' -> (float) ranges of dV/dt [V/s]
+                 and dI/dt [A/s] (no device limits)
         INFO: multipliers are derived from the formula :
               (element 1)*maxV * (element 2)*maxI = 200W
 """
@@ -30,6 +34,12 @@ models = {'1405': {'Vmul': 1.0, 'Imul': 1.0, 'Vmin': 0.1, 'Imin': 0.0,
           '1803': {'Vmul': 0.5, 'Imul': 2.0, 'Vmin': 0.1, 'Imin': 0.0,
                    'Vmax': 80.0, 'Imax': 2.5, 'Pmin': 0.0, 'Pmax': 200.0,
                    'init': b'\xb2\x03'}}
+for _model in models.values():
+    _model.update({'Ahmin': 0.0, 'Ahmax': float('inf'),
+                   'Whmin': 0.0, 'Whmax': float('inf'),
+                   'dVmin': -float('inf'), 'dVmax': float('inf'),
+                   'dImin': -float('inf'), 'dImax': float('inf')})
+del _model
 
 #commands for voltcraft data frames
 commands = {'set_voltage': b'\xaa',
@@ -56,7 +66,24 @@ operators = {'>=', '<='}
 
 #voltcraft PSUs job variable name set
 #variables: left hand operands
-lefts = {'V', 'I', 'P'}
+lefts = {'V', 'I', 'P', 'Ah', 'Wh', 'dV', 'dI'}
+
+#variables accumulated since the job start (charge and energy),
+#they only grow so only `<=' (stop when exceeded) makes sense
+accumulated = {'Ah', 'Wh'}
+
+#slopes (dV/dt [V/s], dI/dt [A/s]) of the sampled variables, least-squares
+#fit over the last `slopeWindow' seconds of the job (see slope.RollingSlope),
+#conditions on them are not checked until the job lasts that long
+slopes = {'dV': 'V', 'dI': 'I'}
+slopeWindow = 60.0
+#samples in the slope window at least (jobs with dV, dI conditions are
+#sampled every slopeWindow / slopeSamples seconds or faster)
+slopeSamples = 60
+
+#resolution of the readings (voltcraftPSU and scheduler round them to
+#2 decimal places), rounded reading crosses a bound up to that much earlier
+resolutions = {'V': 0.01, 'I': 0.01, 'P': 0.01}
 
 #job statuses:
 statuses = {'p': 'pending', 'e': 'error', 'w': 'waiting',
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""
+PSU serial port on a serial-over-TCP terminal server.
+
+    socket://<host>:<port>[?options]  -> raw TCP (terminal server in the raw
+                                         mode), TCP_NODELAY
+    rfc2217://<host>:<port>[?options] -> RFC 2217 (telnet COM port control,
+                                         pyserial), TCP_NODELAY
+    options: backoff -> longest delay [s] between reconnect attempts
+
+NetPort keeps one persistent connection. When it breaks, the read in
+progress returns nothing (VoltcraftPSU repeats the query) and the port
+reconnects with exponential backoff (from 0.05 s up to `backoff'). Writes
+are sent again after an immediate reconnect or kept (last `pending') and
+sent first on the new connection, so setpoints of the outage are not lost
+(of the queries only the last one is kept, earlier answers would be taken
+for the answer to the last query). Reconnects and their time (from the loss to the new
+connection) are counted in the metrics.
+
+Input is drained before every write instead of in flushInput: VoltcraftPSU
+flushes the input before every read too, which would drop a response that
+already came over the network (it is still on the wire of a local port).
+Local stand-in of a terminal server: `python -m libs.simulator -p 7000'.
+"""
+import time
+import socket
+import logging
+from collections import deque
+from libs.modelsDict import commands
+import libs.metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+reconnects = metrics.counter('psu_transport_reconnects_total',
+                             'Connections to the PSU terminal server '
+                             'reestablished')
+reconnectTime = metrics.histogram('psu_transport_reconnect_seconds',
+                                  'Time from the connection loss to the '
+                                  'new connection',
+                                  bounds=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0,
+                                          2.0, 5.0, 10.0, 30.0, 60.0))
+_queries = (commands['get_voltage'], commands['get_current'])
+
+
+class _SocketLink():
+    """raw TCP connection with pyserial-like read semantics"""
+    def __init__(self, host, port, timeout):
+        self.timeout = timeout
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = b''
+
+    def read(self, size=1):
+        """returns `size' bytes or less after the timeout"""
+        deadline = time.monotonic() + self.timeout
+        while len(self.buffer) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.sock.settimeout(remaining)
+            try:
+                data = self.sock.recv(4096)
+            except socket.timeout:
+                break
+            if not data:
+                raise ConnectionError('connection closed by the server')
+            self.buffer += data
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def write(self, data):
+        self.sock.sendall(data)
+        return len(data)
+
+    def reset_input_buffer(self):
+        self.buffer = b''
+        self.sock.setblocking(False)
+        try:
+            while True:
+                data = self.sock.recv(4096)
+                if not data:
+                    raise ConnectionError('connection closed by the server')
+        except BlockingIOError:
+            pass
+        finally:
+            self.sock.settimeout(self.timeout)
+
+    def close(self):
+        self.sock.close()
+
+
+class NetPort():
+    """persistent, reconnecting connection to the serial device server"""
+    def __init__(self, url, timeout=0.5, backoff=2.0, pending=16):
+        """Arguments:
+            url     -> (urllib.parse.SplitResult) socket:// or rfc2217:// url
+            timeout -> (float, optional) read timeout [s]
+            backoff -> (float, optional) longest delay [s] between reconnect
+                       attempts
+            pending -> (int, optional) writes kept while disconnected"""
+        if url.scheme not in ('socket', 'rfc2217'):
+            raise ValueError('Unknown network port: {}'.format(url.geturl()))
+        self.url = url
+        self.timeout = timeout
+        self.backoff = backoff
+        self.delay = 0.0     # delay of the next reconnect attempt
+        self.retryAt = 0.0   # monotonic time of the next attempt
+        self.lostAt = None   # monotonic time of the connection loss
+        self.reconnects = 0
+        self.unsent = deque(maxlen=pending)  # writes of the outage
+        self.link = self._connect()  # first connection must succeed
+
+    def _connect(self):
+        if self.url.scheme == 'socket':
+            return _SocketLink(self.url.hostname, self.url.port,
+                               self.timeout)
+        import serial.rfc2217  # sets TCP_NODELAY
+        url = self.url._replace(query='').geturl()
+        return serial.rfc2217.Serial(url, baudrate=2400, timeout=self.timeout)
+
+    def _link(self):
+        """returns connection, reconnects if it is due, None if it failed"""
+        if self.link is not None:
+            return self.link
+        wait = self.retryAt - time.monotonic()
+        if wait > 0:
+            time.sleep(min(wait, self.timeout))
+            if self.retryAt > time.monotonic():
+                return None
+        try:
+            self.link = self._connect()
+            while self.unsent:
+                self.link.write(self.unsent[0])
+                self.unsent.popleft()
+        except OSError as error:
+            if self.link is not None:
+                self.link.close()
+                self.link = None
+            self.delay = min(max(self.delay * 2, 0.05), self.backoff)
+            self.retryAt = time.monotonic() + self.delay
+            logger.debug('reconnect to %s failed: %s', self.url.netloc, error)
+            return None
+        elapsed = time.monotonic() - self.lostAt
+        self.reconnects += 1
+        reconnects.inc()
+        reconnectTime.observe(elapsed)
+        logger.info('reconnected to %s after %.3f s', self.url.netloc, elapsed)
+        self.delay = 0.0
+        self.lostAt = None
+        return self.link
+
+    def _lost(self, error):
+        logger.warning('connection to %s lost: %s', self.url.netloc, error)
+        try:
+            self.link.close()
+        except OSError:
+            pass
+        self.link = None
+        self.lostAt = time.monotonic()
+        self.retryAt = self.lostAt  # first attempt right away
+
+    def read(self, size=1):
+        link = self._link()
+        if link is None:
+            return b''
+        try:
+            return link.read(size)
+        except OSError as error:  # includes serial.SerialException
+            self._lost(error)
+            return b''
+
+    def write(self, data):
+        data = bytes(data)
+        for attempt in range(2):  # once again after reconnect
+            link = self._link()
+            if link is None:
+                break
+            try:
+                link.reset_input_buffer()  # stale responses and ID frames
+                return link.write(data)
+            except OSError as error:
+                self._lost(error)
+        if data[:1] in _queries:  # only the last query is waiting for answer
+            for unsent in [unsent for unsent in self.unsent
+                           if unsent[:1] in _queries]:
+                self.unsent.remove(unsent)
+        self.unsent.append(data)
+        return len(data)
+
+    def flushInput(self):
+        pass  # see module docs
+
+    def flushOutput(self):
+        pass
+
+    def close(self):
+        if self.link is not None:
+            self.link.close()
+            self.link = None
@@ -4,74 +4,176 @@ mpl.use('TkAgg')
 #from matplotlib import pyplot as plt  # DONT USE IT WITH TKINTER!!!!!!!!!!!!!!
 from matplotlib.figure import Figure  # USE THIS INSTEAD!!!!!!!!!!!!!
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg as tkCanvas
+from matplotlib.ticker import FuncFormatter
+from libs.history import Decimator
+import time
 
 
 class PlotFrame():
     """tkinter frame with embeded matplotlib real-time suplot object"""
-    def __init__(self, root, VQueue, IQueue, delay, color):
+    def __init__(self, root, history, delay, color, window=600):
         """PlotFrame constructor
 
         Arguments:
             root      -> tkinter root frame
-            VQueue    -> deque object with 50 samples of fresh V data from PSU
-            IQueue    -> deque object with 50 samples of fresh I data from PSU
+            history   -> history.History object with V, I and P data from PSU
             delay     -> int(miliseconds) refresh delay
-            color     -> background color"""
+            color     -> background color
+            window    -> (float, optional) plotted time window [s]
+
+        INFO: only V, I and P lines are redrawn every `delay' (blitting), the
+              rest of the figure is cached as a background bitmap which is
+              rebuilt when x or y limits (or the window size) change, the x
+              axis runs ahead of the data by `lead' part of the window"""
         self.root = root
         self.delay = delay
         self.color = color
-        self.tData = range(50)             # x axis for both V and I
-        self.VQueue = VQueue               # internal queue of V values to plot
-        self.IQueue = IQueue               # internal queue of I values to plot
+        self.history = history             # V, I, P samples with timestamps
+        self.window = window
+        self.lead = 0.1
+        self.decimV = Decimator(history, 'V')  # min/max per pixel column
+        self.decimI = Decimator(history, 'I')
+        self.decimP = Decimator(history, 'P')
         #  DONT USE PYPLOT WITK TKAGG CANVAS!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
         #self.fig = plt.figure(figsize=(5, 1.7))
         #  USE NATIVE matplotlib.figure.Figure() INSTEAD!!!!!!!!!!!!!!!!!!!!!!!
         self.fig = Figure(figsize=(5, 1.2), facecolor=self.color,
                           edgecolor=self.color, frameon=False, linewidth=0.00)
-        self.fig.subplots_adjust(left=0.15, right=0.85)  # important
+        self.fig.subplots_adjust(left=0.12, right=0.78)  # important
         self.canvas = tkCanvas(self.fig, master=self.root)
         self.axesV = self.fig.add_subplot(1, 1, 1)        # left y ax is V
         self.axesI = self.axesV.twinx()                   # right y ax is I
+        self.axesP = self.axesV.twinx()                   # outer right is P
+        self.axesP.spines['right'].set_position(('axes', 1.15))
         self.labelsV = self.axesV.set_ylim([0, 20])
         self.labelsI = self.axesI.set_ylim([0, 10])
+        self.labelsP = self.axesP.set_ylim([0, 200])
         self.axesV.set_ylabel('voltage [V]', color='g', size='small')
         self.axesI.set_ylabel('current [A]', color='r', size='small')
+        self.axesP.set_ylabel('power [W]', color='b', size='small')
         self.axesV.tick_params(axis='y', colors='g')
         self.axesI.tick_params(axis='y', colors='r')
+        self.axesP.tick_params(axis='y', colors='b', labelsize='small')
         self.axesV.spines['left'].set_color('g')
-        self.axesV.spines['right'].set_color('r')
-        self.lineV, = self.axesV.plot(self.tData, self.VQueue, 'g-',
-                                      label='V', linewidth=2)
-        self.lineI, = self.axesI.plot(self.tData, self.IQueue, 'r-',
-                                      label='I', linewidth=2)
-        lines = self.lineV, self.lineI
+        self.axesI.spines['right'].set_color('r')
+        self.axesP.spines['right'].set_color('b')
+        self.axesV.xaxis.set_major_formatter(FuncFormatter(self._timeLabel))
+        self.axesV.tick_params(axis='x', labelsize='small')
+        self.lineV, = self.axesV.plot([], [], 'g-', label='V', linewidth=2,
+                                      animated=True)
+        self.lineI, = self.axesI.plot([], [], 'r-', label='I', linewidth=2,
+                                      animated=True)
+        self.lineP, = self.axesP.plot([], [], 'b-', label='P', linewidth=1,
+                                      animated=True)
+        lines = self.lineV, self.lineI, self.lineP
         labels = [line.get_label() for line in lines]
         self.axesV.legend(lines, labels, loc=2, fontsize='small',
                           frameon=False, framealpha=0.5)  # stackoverflow trick
         self.canvas.get_tk_widget().grid()
+        self.background = None  # cached figure without V, I, P lines
+        self.shrink = 3  # limits hysteresis: shrink if 3 x wider than data
+        self.canvas.mpl_connect('draw_event', self._onDraw)
+
+    def _onDraw(self, event):
+        """caches background after every full redraw (also after resize)"""
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._drawLines()
+
+    def _drawLines(self):
+        self.axesV.draw_artist(self.lineV)
+        self.axesI.draw_artist(self.lineI)
+        self.axesP.draw_artist(self.lineP)
 
     def plot(self):
-        """draws V and I plot on the tkinter canvas
+        """draws V, I and P plot on the tkinter canvas
 
         Arguments:
 
         Rreturns:
             "after" job ID which can be intercept for cancel thread"""
-        self.axesV.set_ylim(self._setLimits(self.VQueue))
-        self.axesI.set_ylim(self._setLimits(self.IQueue))
-        self.lineV.set_ydata(self.VQueue)
-        self.lineI.set_ydata(self.IQueue)
-        self.canvas.draw()
-        self.root.after(self.delay, self.plot)
-
-    def _setLimits(self, dequeObj):
+        limitsX = self._newTimeLimits()
+        if limitsX:
+            self.axesV.set_xlim(limitsX)
+        left, right = self.axesV.get_xlim()
+        columns = max(1, int(self.axesV.bbox.width))  # pixels
+        self.lineV.set_data(*self.decimV.points(left, right, columns))
+        self.lineI.set_data(*self.decimI.points(left, right, columns))
+        self.lineP.set_data(*self.decimP.points(left, right, columns))
+        limitsV = self._newLimits(self.axesV, self.lineV.get_ydata())
+        limitsI = self._newLimits(self.axesI, self.lineI.get_ydata())
+        limitsP = self._newLimits(self.axesP, self.lineP.get_ydata())
+        if (limitsX or limitsV or limitsI or limitsP or
+                self.background is None):
+            if limitsV:
+                self.axesV.set_ylim(limitsV)
+            if limitsI:
+                self.axesI.set_ylim(limitsI)
+            if limitsP:
+                self.axesP.set_ylim(limitsP)
+            self.canvas.draw()  # full redraw, _onDraw draws the lines
+        else:
+            self.canvas.restore_region(self.background)
+            self._drawLines()
+            self.canvas.blit(self.fig.bbox)
+        return self.root.after(self.delay, self.plot)
+
+    def setWindow(self, window):
+        """changes plotted time window
+
+        Arguments:
+            window -> (float) seconds
+
+        Returns:"""
+        self.window = window
+        self.background = None  # x limits are recalculated by next plot()
+
+    def _newTimeLimits(self):
+        """checks if x limits must move (the newest sample reached the right
+        edge or the window changed)
+
+        Returns:
+            list [left, right] of new limits or None if current ones fit"""
+        t = self.history.t
+        now = t[-1] if len(t) else time.time()
+        left, right = self.axesV.get_xlim()
+        span = self.window * (1 + self.lead)
+        if now < right and abs(right - left - span) < 1e-6 * span:
+            return None
+        right = now + self.window * self.lead
+        return [right - span, right]
+
+    def _timeLabel(self, x, pos=None):
+        """formats seconds since epoch for the x axis ticks"""
+        form = '%H:%M:%S' if self.window <= 86400 else '%d.%m %H:%M'
+        return time.strftime(form, time.localtime(x))
+
+    def _newLimits(self, axes, values):
+        """checks if y limits of the axes must change (with hysteresis)
+
+        Arguments:
+            axes     -> matplotlib axes object
+            values   -> sequence of plotted values
+
+        Returns:
+            list [min, max] of new limits or None if current ones fit"""
+        if not len(values):
+            return None
+        low, high = axes.get_ylim()
+        limits = self._setLimits(values)
+        if min(values) < low or max(values) > high:  # out of view
+            return limits
+        if high - low > self.shrink * (limits[1] - limits[0]):  # too wide
+            return limits
+        return None
+
+    def _setLimits(self, values):
         """sets y range limits for self.plotObj
 
         Arguments:
-            dequeObj -> collection.deque object populated with values
+            values -> sequence of plotted values
 
         Returns:
             list [min, max] values (with offsets) of the argument"""
-        mi = min(dequeObj)
-        ma = max(dequeObj) + 0.1  # prevents overlaping min and max boundiaries
+        mi = min(values)
+        ma = max(values) + 0.1  # prevents overlaping min and max boundiaries
         return [mi - (0.1 * mi), ma + (0.1 * ma)]
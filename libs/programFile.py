@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+"""
+Job program files (replacement of the pickled .sav files).
+
+Two variants of the same versioned format are supported, both written and
+read in a streaming way (the whole program never has to be in memory):
+
+Text program (.vlp), human readable, one job per line:
+    #voltlog-program 1
+    #steps 0000000002
+    #sha256 <64 hex digits>
+    #columns V seconds vExitLeft vExitRight iExitLeft iExitRight
+    5.0 10.0 0.1 20.0 0.0 10.0
+    7.5 60.0 0.1 20.0 0.0 10.0
+
+Binary program (.vlb), compact and randomly accessible:
+    header : magic (5s) b'VLPRG', version (B), steps (Q), sha256 (32s)
+    record : V, seconds, vExitLeft, vExitRight, iExitLeft, iExitRight (6d)
+
+Values are exact (repr of floats in the text variant). The hash covers the
+binary records of all jobs, so it is the same for both variants of one
+program. The header fields have fixed width: writers fill them in when they
+are closed. Binary programs are opened lazily (rows are read when needed),
+text programs are read sequentially.
+"""
+import os
+import struct
+import hashlib
+from libs.jobModel import JobModel
+
+
+class ProgramFileError(Exception):
+    pass
+
+
+MAGIC = b'VLPRG'
+VERSION = 1
+TEXT = '.vlp'
+BINARY = '.vlb'
+header = struct.Struct('<5sBQ32s')
+record = struct.Struct('<6d')
+textHeader = ('#voltlog-program {version}\n'
+              '#steps {steps:010d}\n'
+              '#sha256 {digest}\n'
+              '#columns {columns}\n')
+
+
+def isBinary(path):
+    """returns True if the `path' extension selects the binary variant"""
+    return os.path.splitext(path)[1].lower() == BINARY
+
+
+class ProgramWriter():
+    """streams jobs into the program file"""
+    def __init__(self, path, binary=None):
+        """Arguments:
+            path   -> (string) program file
+            binary -> (boolean, optional) variant, from extension if None"""
+        self.path = path
+        self.binary = isBinary(path) if binary is None else binary
+        self.steps = 0
+        self.hash = hashlib.sha256()
+        self.file = open(path, mode='wb')
+        self._writeHeader()  # placeholder, rewritten by close()
+
+    def _writeHeader(self):
+        if self.binary:
+            self.file.write(header.pack(MAGIC, VERSION, self.steps,
+                                        self.hash.digest()))
+        else:
+            self.file.write(textHeader.format(
+                version=VERSION, steps=self.steps,
+                digest=self.hash.hexdigest(),
+                columns=' '.join(JobModel.columns)).encode())
+
+    def write(self, row):
+        """appends one job
+
+        Arguments:
+            row -> sequence of floats ordered as jobModel.JobModel.columns
+
+        Returns:"""
+        raw = record.pack(*row)
+        self.hash.update(raw)
+        self.steps += 1
+        if self.binary:
+            self.file.write(raw)
+        else:
+            self.file.write((' '.join(repr(float(value)) for value in row) +
+                             '\n').encode())
+
+    def close(self):
+        self.file.seek(0)
+        self._writeHeader()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ProgramReader():
+    """reads the program file header, streams or randomly accesses jobs"""
+    def __init__(self, path, blockSize=4096):
+        """Arguments:
+            path      -> (string) program file (any variant)
+            blockSize -> (int, optional) records read from disk at once"""
+        self.path = path
+        self.blockSize = blockSize
+        self.file = open(path, mode='rb')
+        try:
+            self.binary = self.file.read(len(MAGIC)) == MAGIC
+            self.file.seek(0)
+            if self.binary:
+                self._readBinaryHeader()
+            else:
+                self._readTextHeader()
+        except Exception:  # damaged or foreign header
+            self.file.close()
+            raise
+        self.block = None  # (first index, rows) of the cached block
+
+    def _readBinaryHeader(self):
+        raw = self.file.read(header.size)
+        if len(raw) != header.size:
+            raise ProgramFileError('Truncated program: {}'.format(self.path))
+        magic, version, self.steps, self.digest = header.unpack(raw)
+        if version != VERSION:
+            raise ProgramFileError('Unsupported program version: {}'
+                                   .format(version))
+        size = os.fstat(self.file.fileno()).st_size
+        if size != header.size + self.steps * record.size:
+            raise ProgramFileError('Truncated program: {}'.format(self.path))
+
+    def _readTextHeader(self):
+        try:
+            lines = [self.file.readline().decode().split() for n in range(4)]
+            (tag, version), (_, steps), (_, digest), (_, *columns) = lines
+            if tag != '#voltlog-program':
+                raise ValueError(tag)
+            if int(version) != VERSION:
+                raise ProgramFileError('Unsupported program version: {}'
+                                       .format(version))
+            self.steps = int(steps)
+            self.digest = bytes.fromhex(digest)
+        except (ValueError, UnicodeDecodeError):
+            raise ProgramFileError('Not a program file: {}'.format(self.path))
+        if tuple(columns) != JobModel.columns:
+            raise ProgramFileError('Unknown columns: {}'.format(columns))
+        self.dataStart = self.file.tell()
+
+    def __len__(self):
+        return self.steps
+
+    def row(self, index):
+        """returns job `index' as a tuple ordered as JobModel.columns (binary
+        variant only, blocks of rows are cached)"""
+        if not self.binary:
+            raise ProgramFileError('Text programs are read sequentially')
+        if not 0 <= index < self.steps:
+            raise IndexError(index)
+        first = index - index % self.blockSize
+        if self.block is None or self.block[0] != first:
+            self.file.seek(header.size + first * record.size)
+            count = min(self.blockSize, self.steps - first)
+            self.block = first, list(record.iter_unpack(
+                self.file.read(count * record.size)))
+        return self.block[1][index - first]
+
+    def rows(self):
+        """yields all jobs (tuples ordered as JobModel.columns), the content
+        hash is verified at the end"""
+        check = hashlib.sha256()
+        steps = 0
+        for row in (self._binaryRows() if self.binary else self._textRows()):
+            check.update(record.pack(*row))
+            steps += 1
+            yield row
+        if steps != self.steps or check.digest() != self.digest:
+            raise ProgramFileError('Corrupted program: {}'.format(self.path))
+
+    def _binaryRows(self):
+        for first in range(0, self.steps, self.blockSize):
+            count = min(self.blockSize, self.steps - first)
+            self.file.seek(header.size + first * record.size)  # row() seeks
+            yield from record.iter_unpack(self.file.read(count * record.size))
+
+    def _textRows(self):
+        self.file.seek(self.dataStart)
+        for number, line in enumerate(self.file, start=5):
+            try:
+                row = tuple(float(value) for value in line.split())
+            except ValueError:
+                row = ()
+            if len(row) != len(JobModel.columns):
+                raise ProgramFileError('Bad job in line {}: {}'.format(
+                                       number, line.decode(errors='replace')))
+            yield row
+
+    def verify(self):
+        """reads the whole program and checks the content hash"""
+        for row in self.rows():
+            pass
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def loadJobs(path):
+    """opens the program as a JobModel, binary programs are lazy (rows are
+    read from the file until the model is changed)
+
+    Returns:
+        jobModel.JobModel object"""
+    reader = ProgramReader(path)
+    if reader.binary:
+        return JobModel(source=reader)
+    with reader:
+        jobs = JobModel()
+        for row in reader.rows():
+            jobs.append(*row)
+    return jobs
+
+
+def saveJobs(path, jobs, binary=None):
+    """streams all jobs of the JobModel into the program file
+
+    Arguments:
+        path   -> (string) program file
+        jobs   -> jobModel.JobModel object
+        binary -> (boolean, optional) variant, from extension if None
+
+    Returns:"""
+    source = getattr(jobs.source, 'path', None)
+    if source and os.path.abspath(source) == os.path.abspath(path):
+        jobs.materialize()  # the file is overwritten
+    temporary = path + '.tmp'
+    try:
+        with ProgramWriter(temporary, binary=isBinary(path) if binary is None
+                           else binary) as writer:
+            for row in jobs.rows():  # corrupted source raises midway
+                writer.write(row)
+        os.replace(temporary, path)
+    except Exception:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+        raise
+
+if __name__ == '__main__':
+    import sys
+    import time
+    for path in sys.argv[1:]:
+        start = time.perf_counter()
+        with ProgramReader(path) as reader:
+            reader.verify()
+            print('{}: {} steps, {} variant, hash OK ({:.3f} s)'.format(
+                  path, len(reader), 'binary' if reader.binary else 'text',
+                  time.perf_counter() - start))
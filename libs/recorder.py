@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+Recorded runs of the scheduler.
+
+Every sample taken by the scheduler during a run is appended to a run file as
+a fixed-width little-endian record, so that runs of any length can be sliced
+by time (binary search on the file) and streamed in blocks without loading
+the whole recording into memory.
+
+Run file layout:
+    header : magic (5s) b'VLRUN', version (B), PSU model (8s),
+             start time (d, seconds since epoch)
+    record : time (d, seconds since epoch), V (f), I (f), P (f),
+             job index (i, position of the job in the scheduler`s batch)
+"""
+import os
+import struct
+import logging
+import datetime
+import itertools
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+
+class RunFileError(Exception):
+    pass
+
+
+MAGIC = b'VLRUN'
+VERSION = 1
+EXTENSION = '.vlr'
+header = struct.Struct('<5sB8sd')
+record = struct.Struct('<dfffi')
+fields = ('time', 'job', 'V', 'I', 'P')  # exported column names
+
+
+def runName(start, number=0):
+    """creates run file name from the run start time
+
+    Arguments:
+        start  -> datetime.datetime object
+        number -> (int, optional) suffix of the runs started in the same
+                  second
+
+    Returns:
+        string"""
+    return 'run_{}{}{}'.format(start.strftime('%Y%m%d_%H%M%S'),
+                               '_{}'.format(number) if number else '',
+                               EXTENSION)
+
+
+class RunRecorder():
+    """appends scheduler samples to the run file"""
+    def __init__(self, directory, model, start=None):
+        """Arguments:
+            directory -> (string) directory of run files (created if needed)
+            model     -> (string) PSU model
+            start     -> (datetime.datetime, optional) start time of the run"""
+        start = start or datetime.datetime.now()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        for number in itertools.count():  # never appends to another run
+            self.path = os.path.join(directory, runName(start, number))
+            try:
+                self.file = open(self.path, mode='xb')
+                break
+            except FileExistsError:
+                continue
+        self.file.write(header.pack(MAGIC, VERSION, model.encode(),
+                                    start.timestamp()))
+        self.broken = False  # write failed, recording stopped
+
+    def append(self, t, V, I, P, job):
+        """appends one sample to the run file
+
+        Arguments:
+            t       -> (float) sample time, seconds since epoch
+            V, I, P -> (float) sampled values
+            job     -> (int) index of the running job in the batch
+
+        Returns:"""
+        if self.broken:
+            return
+        try:
+            self.file.write(record.pack(t, V, I, P, job))
+            self.file.flush()  # makes the sample visible for exporters
+        except OSError as error:  # full disk, lost NFS: sampling goes on
+            logger.error('run file %s broken, recording stopped: %s',
+                         self.path, error)
+            self.broken = True
+            self.close()
+
+    def close(self):
+        try:
+            self.file.close()
+        except OSError:  # buffered samples not written
+            pass
+
+
+class _TimeIndex():
+    """sequence-like view of record times used for binary search on disk"""
+    def __init__(self, reader):
+        self.reader = reader
+
+    def __len__(self):
+        return len(self.reader)
+
+    def __getitem__(self, index):
+        return self.reader.record(index)[0]
+
+
+class RunReader():
+    """random access and block streaming of the run file"""
+    def __init__(self, path, blockSize=65536):
+        """Arguments:
+            path      -> (string) run file
+            blockSize -> (int, optional) records read from disk at once"""
+        self.path = path
+        self.blockSize = blockSize
+        self.file = open(path, mode='rb')
+        raw = self.file.read(header.size)
+        if len(raw) != header.size:
+            self.file.close()
+            raise RunFileError('Truncated run file: {}'.format(path))
+        magic, version, model, start = header.unpack(raw)
+        if magic != MAGIC or version != VERSION:
+            self.file.close()
+            raise RunFileError('Not a run file: {}'.format(path))
+        self.model = model.rstrip(b'\x00').decode()
+        self.start = start
+
+    def __len__(self):
+        size = os.fstat(self.file.fileno()).st_size
+        return (size - header.size) // record.size  # ignores torn record
+
+    def record(self, index):
+        """returns raw record tuple (time, V, I, P, job) at `index'"""
+        self.file.seek(header.size + index * record.size)
+        return record.unpack(self.file.read(record.size))
+
+    def find(self, t):
+        """returns index of the first record not older than `t'"""
+        return bisect_left(_TimeIndex(self), t)
+
+    def iterRows(self, start=None, stop=None, every=1):
+        """yields blocks of rows ordered as `fields'
+
+        Arguments:
+            start -> (float, optional) first sample time (seconds since epoch)
+            stop  -> (float, optional) end of the slice (exclusive)
+            every -> (int, optional) decimation, every n-th sample is taken
+
+        Yields:
+            list of tuples (time, job, V, I, P)"""
+        first = 0 if start is None else self.find(start)
+        last = len(self) if stop is None else self.find(stop)
+        block = max(every, self.blockSize - self.blockSize % every)  # stride
+        index = first
+        while index < last:
+            count = min(block, last - index)
+            self.file.seek(header.size + index * record.size)
+            raw = self.file.read(count * record.size)
+            rows = [(t, job, V, I, P) for t, V, I, P, job in
+                    record.iter_unpack(raw[:len(raw) - len(raw) % record.size])]
+            if every > 1:
+                rows = rows[::every]
+            if not rows:
+                break
+            yield rows
+            index += count
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
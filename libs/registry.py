@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""
+PSU rigs in the Pyro4 name server.
+
+Every PSU server (mainServer.py --nameserver) registers its main object as
+`voltlog.<host>.<port>' (observer as `voltlog.<host>.<port>.observer') with
+the metadata used for the discovery of the rigs:
+    voltlog.rig        -> marks PSU servers
+    model:<ID>         -> PSU model, e.x.: model:12010
+    port:<port>        -> Pyro4 port of the server
+    state:<state>      -> idle (scheduler stopped), busy (scheduler running)
+                          or offline (PSU port lost)
+RigRegistrar follows the server snapshots and updates the state in the name
+server, the registration is renewed when the name server was restarted. The
+server works without the name server (registration is retried).
+"""
+import time
+import logging
+from collections import namedtuple
+from threading import Thread, Event
+
+logger = logging.getLogger(__name__)
+
+RIG = 'voltlog.rig'
+IDLE, BUSY, OFFLINE = 'idle', 'busy', 'offline'
+
+Rig = namedtuple('Rig', ('name', 'uri', 'model', 'port', 'state'))
+
+
+def rigState(snap):
+    """returns state of the rig with the Snapshot `snap'"""
+    if not snap.online:
+        return OFFLINE
+    return BUSY if snap.running else IDLE
+
+
+def rigMetadata(model, port, state):
+    return {RIG, 'model:{}'.format(model), 'port:{}'.format(port),
+            'state:{}'.format(state)}
+
+
+def locateNameServer(nsHost=None):
+    """returns proxy of the name server
+
+    Arguments:
+        nsHost -> (string, optional) name server `host' or `host:port'
+                  (default broadcast lookup)"""
+    import Pyro4
+    host, port = nsHost or None, None
+    if host and ':' in host:
+        host, _, port = host.rpartition(':')
+        if not host or not port.isdigit():
+            raise Pyro4.errors.NamingError('Wrong name server address: '
+                                           '{}'.format(nsHost))
+        port = int(port)
+    return Pyro4.locateNS(host, port)
+
+
+def discoverRigs(nsHost=None, model=None, state=None):
+    """finds registered rigs
+
+    Arguments:
+        nsHost -> (string, optional) name server `host' or `host:port'
+                  (default broadcast lookup)
+        model  -> (string, optional) only rigs of this PSU model
+        state  -> (string, optional) only rigs in this state (IDLE ...)
+
+    Returns:
+        list of Rig tuples sorted by the name"""
+    metadata = {RIG}
+    if model:
+        metadata.add('model:{}'.format(model))
+    if state:
+        metadata.add('state:{}'.format(state))
+    with locateNameServer(nsHost) as ns:
+        found = ns.list(metadata_all=metadata, return_metadata=True)
+    rigs = []
+    for name, (uri, tags) in sorted(found.items()):
+        fields = dict(tag.split(':', 1) for tag in tags if ':' in tag)
+        rigs.append(Rig(name, uri, fields.get('model'),
+                        int(fields.get('port', 0)), fields.get('state')))
+    return rigs
+
+
+class RigRegistrar():
+    """keeps the PSU server registered in the name server"""
+    def __init__(self, name, uri, observerUri, model, port, snapshots,
+                 nsHost=None, period=1.0, refresh=30.0):
+        """Arguments:
+            name        -> (string) name of the rig (main server object)
+            uri         -> (string) Pyro4 uri of the main server object
+            observerUri -> (string) Pyro4 uri of the observer object
+            model       -> PSU model (ID of the server)
+            port        -> (int) Pyro4 port of the server
+            snapshots   -> snapshot.SnapshotCache object of the server
+            nsHost      -> (string, optional) name server `host' or
+                           `host:port' (default broadcast lookup)
+            period      -> (float, optional) state check period [s]
+            refresh     -> (float, optional) registration check period [s]"""
+        self.name = name
+        self.uri = uri
+        self.observerUri = observerUri
+        self.model = model
+        self.port = port
+        self.snapshots = snapshots
+        self.nsHost = nsHost
+        self.period = period
+        self.refresh = refresh
+        self.state = None  # state in the name server
+        self.stopped = Event()
+        self.thread = Thread(target=self._run, name='registrar', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _register(self, ns):
+        self.state = rigState(self.snapshots.current)
+        ns.register(self.name, self.uri, metadata=rigMetadata(
+                    self.model, self.port, self.state))
+        ns.register(self.name + '.observer', self.observerUri)
+        logger.info('rig %s registered in the name server (%s)', self.name,
+                    self.state)
+
+    def _run(self):
+        import Pyro4
+        ns = None
+        checked = -self.refresh  # monotonic time of the registration check
+        lost = False  # name server lost (warned)
+        while True:
+            now = time.monotonic()
+            try:
+                if now - checked >= self.refresh:
+                    checked = now
+                    if ns is None:
+                        ns = locateNameServer(self.nsHost)
+                    if ns.list(prefix=self.name).get(self.name) != self.uri:
+                        self._register(ns)  # new or restarted name server
+                    lost = False
+                if ns is not None:
+                    self._update(ns)
+            except Pyro4.errors.PyroError as error:
+                if not lost:
+                    logger.warning('name server not available: %s', error)
+                    lost = True
+                if ns is not None:
+                    ns._pyroRelease()
+                    ns = None
+                checked = now  # next attempt after refresh
+            if self.stopped.wait(self.period):
+                break
+        if ns is not None:
+            self._unregister(ns)
+
+    def _update(self, ns):
+        state = rigState(self.snapshots.current)
+        if state != self.state:
+            ns.set_metadata(self.name, rigMetadata(self.model, self.port,
+                                                   state))
+            self.state = state
+            logger.debug('rig %s state: %s', self.name, state)
+
+    def _unregister(self, ns):
+        import Pyro4
+        try:
+            ns.remove(self.name)
+            ns.remove(self.name + '.observer')
+        except Pyro4.errors.PyroError:
+            pass
+        ns._pyroRelease()
+
+    def close(self):
+        """stops updates and removes the rig from the name server"""
+        self.stopped.set()
+        self.thread.join(timeout=5)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+"""
+Non-blocking Pyro4 client layer for the tkinter GUI.
+
+AsyncProxy runs remote calls on its own worker thread (the thread owns the
+Pyro4 proxy) and returns concurrent.futures.Future objects. UiDispatcher
+delivers results of the futures to callbacks on the tkinter thread: worker
+threads only put finished futures into a queue, the queue is drained by
+root.after(), so widgets are never touched outside the main loop.
+Heartbeat keeps the lease of the client on the server (see libs/lease.py)
+from its own thread, so long uploads and a busy window don't delay it.
+Remote calls are traced when tracing is on (see tracedProxy). Exceptions
+of the server modules come back as RemoteError (see registerErrors).
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+import libs.tracing as tracing
+
+_TracedProxy = None  # Pyro4.Proxy subclass, created with the first proxy
+
+#exceptions raised by the server modules (serpent sends them as dicts of
+#the class name, arguments and attributes)
+remoteErrors = {
+    'libs.batchCodec': ('BatchCodecError',),
+    'libs.capture': ('CaptureError',),
+    'libs.condition': ('WrongOperatorError', 'OffLimitsError',
+                       'WrongVariableError', 'WrongModelError',
+                       'DiffConditionTypes', 'CompactRangeError'),
+    'libs.deviceProcess': ('DeviceProcessError',),
+    'libs.exporter': ('ExportFormatError', 'ColumnError'),
+    'libs.job': ('WrongConditionSet',),
+    'libs.lease': ('LeaseError',),
+    'libs.recorder': ('RunFileError',),
+    'libs.scheduler': ('JobListError', 'StartTimeError', 'FrequencyError',
+                       'SchedulerRunningError'),
+    'libs.telemetryRing': ('TelemetryRingError',),
+    'libs.tracing': ('TracingError',),
+    'libs.transport': ('TransportError',),
+    'libs.voltcraftPSU': ('ValueOutOfRange', 'WrongCommand', 'ArgumentError',
+                          'PsuOfflineError')}
+
+
+class LeaseLostError(Exception):
+    pass
+
+
+class RemoteError(Exception):
+    """exception of the server without the class on the client side,
+    `remoteClass' is the name of the server class"""
+    def __init__(self, remoteClass, *args):
+        Exception.__init__(self, *args)
+        self.remoteClass = remoteClass
+
+    def __str__(self):
+        return '{}: {}'.format(self.remoteClass.rpartition('.')[2],
+                               Exception.__str__(self))
+
+
+def _remoteError(classname, data):
+    """serpent dict of the server exception -> RemoteError"""
+    error = RemoteError(classname, *data.get('args', ()))
+    for name, value in data.get('attributes', {}).items():
+        setattr(error, name, value)  # _pyroTraceback
+    return error
+
+
+def registerErrors():
+    """lets Pyro4 deserialize exceptions of the server modules as
+    RemoteError (with the original message) instead of SerializeError
+    `unsupported serialized class'"""
+    from Pyro4.util import SerializerBase
+    for module, names in remoteErrors.items():
+        for name in names:
+            SerializerBase.register_dict_to_class(
+                '{}.{}'.format(module, name), _remoteError)
+
+
+def tracedProxy(uri):
+    """returns Pyro4 proxy of the `uri' tracing its remote calls (span and
+    correlation id of every call, see tracing.rpcSpan)"""
+    global _TracedProxy
+    if _TracedProxy is None:
+        import Pyro4
+        registerErrors()
+
+        class TracedProxy(Pyro4.Proxy):
+            def _pyroInvoke(self, methodname, vargs, kwargs, flags=0,
+                            objectId=None):
+                with tracing.rpcSpan(methodname):
+                    return Pyro4.Proxy._pyroInvoke(self, methodname, vargs,
+                                                   kwargs, flags, objectId)
+        _TracedProxy = TracedProxy
+    return _TracedProxy(uri)
+
+
+class AsyncProxy():
+    def __init__(self, uri, name='rpc'):
+        """Arguments:
+            uri  -> (string) Pyro4 uri of the remote object
+            name -> (string, optional) worker thread name prefix"""
+        self.uri = uri
+        self.proxy = None  # created by the worker thread
+        self.executor = ThreadPoolExecutor(max_workers=1,
+                                           thread_name_prefix=name)
+
+    def _proxy(self):
+        if self.proxy is None:
+            self.proxy = tracedProxy(self.uri)
+        return self.proxy
+
+    def call(self, method, *args):
+        """calls remote `method' with `args'
+
+        Returns:
+            concurrent.futures.Future object of the result"""
+        return self.executor.submit(
+            lambda: getattr(self._proxy(), method)(*args))
+
+    def run(self, function, *args):
+        """runs function(proxy, *args) on the worker thread, use it for
+        sequences of remote calls
+
+        Returns:
+            concurrent.futures.Future object of the function`s result"""
+        return self.executor.submit(lambda: function(self._proxy(), *args))
+
+    def close(self):
+        """releases connection after already submitted calls"""
+        def release():
+            if self.proxy is not None:
+                self.proxy._pyroRelease()
+        future = self.executor.submit(release)
+        self.executor.shutdown(wait=False)
+        return future
+
+    def __str__(self):
+        return self.uri
+
+
+class Heartbeat():
+    def __init__(self, uri, lease, ttl, beats=3, check=10):
+        """renews the server lease by oneway calls until close
+
+        Arguments:
+            uri   -> (string) Pyro4 uri of the server
+            lease -> (string) lease id (see MainServer.acquireLease)
+            ttl   -> (float) granted lease time [s]
+            beats -> (int, optional) heartbeats per lease time
+            check -> (int, optional) every check-th heartbeat asks the server
+                     if the lease is still held (oneway calls get no reply)"""
+        self.uri = uri
+        self.lease = lease
+        self.period = ttl / beats
+        self.check = check
+        self.lost = Future()  # exception when the lease is lost
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='heartbeat',
+                                       daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        import Pyro4
+        try:
+            with Pyro4.Proxy(self.uri) as proxy:
+                proxy._pyroTimeout = self.period
+                beat = 0
+                while not self.stopped.wait(self.period):
+                    beat += 1
+                    if beat % self.check == 0 and \
+                            proxy.checkLease(self.lease) is None:
+                        raise LeaseLostError('Lease expired on the server')
+                    proxy.heartbeat(self.lease)
+        except Exception as error:
+            if not self.stopped.is_set():
+                self.lost.set_exception(error)
+
+    def close(self):
+        """stops heartbeats (release the lease by the control proxy)"""
+        self.stopped.set()
+
+
+class UiDispatcher():
+    def __init__(self, root, interval=50):
+        """Arguments:
+            root     -> tkinter root object
+            interval -> (int, optional) queue polling period [ms]"""
+        self.root = root
+        self.interval = interval
+        self.queue = queue.SimpleQueue()
+        self.root.after(self.interval, self._drain)
+
+    def when(self, future, onDone, onError=None):
+        """calls onDone(result) or onError(exception) on the tkinter thread
+        when the `future' is finished
+
+        Returns:
+            the future"""
+        future.add_done_callback(
+            lambda done: self.queue.put((done, onDone, onError)))
+        return future
+
+    def _drain(self):
+        try:
+            while True:
+                future, onDone, onError = self.queue.get_nowait()
+                error = future.exception()
+                if error is None:
+                    onDone(future.result())
+                elif onError is not None:
+                    onError(error)
+        except queue.Empty:
+            pass
+        finally:
+            self.root.after(self.interval, self._drain)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Running statistics of PSU samples, O(1) time and memory per sample.
+
+Mean and variance use Welford`s algorithm (numerically stable, no sums of
+squares). Ripple is estimated from successive differences (RMS of the
+differences / sqrt(2)), so slow drifts of the value (charging curves,
+ramps) are not counted as ripple, unlike in the standard deviation.
+"""
+import math
+
+
+class RunningStats():
+    """statistics of one sampled value"""
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max', 'last', 'diffs')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0        # sum of squared deviations from the mean
+        self.min = math.inf
+        self.max = -math.inf
+        self.last = None     # previous sample
+        self.diffs = 0.0     # sum of squared successive differences
+
+    def add(self, x):
+        """adds sample `x'"""
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        if self.last is not None:
+            self.diffs += (x - self.last) ** 2
+        self.last = x
+
+    @property
+    def variance(self):
+        """sample variance (0 for less than 2 samples)"""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def ripple(self):
+        """RMS ripple estimate from successive differences"""
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self.diffs / (2 * (self.count - 1)))
+
+    def asDict(self):
+        """returns Pyro4-friendly dictionary (None values if no samples)"""
+        if not self.count:
+            return {'count': 0, 'mean': None, 'std': None, 'min': None,
+                    'max': None, 'ripple': None}
+        return {'count': self.count, 'mean': self.mean, 'std': self.std,
+                'min': self.min, 'max': self.max, 'ripple': self.ripple}
+
+
+class VIPStats():
+    """running statistics of V, I and P samples"""
+    names = ('V', 'I', 'P')
+
+    def __init__(self):
+        self.stats = {name: RunningStats() for name in self.names}
+
+    def add(self, V, I, P):
+        self.stats['V'].add(V)
+        self.stats['I'].add(I)
+        self.stats['P'].add(P)
+
+    def asDict(self):
+        """returns dictionary {'V': {...}, 'I': {...}, 'P': {...}}"""
+        return {name: self.stats[name].asDict() for name in self.names}
+
+if __name__ == '__main__':
+    import random
+    stats = RunningStats()
+    for n in range(100000):
+        stats.add(5 + n / 100000 + random.gauss(0, 0.01))
+    print(stats.asDict())  # std includes the ramp, ripple does not
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""
+Adaptive sampling period of the PSU telemetry.
+
+Every sample the period is chosen from the distance of the readings to the
+bounds of the running job (job.Job.subs limits narrower than the PSU model
+range) and from their rate of change:
+    - reading out of bounds, within `resolution' of a bound (rounded
+      reading can cross it any moment) or any reading (bounded or not)
+      jumping by more than `jump' of its bounded (model) range since the
+      last sample -> `minPeriod' (the fastest safe rate of the device)
+    - reading moving towards a bound -> the next sample is taken just
+      before (`guard' of the remaining time) the crossing predicted from the
+      local trend: least-squares line through the samples of the last
+      `window' seconds (slope.RollingSlope, quantized and noisy readings of
+      the PSU), smoothed rate of change until the window is filled. Slow,
+      monotonic processes (charging) are sampled a few times per approach
+      and the crossing is caught within `minPeriod'
+    - readings far from every bound and stable -> the period grows by
+      `growth' per sample up to `maxPeriod' (bus mostly idle on long soaks),
+      the period asked by the user (scheduler frequency) is the `maxPeriod',
+      jobs with dV/dt, dI/dt conditions lower it further (see reset) to
+      keep the slope window filled with samples
+"""
+import math
+from libs.slope import RollingSlope
+
+
+class AdaptiveSampler():
+    """period of the next PSU sample"""
+    def __init__(self, minPeriod=0.25, maxPeriod=10.0, period=2.0,
+                 resolution=None, jump=0.05, guard=0.2, window=30.0, growth=1.5,
+                 ranges=None):
+        """Arguments:
+            minPeriod -> (float, optional) shortest period [s]
+            maxPeriod -> (float, optional) longest period [s]
+            period    -> (float, optional) period after start or reset [s]
+            resolution-> (dictionary, optional) {name: resolution} of the
+                         readings (modelsDict.resolutions), 0 if not given
+            jump      -> (float, optional) `changes quickly' as a fraction of
+                         the bounded range
+            guard     -> (float, optional) fraction of the time to the
+                         predicted crossing left before the next sample
+            window    -> (float, optional) time window of the local trend [s]
+            growth    -> (float, optional) max period growth per sample
+            ranges    -> (dictionary, optional) {name: (min, max)} of the
+                         model, scale of the `jump' of unbounded readings
+                         (not checked if not given)"""
+        self.minPeriod = minPeriod
+        self.maxPeriod = maxPeriod
+        self.initial = period
+        self.resolution = resolution or {}
+        self.jump = jump
+        self.guard = guard
+        self.window = window
+        self.growth = growth
+        self.ranges = ranges or {}
+        self.reset()
+
+    def setPeriod(self, period):
+        """sets the user period: the longest and the initial one"""
+        self.maxPeriod = max(period, self.minPeriod)
+        self.initial = self.maxPeriod
+        self.reset()
+
+    def reset(self, ceiling=None):
+        """forgets previous samples (new job, new bounds)
+
+        Arguments:
+            ceiling -> (float, optional) longest period of the job, below
+                       maxPeriod (e.x. slope conditions)"""
+        self.ceiling = self.maxPeriod if ceiling is None else \
+            max(min(ceiling, self.maxPeriod), self.minPeriod)
+        self.period = min(self.initial, self.ceiling)
+        self.t = None
+        self.last = {}
+        self.rates = {}
+        self.trends = {}
+
+    def next(self, t, values, bounds):
+        """returns period [s] of the next sample
+
+        Arguments:
+            t      -> (float) time of the sample [s]
+            values -> (dictionary) sampled values {name: value}
+            bounds -> (dictionary) job bounds {name: (low, high)}, None for
+                      unbounded side
+
+        Returns:
+            float"""
+        dt = t - self.t if self.t is not None else 0.0
+        period = self.ceiling
+        for name, x in values.items():  # bounded or not
+            previous = self.last.get(name)
+            if name in bounds:
+                scale = self._scale(*bounds[name])
+            else:
+                low, high = self.ranges.get(name, (0.0, math.inf))
+                scale = high - low  # inf for accumulated, never jumps
+            if previous is not None and abs(x - previous) > scale * self.jump:
+                period = self.minPeriod  # changes quickly
+        for name, (low, high) in bounds.items():
+            x = values[name]
+            previous = self.last.get(name)
+            resolution = self.resolution.get(name, 0.0)
+            rate, trend = self._trend(name, t, x, previous, dt)
+            for bound, sign in ((low, -1), (high, 1)):
+                if bound is None:
+                    continue
+                distance = (bound - x) * sign  # > 0 inside the bounds
+                if distance <= 0 or (previous is None and
+                                     distance <= resolution):
+                    period = self.minPeriod
+                elif rate * sign > 0:  # moving towards the bound
+                    crossing = (((bound - trend) * sign - resolution)
+                                / (rate * sign))
+                    period = min(period, max(crossing * (1 - self.guard),
+                                             self.minPeriod))
+        self.last = dict(values)
+        self.t = t
+        period = min(period, self.period * self.growth)
+        self.period = max(self.minPeriod, min(period, self.ceiling))
+        return self.period
+
+    def _trend(self, name, t, x, previous, dt):
+        """returns (rate of change, trend value at `t') of the variable"""
+        trend = self.trends.get(name)
+        if trend is None:
+            trend = self.trends[name] = RollingSlope(self.window,
+                                                     origin=t)
+        trend.add(t, x)
+        slope = trend.slope
+        if slope is not None:
+            return slope, trend.predict(t)
+        rate = self.rates.get(name, 0.0)
+        if previous is not None and dt > 0:
+            rate = (rate + (x - previous) / dt) / 2
+            self.rates[name] = rate
+        return rate, x
+
+    @staticmethod
+    def _scale(low, high):
+        if low is not None and high is not None:
+            return high - low
+        return max(abs(low if high is None else high), 1.0)
+
+
+def activeBounds(subs, ranges):
+    """returns bounds of the job narrower than the PSU model ranges
+
+    Arguments:
+        subs   -> (dictionary) job.Job.subs {name: [min, max]}
+        ranges -> (dictionary) {name: (min, max)} of the model
+
+    Returns:
+        dictionary {name: (low, high)}, None for side without condition"""
+    bounds = {}
+    for name, (low, high) in subs.items():
+        if name not in ranges:
+            continue
+        rawLow, rawHigh = ranges[name]
+        low = low if low > rawLow and not math.isinf(low) else None
+        high = high if high < rawHigh and not math.isinf(high) else None
+        if low is not None or high is not None:
+            bounds[name] = (low, high)
+    return bounds
+
+if __name__ == '__main__':
+    sampler = AdaptiveSampler(resolution={'V': 0.01})
+    t, V, samples = 0.0, 10.0, 0
+    bounds = {'V': (None, 14.4)}
+    while V < 14.4:  # charging slows down near the end of charge voltage
+        period = sampler.next(t, {'V': V}, bounds)
+        samples += 1
+        if samples % 25 == 0 or period == sampler.minPeriod:
+            print('{:>8.2f} s  V {:.3f}  next sample in {:.2f} s'.format(
+                  t, V, period))
+        t += period
+        V = round(14.5 - 4.5 * math.exp(-t / 600), 2)
+    crossing = 600 * math.log(4.5 / 0.105)  # reading rounded to 14.40 V
+    print('{} samples instead of {} at 2 s, stopped {:.2f} s after '
+          'crossing'.format(samples, int(t / 2), t - crossing))
@@ -1,7 +1,16 @@
 #!/usr/bin/env python
 from threading import Thread, Event, Timer
 from libs.voltcraftPSU import PsuOfflineError
-from libs.modelsDict import models, statuses
+from libs.modelsDict import (models, statuses, accumulated, slopes,
+                             slopeWindow, slopeSamples, resolutions)
+from libs.snapshot import SnapshotCache
+from libs.runningStats import VIPStats
+from libs.integrator import ChargeCounter
+from libs.slope import RollingSlope
+from libs.sampler import AdaptiveSampler, activeBounds
+from libs.batchCodec import BatchCodecError
+import libs.metrics as metrics
+import libs.tracing as tracing
 import time
 from collections import deque
 import logging
@@ -10,6 +19,16 @@ import datetime
 
 logger = logging.getLogger(__name__)
 
+tickLateness = metrics.histogram('scheduler_tick_lateness_seconds',
+                                 'Delay of the condition check tick')
+stopLatency = metrics.histogram('scheduler_stop_latency_seconds',
+                                'Time from the sample violating stop '
+                                'conditions to the job stop',
+                                bounds=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0,
+                                        5.0, 10.0, 30.0, 60.0))
+samplesTaken = metrics.counter('scheduler_samples_total',
+                               'V, I samples taken by the scheduler')
+
 
 class JobListError(Exception):
     pass
@@ -23,9 +42,13 @@ class FrequencyError(Exception):
     pass
 
 
+class SchedulerRunningError(Exception):
+    pass
+
+
 class VoltcraftScheduler():
     def __init__(self, device, jobs, job_stats, running,
-                 start=None, frequency=1):
+                 start=None, frequency=1, snapshots=None):
         """Voltcraft PSU job`s scheduler, interface is based on the sched.py.
 
         Arguments:
@@ -37,6 +60,8 @@ class VoltcraftScheduler():
                         (datetime.datetime object)
             frequency -> (float)frequency of PSU call ups: 1 - 1 Hz
                                                     0.5 - 0.5 Hz ...
+            snapshots -> (snapshot.SnapshotCache, optional) cache of the
+                         scheduler state published for observers
         INFO: `device' must be properly set&checked (see VoltcraftPSU docs)"""
         self.device = device
         self.jobs = jobs
@@ -46,6 +71,26 @@ class VoltcraftScheduler():
         self.values = {'V': 0.00, 'I': 0.00, 'P': 0.00}
         self.running = running
         self.running.clear()  # not running
+        self.recorder = None  # recorder.RunRecorder of the next run
+        self.jobIndex = -1    # index of the running job in the batch
+        self.runStats = VIPStats()  # statistics of the whole run
+        self.jobStats = VIPStats()  # statistics of the running job
+        self.runCharge = ChargeCounter()  # Ah and Wh of the whole run
+        self.jobCharge = ChargeCounter()  # Ah and Wh since the job start
+        self.jobSlopes = {}  # slope.RollingSlope of the job`s dV, dI conds
+        #period of the update thread:
+        self.sampler = AdaptiveSampler(resolution=resolutions)
+        self.bounds = {}  # bounds of the running job watched by the sampler
+        self.wake = Event()     # sample now (new setpoint, stop)
+        self.sampled = Event()  # new sample taken
+        self.outage = 0.0       # device.outage at the last sample
+        self.device.listeners.append(self._deviceState)
+        self.snapshots = snapshots or SnapshotCache()
+        metrics.gauge('scheduler_queue_depth', 'Jobs waiting in the queue',
+                      function=self.jobs.__len__)
+        metrics.gauge('scheduler_sample_period_seconds',
+                      'Current period of the adaptive V, I sampling',
+                      function=lambda: self.sampler.period)
 
     def setStart(self, start):
         """Sets start value for the whole scheduler
@@ -69,7 +114,18 @@ class VoltcraftScheduler():
         Returns:"""
         if not (0 < freq <= 1):
             raise FrequencyError('Frequency is too high for the Voltcraft PSU')
-        self._calcPeriod(freq)
+        self.period = self._calcPeriod(freq)  # longest sampling period
+
+    def setRecorder(self, recorder):
+        """Sets recorder of samples for the next run
+
+        Arguments:
+            recorder -> (recorder.RunRecorder object or None)
+
+        Returns:"""
+        if self.recorder is not None:  # left by the start not run
+            self.recorder.close()
+        self.recorder = recorder
 
     def _calcPeriod(self, freq):
         """calulates period from frequency
@@ -83,13 +139,34 @@ class VoltcraftScheduler():
             raise FrequencyError('Frequency is too high for the Voltcraft PSU')
         return round(1 / freq, 4)
 
-    def _update(self):
-        """updates internal dictionary of temporary values."""
-        if self.running.isSet():
+    def _update(self, recorder=None):
+        """updates internal dictionary of temporary values.
+
+        Arguments:
+            recorder -> (recorder.RunRecorder, optional) samples` recorder
+
+        Returns:"""
+        if self.running.is_set():
             try:
-                self.values['V'] = self.device.getVoltage()
-                self.values['I'] = self.device.getCurrent()
+                with tracing.span('sample', 'scheduler'):
+                    self.values['V'] = self.device.getVoltage()
+                    self.values['I'] = self.device.getCurrent()
                 self.values['P'] = round(self.values['V'] * self.values['I'], 2)
+                t = time.time()
+                samplesTaken.inc()
+                self._accumulate(t)
+                if recorder:
+                    recorder.append(t, self.values['V'], self.values['I'],
+                                    self.values['P'], self.jobIndex)
+                self.snapshots.publish(time=t, V=self.values['V'],
+                                       I=self.values['I'], P=self.values['P'],
+                                       stats=self._addStats())
+                self.sampled.set()
+                bounds = self.bounds  # replaced by the scheduler thread
+                values = self.values
+                if not accumulated.isdisjoint(bounds):
+                    values = dict(values, **self.jobCharge.asDict())
+                self.sampler.next(t, values, bounds)
             except PsuOfflineError:
                 pass
         else:
@@ -97,6 +174,57 @@ class VoltcraftScheduler():
             self.values['I'] = 0.00
             self.values['P'] = 0.00
 
+    def _deviceState(self, online):
+        """called by the device on the port loss and recovery, the running
+        job is paused meanwhile (see run)"""
+        if online:
+            logger.info('PSU port recovered, scheduler resumed')
+        else:
+            logger.warning('PSU port lost, scheduler paused')
+        self.snapshots.publish(online=online)
+
+    def _accumulate(self, t):
+        """integrates charge and energy of the run and the job, updates
+        slopes of the job (only when jobs are processed)
+
+        Arguments:
+            t -> (float) sample time, seconds since epoch
+
+        Returns:"""
+        if self.jobIndex < 0:
+            return
+        if self.device.outage != self.outage:  # port lost since last sample
+            self.outage = self.device.outage
+            self.runCharge.skip(t, self.values['I'], self.values['P'])
+            self.jobCharge.skip(t, self.values['I'], self.values['P'])
+        else:
+            self.runCharge.add(t, self.values['I'], self.values['P'])
+            self.jobCharge.add(t, self.values['I'], self.values['P'])
+        for name, slope in self.jobSlopes.items():  # empty without dV, dI
+            slope.add(t, self.values[slopes[name]])
+
+    def _addStats(self):
+        """adds sampled values to the run and job statistics (only when
+        jobs are processed)
+
+        Returns:
+            dictionary {'index': job index, 'run': {...}, 'job': {...},
+            'charge': {'run': {...}, 'job': {...}}, 'slopes': {'dV': ...}}
+            (see runningStats.VIPStats and integrator.ChargeCounter, slopes
+            only of the job`s dV, dI conditions, None until the window is
+            filled) or None before the start of batch"""
+        if self.jobIndex < 0:
+            return None
+        jobStats = self.jobStats  # replaced by the scheduler thread
+        self.runStats.add(self.values['V'], self.values['I'], self.values['P'])
+        jobStats.add(self.values['V'], self.values['I'], self.values['P'])
+        return {'index': self.jobIndex, 'run': self.runStats.asDict(),
+                'job': jobStats.asDict(),
+                'charge': {'run': self.runCharge.asDict(),
+                           'job': self.jobCharge.asDict()},
+                'slopes': {name: slope.slope
+                           for name, slope in self.jobSlopes.items()}}
+
     def _check_condition(self, job):
         """checks if VIP conditions of the particular `job' are satisfied.
 
@@ -106,7 +234,15 @@ class VoltcraftScheduler():
         Returns:
             Boolean -> True if conditions are satisfied, False if not."""
         for cond in job.subs:
-            if not job.subs[cond][0] <= self.values[cond] <= job.subs[cond][1]:
+            if cond in accumulated:
+                value = getattr(self.jobCharge, cond)  # since the job start
+            elif cond in slopes:
+                value = self.jobSlopes[cond].slope
+                if value is None:  # window not filled yet
+                    continue
+            else:
+                value = self.values[cond]
+            if not job.subs[cond][0] <= value <= job.subs[cond][1]:
                 return False
         return True
 
@@ -131,23 +267,43 @@ class VoltcraftScheduler():
                 models[self.device.model]['Pmin'],
                 models[self.device.model]['Pmax'])
 
-    def _updateValues(self):
-        """thread method updates values dictionary with V,I.P values"""
-        while self.running.isSet():
-            time.sleep(2)
-            self._update()
+    def _updateValues(self, recorder=None):
+        """thread method updates values dictionary with V,I.P values, period
+        of the updates is adapted to the bounds of the running job (see
+        sampler.AdaptiveSampler), `wake' event forces immediate update
+
+        Arguments:
+            recorder -> (recorder.RunRecorder, optional) samples` recorder,
+                        closed by this thread at the end of the run"""
+        while self.running.is_set():
+            self.wake.wait(self.sampler.period)
+            self.wake.clear()
+            self._update(recorder)
+        if recorder:
+            recorder.close()
 
     def run(self):
         """based on the sched.run() method."""
         self.running.set()  # sheduler is running
         self._checkScheduler()
         period = self.period
-
-        updateThread = Thread(target=self._updateValues, daemon=True,
-                              name='update')
+        self.jobIndex = -1
+        self.runStats = VIPStats()
+        self.runCharge = ChargeCounter()
+        self.bounds = {}
+        model = models[self.device.model]
+        ranges = {name: (model[name + 'min'], model[name + 'max'])
+                  for name in ('V', 'I', 'P') + tuple(accumulated)}
+        self.sampler.ranges = ranges  # scale of the jumps of V, I, P
+        self.sampler.setPeriod(period)  # user period is the longest one
+        recorder, self.recorder = self.recorder, None  # one run per recorder
+        self.snapshots.publish(running=True, job=-1, queued=len(self.jobs))
+
+        updateThread = Thread(target=tracing.bind(self._updateValues),
+                              args=(recorder,), daemon=True, name='update')
         updateThread.start()
 
-        while self.running.isSet():  # wait for start signal
+        while self.running.is_set():  # wait for start signal
             now = datetime.datetime.now()
             if self.start > now:
                 time.sleep(period)
@@ -156,33 +312,86 @@ class VoltcraftScheduler():
                 break
 
         self.device.psuOn()  # TODO : add turnon and turnoff job types
-        while self.running.isSet():  # start batch processing
+        while self.running.is_set():  # start batch processing
             if len(self.jobs) == 0:  # properly completed batch work
                 self._stop()
             else:  # start of queue processing
                 #logger.debug(self.debug_info.format(self.jobs, self.values))
-                j = self.jobs.popleft()
-                j.run()
+                try:
+                    j = self.jobs.popleft()
+                except BatchCodecError:  # job of the encoded batch
+                    logger.exception('job %s not built', self.jobIndex + 1)
+                    self.running.clear()
+                    break
+                begin = time.time()
+                began = tracing.clock()
+                self.jobStats = VIPStats()
+                self.jobCharge = ChargeCounter(begin, self.values['I'],
+                                               self.values['P'])
+                self.jobSlopes = {name: RollingSlope(slopeWindow,
+                                                     origin=begin)
+                                  for name in j.subs if name in slopes}
+                self.bounds = {}
+                if j.what[0] == 'setv':
+                    self.bounds = activeBounds(j.subs, ranges)
+                    #  slopes are fitted to the samples of their window
+                    self.sampler.reset(slopeWindow / slopeSamples
+                                       if self.jobSlopes else None)
+                self.jobIndex += 1
+                self.snapshots.publish(job=self.jobIndex, queued=len(self.jobs))
+                try:
+                    with tracing.span('setpoint', 'scheduler'):
+                        j.run()
+                except PsuOfflineError:  # port not recovered
+                    logger.exception('job %s not started', self.jobIndex)
+                    self.running.clear()
+                    break
                 #logger.debug('current job:{}'.format(j.getInfo()))
                 if j.what[0] == 'setv':  # only for set V job !!!
-                    t = datetime.datetime.now()
-                    stop = t + datetime.timedelta(seconds=j.how_long)
-                    while t < stop and self.running.isSet():
-                        if not self._check_condition(j):  # check stop condS
+                    stop = time.monotonic() + j.how_long
+                    outage = self.device.outage
+                    self.sampled.clear()
+                    self.wake.set()  # sample the new setpoint right now
+                    while self.running.is_set():
+                        if not self.device.online.is_set():  # job paused
+                            self.device.online.wait(period)
+                            continue
+                        stop += self.device.outage - outage  # pause time
+                        outage = self.device.outage
+                        timeout = min(period, stop - time.monotonic())
+                        if timeout <= 0:
+                            break
+                        tick = time.monotonic() + timeout
+                        if not self.sampled.wait(timeout):  # no new sample
+                            tickLateness.observe(time.monotonic() - tick)
+                            continue
+                        self.sampled.clear()
+                        with tracing.span('check', 'scheduler'):
+                            satisfied = self._check_condition(j)
+                        if not satisfied:  # check stop condS
+                            sampled = self.snapshots.current.time
+                            if sampled:
+                                stopLatency.observe(time.time() - sampled)
                             break  # premature stop the job
-                        time.sleep(period)
-                        t += datetime.timedelta(seconds=period)
+                tracing.complete('job', began, 'scheduler',
+                                 index=self.jobIndex, what=list(j.what))
                 #  for set max I and set max V there is no need to wait
                 #self.job_stats.append([j.getInfo(), statuses['c']])
 
-        if not self.running.isSet():  # emergency stpped batch work
+        if not self.running.is_set():  # emergency stpped batch work
             self._stop()
 
     def _stop(self):
         """stops scheduler"""
-        self.device.setVoltage(0.1)  # direct command to the device(reset PSU)
-        self.device.psuOff()
+        try:
+            self.device.setVoltage(0.1)  # direct command to the device(reset PSU)
+            self.device.psuOff()
+        except PsuOfflineError:
+            logger.exception('PSU not reset at the stop')
         self.running.clear()  # not running
+        self.wake.set()  # let the update thread finish
+        self.snapshots.publish(running=False, V=0.00, I=0.00, P=0.00,
+                               queued=len(self.jobs))
 
 if __name__ == '__main__':
     import voltcraftPSU
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+Simulated Voltcraft PSU serial port.
+
+Object of the SimulatedPort class behaves like the pyserial port of the real
+device (3 byte frames, see modelsDict), so that VoltcraftPSU, the scheduler
+and the server can run without lab hardware. The output of the simulated PSU
+is connected to a resistive load. Open it with `sim://<model>' port name
+(see transport.openPort), for example: sim://12010?latency=0.05&load=8
+
+SimulatedServer serves the simulated PSU over raw TCP as a serial-over-TCP
+terminal server would (socket://<host>:<port>, see netPort.py):
+
+    python -m libs.simulator -p 7000
+"""
+import time
+import struct
+import socket
+from collections import deque
+from threading import Lock, Thread
+from libs.modelsDict import commands, specValues, frame_size, models
+
+
+class SimulatedPort():
+    def __init__(self, model='12010', latency=0.02, load=10.0, timeout=0.5):
+        """Arguments:
+            model   -> (modelsDict.models key, optional) simulated PSU model
+            latency -> (float, optional) response delay of the device [s]
+            load    -> (float, optional) load resistance [Ohm]
+            timeout -> (float, optional) read timeout [s] as in pyserial"""
+        self.model = model
+        self.latency = latency
+        self.load = load
+        self.timeout = timeout
+        self.voltage = models[model]['Vmin']  # set voltage
+        self.maxVoltage = models[model]['Vmax']
+        self.maxCurrent = models[model]['Imax']
+        self.power = False
+        self.remote = False
+        self.pending = deque()  # (ready time, frame) responses on the wire
+        self._lock = Lock()
+
+    def _output(self):
+        """returns actual V, I of the PSU output"""
+        if not self.power:
+            return 0.0, 0.0
+        V = min(self.voltage, self.maxVoltage)
+        I = min(V / self.load, self.maxCurrent)
+        return min(V, I * self.load), I  # current limit drops the voltage
+
+    def write(self, data):
+        data = bytes(data)
+        mul = models[self.model]
+        for pos in range(0, len(data) - frame_size + 1, frame_size):
+            code = data[pos:pos + 1]
+            raw = data[pos + 1:pos + frame_size]
+            value = struct.unpack('>h', raw)[0]
+            if code == commands['set_voltage']:
+                self.voltage = value / 100 / mul['Vmul']
+            elif code == commands['set_max_voltage']:
+                self.maxVoltage = value / 10 / mul['Vmul']
+            elif code == commands['set_max_current']:
+                self.maxCurrent = value / 100 / mul['Imul']
+            elif code == commands['power']:
+                self.power = raw == specValues['power_on']
+            elif code == commands['keyboard']:
+                self.remote = raw == specValues['keyb_off']
+            elif code in (commands['get_voltage'], commands['get_current']):
+                V, I = self._output()
+                if code == commands['get_voltage']:
+                    answer = int(round(V * 100 * mul['Vmul']))
+                else:
+                    answer = int(round(I * 1000 * mul['Imul']))
+                with self._lock:
+                    self.pending.append((time.monotonic() + self.latency,
+                                         code + struct.pack('>h', answer)))
+        return len(data)
+
+    def read(self, size=1):
+        """returns pending response or device ID frame (the PSU broadcasts
+        its ID when there is nothing else to send)"""
+        with self._lock:
+            ready, frame = self.pending.popleft() if self.pending else (
+                time.monotonic() + self.latency,
+                models[self.model]['init'] + b'\x00')
+        delay = ready - time.monotonic()
+        if delay > self.timeout:  # response will not make it in time
+            time.sleep(self.timeout)
+            with self._lock:
+                self.pending.appendleft((ready, frame))
+            return b''
+        if delay > 0:
+            time.sleep(delay)
+        return frame[:size]
+
+    def flushInput(self):
+        pass  # responses are generated after the request, nothing to drop
+
+    def flushOutput(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SimulatedServer():
+    """simulated PSU behind a raw TCP terminal server, one client at a time,
+    state of the PSU survives reconnects"""
+    def __init__(self, port, host='127.0.0.1', **options):
+        """Arguments:
+            port, host -> (int, string) address of the server
+            options    -> SimulatedPort keyword arguments"""
+        self.device = SimulatedPort(**options)
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()
+        self.client = None
+
+    def serve(self):
+        """serves clients until closed"""
+        while True:
+            try:
+                client, address = self.server.accept()
+            except OSError:  # closed
+                return
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.client = client
+            receiver = Thread(target=self._receive, args=(client,),
+                              daemon=True, name='simulator')
+            receiver.start()
+            try:
+                while True:  # responses and ID frames
+                    client.sendall(self.device.read(frame_size))
+            except OSError:
+                pass
+            client.close()
+            receiver.join()
+
+    def _receive(self, client):
+        data = b''
+        try:
+            while True:
+                chunk = client.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+                size = len(data) - len(data) % frame_size  # whole frames
+                self.device.write(data[:size])
+                data = data[size:]
+        except OSError:
+            pass
+        client.close()  # stops the sender too
+
+    def drop(self):
+        """breaks the connection of the current client (tests)"""
+        try:
+            self.client.shutdown(socket.SHUT_RDWR)
+        except (AttributeError, OSError):  # no client or closed
+            pass
+
+    def close(self):
+        self.server.close()
+        self.drop()
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Simulated PSU on TCP')
+    parser.add_argument('-p', '--port', type=int, default=7000,
+                        help='TCP port (default 7000)')
+    parser.add_argument('-t', '--host', default='127.0.0.1',
+                        help='host (default 127.0.0.1)')
+    parser.add_argument('-m', '--model', default='12010',
+                        choices=sorted(models), help='PSU model')
+    parser.add_argument('-l', '--latency', type=float, default=0.02,
+                        help='response delay [s] (default 0.02)')
+    parser.add_argument('-r', '--load', type=float, default=10.0,
+                        help='load resistance [Ohm] (default 10)')
+    args = parser.parse_args()
+    server = SimulatedServer(args.port, args.host, model=args.model,
+                             latency=args.latency, load=args.load)
+    print('simulated PSU {} at socket://{}:{}'.format(args.model,
+                                                      *server.address))
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        server.close()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Rolling least-squares slope (dV/dt, dI/dt) of PSU samples.
+
+Samples of the last `window' seconds are kept in a fixed-size ring buffer
+together with the sums needed by the least-squares fit (n, St, Sx, Stt,
+Stx), so adding a sample and reading the slope take O(1) time. Times are
+relative to `origin' (job start) and the sums are recomputed from the
+buffer once per `capacity' samples, rounding errors of the rolling updates
+never accumulate.
+"""
+
+
+class RollingSlope():
+    """slope [unit/s] of samples from the last `window' seconds"""
+    def __init__(self, window=60.0, capacity=256, origin=0.0):
+        """Arguments:
+            window   -> (float, optional) time window [s]
+            capacity -> (int, optional) max number of samples in the window,
+                        the oldest are dropped earlier if exceeded
+            origin   -> (float, optional) time [s] subtracted from sample
+                        times (precision of the sums)"""
+        self.window = window
+        self.capacity = capacity
+        self.origin = origin
+        self.ts = [0.0] * capacity
+        self.xs = [0.0] * capacity
+        self.head = 0      # index of the oldest sample
+        self.count = 0
+        self.added = 0
+        self.full = False  # samples span the whole window
+        self.st = self.sx = self.stt = self.stx = 0.0
+
+    def add(self, t, x):
+        """adds sample `x' taken at time `t' [s]"""
+        t -= self.origin
+        if self.count == self.capacity:
+            self._evict()
+            self.full = True
+        index = (self.head + self.count) % self.capacity
+        self.ts[index] = t
+        self.xs[index] = x
+        self.count += 1
+        self.st += t
+        self.sx += x
+        self.stt += t * t
+        self.stx += t * x
+        while self.count > 2 and t - self.ts[self.head] > self.window:
+            self._evict()
+            self.full = True
+        self.added += 1
+        if self.added % self.capacity == 0:
+            self._recompute()
+
+    def _evict(self):
+        t, x = self.ts[self.head], self.xs[self.head]
+        self.st -= t
+        self.sx -= x
+        self.stt -= t * t
+        self.stx -= t * x
+        self.head = (self.head + 1) % self.capacity
+        self.count -= 1
+
+    def _recompute(self):
+        self.st = self.sx = self.stt = self.stx = 0.0
+        for n in range(self.count):
+            index = (self.head + n) % self.capacity
+            t, x = self.ts[index], self.xs[index]
+            self.st += t
+            self.sx += x
+            self.stt += t * t
+            self.stx += t * x
+
+    @property
+    def slope(self):
+        """least-squares slope or None until the samples span the window"""
+        if not self.full:
+            return None
+        n = self.count
+        denominator = n * self.stt - self.st * self.st
+        if denominator <= 0:
+            return None
+        return (n * self.stx - self.st * self.sx) / denominator
+
+    def predict(self, t):
+        """returns value of the fitted line at time `t' [s] (None until the
+        samples span the window)"""
+        slope = self.slope
+        if slope is None:
+            return None
+        n = self.count
+        return self.sx / n + slope * (t - self.origin - self.st / n)
+
+if __name__ == '__main__':
+    import random
+    slope = RollingSlope(window=60)
+    for n in range(3600):  # charging curve flattening after 30 min
+        t = n * 2.0
+        slope.add(t, 12 + min(t, 1800) / 1800 + random.gauss(0, 0.002))
+        if n % 300 == 0:
+            print('{:>6.0f} s  dV/dt = {}'.format(t, slope.slope))
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""
+Versioned snapshots of the PSU server state for read-only observers.
+
+The scheduler publishes a new immutable snapshot whenever the state changes
+(new sample, next job, start or stop of the run). Readers only fetch the
+current snapshot reference, so they never wait for publishers, never touch
+the device and never take any lock.
+"""
+from collections import namedtuple
+from threading import Lock
+
+
+Snapshot = namedtuple('Snapshot', ('version', 'time', 'running', 'V', 'I',
+                                   'P', 'job', 'queued', 'stats', 'online'))
+
+
+class SnapshotCache():
+    """holder of the latest snapshot"""
+    def __init__(self):
+        self._lock = Lock()  # serializes publishers only
+        self.current = Snapshot(version=0, time=0.0, running=False, V=0.00,
+                                I=0.00, P=0.00, job=-1, queued=0,
+                                stats=None, online=True)
+
+    def publish(self, **changes):
+        """publishes new version of the snapshot
+
+        Arguments:
+            changes -> Snapshot fields to change (version excluded)
+
+        Returns:
+            new Snapshot object"""
+        with self._lock:
+            old = self.current
+            self.current = old._replace(version=old.version + 1, **changes)
+        return self.current
+
+    def get(self, since=0):
+        """gets current snapshot
+
+        Arguments:
+            since -> (int, optional) version already known by the reader
+
+        Returns:
+            Snapshot object or None if there is no newer version than `since'"""
+        snap = self.current  # atomic reference read
+        if snap.version <= since:
+            return None
+        return snap
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Shared-memory ring of PSU telemetry samples.
+
+The device process (see deviceProcess.py) appends every sample, any process
+of the host attaches the ring by its name and reads the samples directly
+from the shared buffer (struct.unpack_from, no pipes, no copies of the
+ring, no locks):
+    header -> `<4sIQ': MAGIC, capacity, number of samples written
+    record -> `<QddddQ': sequence number (1, 2, ...), time, V, I, P,
+              job index + 1 (0 before the first job)
+The single writer clears the sequence number of the record, fills the
+payload, sets the sequence number and then publishes the record by the
+header counter. The reader checks the sequence number before and after the
+payload (seqlock), a record overwritten while it is read is skipped (reader
+lapped by the writer).
+
+    python -m libs.telemetryRing voltlog-50000   # tail samples of a server
+"""
+import struct
+from multiprocessing import shared_memory
+
+MAGIC = b'VLTR'
+_header = struct.Struct('<4sIQ')
+_record = struct.Struct('<QddddQ')
+_sequence = struct.Struct('<Q')     # first field of the record
+_payload = struct.Struct('<ddddQ')  # rest of the record
+
+
+class TelemetryRingError(Exception):
+    pass
+
+
+class TelemetryRing():
+    def __init__(self, name, capacity=None, untrack=True):
+        """creates (with `capacity') or attaches (without) the ring
+
+        Arguments:
+            name     -> (string) shared memory name
+            capacity -> (int, optional) number of samples kept, creates
+                        new ring (owner unlinks it, see close)
+            untrack  -> (boolean, optional) reader does not remove the ring
+                        at exit (see _untrack), False in processes sharing
+                        the resource tracker of the owner (spawned)"""
+        self.owner = capacity is not None
+        if self.owner:
+            size = _header.size + capacity * _record.size
+            try:
+                self.memory = shared_memory.SharedMemory(name, create=True,
+                                                         size=size)
+            except FileExistsError:  # left by crashed owner
+                shared_memory.SharedMemory(name).unlink()
+                self.memory = shared_memory.SharedMemory(name, create=True,
+                                                         size=size)
+            _header.pack_into(self.memory.buf, 0, MAGIC, capacity, 0)
+        else:
+            self.memory = shared_memory.SharedMemory(name)
+            if untrack:
+                _untrack(self.memory)
+            magic, capacity, count = _header.unpack_from(self.memory.buf, 0)
+            if magic != MAGIC:
+                self.memory.close()
+                raise TelemetryRingError('Not a telemetry ring: {}'.format(
+                                         name))
+        self.name = name
+        self.capacity = capacity
+
+    @property
+    def count(self):
+        """number of samples written"""
+        return _header.unpack_from(self.memory.buf, 0)[2]
+
+    def append(self, t, V, I, P, job=-1):
+        """writes sample (single writer only)"""
+        count = self.count + 1
+        offset = _header.size + (count - 1) % self.capacity * _record.size
+        buf = self.memory.buf
+        _sequence.pack_into(buf, offset, 0)  # record being written
+        _payload.pack_into(buf, offset + _sequence.size, t, V, I, P, job + 1)
+        _sequence.pack_into(buf, offset, count)
+        _header.pack_into(self.memory.buf, 0, MAGIC, self.capacity, count)
+
+    def read(self, since=0):
+        """returns samples newer than sequence number `since'
+
+        Arguments:
+            since -> (int, optional) last sequence number known by the reader
+
+        Returns:
+            list of (sequence, time, V, I, P, job) tuples, at most capacity
+            of the latest samples"""
+        count = self.count
+        first = max(since + 1, count - self.capacity + 1, 1)
+        samples = []
+        buf = self.memory.buf
+        for sequence in range(first, count + 1):
+            offset = _header.size + (sequence - 1) % self.capacity * \
+                _record.size
+            if _sequence.unpack_from(buf, offset)[0] != sequence:
+                continue  # overwritten (or being written)
+            t, V, I, P, job = _payload.unpack_from(buf,
+                                                   offset + _sequence.size)
+            if _sequence.unpack_from(buf, offset)[0] != sequence:
+                continue  # torn: overwritten during the unpack
+            samples.append((sequence, t, V, I, P, job - 1))
+        return samples
+
+    def close(self):
+        """detaches the ring, the owner also removes it"""
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def _untrack(memory):
+    """readers must not remove the ring at their exit (resource tracker of
+    Python < 3.13 unlinks every attached shared memory)"""
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(memory._name, 'shared_memory')
+    except (ImportError, AttributeError, KeyError):
+        pass
+
+if __name__ == '__main__':
+    import sys
+    import time
+    ring = TelemetryRing(sys.argv[1] if len(sys.argv) > 1 else
+                         'voltlog-50000')
+    since = max(ring.count - 10, 0)
+    try:
+        while True:
+            for sample in ring.read(since):
+                since = sample[0]
+                print('{:>8} {:.3f} V={:.2f} I={:.2f} P={:.2f} job={}'.format(
+                      *sample))
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        ring.close()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+"""
+Lightweight tracing spans exported to the Chrome/Perfetto trace format.
+
+Spans (complete `X' events with wall clock time stamps in microseconds)
+are kept in a bounded in-memory buffer of the process. Tracing is off by
+default and toggled at runtime (enable), a disabled span() costs a global
+flag check and returns the shared no-op span. Spans carry the correlation
+id of the thread (correlate, bind):
+    - the GUI proxy (see rpcClient.tracedProxy) gives every remote call a
+      new id, sent by Pyro4 in current_context.correlation_id, and starts
+      a flow arrow from its `rpc' span
+    - server methods (see traced) take the id of the Pyro4 request and end
+      the arrow, nested spans (device process commands, PSU I/O, the
+      scheduler started by the call) carry the same id
+Traces of the processes (GUI, server, device process) share the clock, so
+merged they show one timeline:
+
+    python -m libs.tracing on -s psuhost:50000    # start tracing
+    python -m libs.tracing dump -s psuhost:50000 trace.json
+    python -m libs.tracing merge all.json gui.json trace.json
+
+Open the file in https://ui.perfetto.dev or chrome://tracing.
+"""
+import os
+import sys
+import time
+import functools
+import threading
+from collections import deque
+
+enabled = False
+_events = deque(maxlen=200000)
+_threads = {}  # (pid, tid): thread name
+_local = threading.local()
+_offset = time.time() - time.perf_counter()  # perf_counter -> epoch
+
+
+class TracingError(Exception):
+    pass
+
+
+def enable(on=True, capacity=None):
+    """switches tracing on (off)
+
+    Arguments:
+        on       -> (boolean, optional) new state
+        capacity -> (int, optional) number of events kept (default 200000)"""
+    global enabled, _events
+    if capacity is not None:
+        _events = deque(_events, maxlen=capacity)
+    enabled = bool(on)
+
+
+def clear():
+    _events.clear()
+    _threads.clear()
+
+
+def clock():
+    """returns time stamp for complete()"""
+    return time.perf_counter()
+
+
+def correlation():
+    """returns correlation id of the thread (hex string) or None"""
+    return getattr(_local, 'cid', None)
+
+
+def correlate(cid):
+    """sets correlation id of the thread, returns the previous one"""
+    previous = getattr(_local, 'cid', None)
+    _local.cid = cid
+    return previous
+
+
+def bind(function):
+    """returns `function' running with the correlation id of the caller
+    (target of a new thread)"""
+    cid = correlation()
+    if cid is None:
+        return function
+
+    @functools.wraps(function)
+    def bound(*args, **kwargs):
+        correlate(cid)
+        return function(*args, **kwargs)
+    return bound
+
+
+def _record(event):
+    thread = threading.current_thread()
+    event['pid'] = pid = os.getpid()
+    event['tid'] = thread.ident
+    if (pid, thread.ident) not in _threads:
+        _threads[(pid, thread.ident)] = thread.name
+    _events.append(event)
+
+
+def complete(name, start, cat='voltlog', **args):
+    """records span from `start' (see clock) to now, e.x. of a loop body
+    too long for the `with' statement"""
+    if not enabled:
+        return
+    end = time.perf_counter()
+    cid = correlation()
+    if cid is not None:
+        args['cid'] = cid
+    _record({'name': name, 'cat': cat, 'ph': 'X',
+             'ts': (start + _offset) * 1e6, 'dur': (end - start) * 1e6,
+             'args': args})
+
+
+def flow(cid, start=True, cat='rpc'):
+    """records end of the flow arrow `cid' (client to server), bound to the
+    span enclosing it"""
+    if not enabled:
+        return
+    event = {'name': 'rpc', 'cat': cat, 'ph': 's' if start else 'f',
+             'id': cid, 'ts': (time.perf_counter() + _offset) * 1e6}
+    if not start:
+        event['bp'] = 'e'  # enclosing slice
+    _record(event)
+
+
+class _Span():
+    __slots__ = ('name', 'cat', 'args', 'start')
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        if kind is not None:
+            self.args['error'] = kind.__name__
+        complete(self.name, self.start, self.cat, **self.args)
+        return False
+
+
+class _NoSpan():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        return False
+
+_noSpan = _NoSpan()
+
+
+def span(name, cat='voltlog', **args):
+    """returns context manager of the span `name' (no-op when disabled)
+
+    Arguments:
+        name -> (string) span name
+        cat  -> (string, optional) category (process part: gui, server,
+                scheduler, psu ...)
+        args -> values shown with the span"""
+    if not enabled:
+        return _noSpan
+    return _Span(name, cat, args)
+
+
+class _TracedLock():
+    __slots__ = ('lock', 'cat')
+
+    def __init__(self, lock, cat):
+        self.lock = lock
+        self.cat = cat
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self.lock.acquire()
+        complete('lock wait', start, self.cat)
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        self.lock.release()
+        return False
+
+
+def locked(lock, cat='psu'):
+    """returns context manager acquiring `lock', the wait for it is traced"""
+    if not enabled:
+        return lock
+    return _TracedLock(lock, cat)
+
+
+def _requestCorrelation():
+    """correlation id of the Pyro4 request served by the thread"""
+    pyro = sys.modules.get('Pyro4')
+    if pyro is None:
+        return None
+    cid = pyro.current_context.correlation_id
+    return cid.hex if cid else None
+
+
+def traced(cat):
+    """class decorator, traces every public method of the class in spans
+    `Class.method', a method serving Pyro4 request takes the correlation
+    id of the request"""
+    def decorator(cls):
+        for name, method in list(vars(cls).items()):
+            if name.startswith('_') or not callable(method):
+                continue
+            setattr(cls, name, _traced(method, '{}.{}'.format(cls.__name__,
+                                                               name), cat))
+        return cls
+    return decorator
+
+
+def _traced(method, name, cat):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return method(*args, **kwargs)
+        cid = _requestCorrelation()
+        previous = correlate(cid or correlation())
+        try:
+            with _Span(name, cat, {}):
+                if cid:
+                    flow(cid, start=False)
+                return method(*args, **kwargs)
+        finally:
+            correlate(previous)
+    return wrapper
+
+
+def rpcSpan(method):
+    """returns context manager of the client side remote call: new
+    correlation id of the Pyro4 call, span `rpc method' and flow start"""
+    if not enabled:
+        return _noSpan
+    return _RpcSpan(method)
+
+
+class _RpcSpan(_Span):
+    __slots__ = ('previous',)
+
+    def __init__(self, method):
+        _Span.__init__(self, 'rpc ' + method, 'rpc', {})
+        self.previous = None
+
+    def __enter__(self):
+        import uuid
+        import Pyro4
+        cid = uuid.uuid4()
+        Pyro4.current_context.correlation_id = cid
+        self.previous = correlate(cid.hex)
+        _Span.__enter__(self)
+        flow(cid.hex)
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        import Pyro4
+        _Span.__exit__(self, kind, value, traceback)
+        Pyro4.current_context.correlation_id = None
+        correlate(self.previous)
+        return False
+
+
+def events(process=None):
+    """returns recorded events with the thread (and `process') name
+    metadata events of the Chrome trace format"""
+    recorded = list(_events)
+    meta = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+             'args': {'name': name}}
+            for (pid, tid), name in list(_threads.items())]
+    if process:
+        meta.append({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+                     'args': {'name': process}})
+    return meta + recorded
+
+
+def export(path, traceEvents):
+    """writes events in the Chrome/Perfetto trace JSON format"""
+    import json  # imported by exporting processes only
+    with open(path, mode='w') as out:
+        json.dump({'traceEvents': traceEvents, 'displayTimeUnit': 'ms'},
+                  out)
+
+
+def load(path):
+    """returns events of the trace file"""
+    import json
+    try:
+        with open(path) as trace:
+            data = json.load(trace)
+    except (OSError, ValueError) as error:
+        raise TracingError('Can`t read trace {}: {}'.format(path, error))
+    return data['traceEvents'] if isinstance(data, dict) else data
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Tracing of the PSU server')
+    parser.add_argument('command', choices=('on', 'off', 'dump', 'merge'))
+    parser.add_argument('files', nargs='*',
+                        help='dump: output file, merge: output and input '
+                             'files')
+    parser.add_argument('-s', '--server', default='localhost:50000',
+                        help='PSU server host:port (default '
+                             'localhost:50000)')
+    parser.add_argument('-i', '--psuid', default='psuServer',
+                        help='Pyro4 id of the server (default psuServer)')
+    parser.add_argument('-c', '--clear', action='store_true',
+                        help='dump: clear the server trace buffers')
+    args = parser.parse_intermixed_args()
+    if args.command == 'merge':
+        if len(args.files) < 2:
+            parser.error('merge needs output and input files')
+        merged = []
+        for path in args.files[1:]:
+            merged.extend(load(path))
+        export(args.files[0], merged)
+        return
+    if args.command == 'dump' and len(args.files) != 1:
+        parser.error('dump needs output file')
+    import Pyro4
+    host, _, port = args.server.partition(':')
+    with Pyro4.Proxy('PYRO:{}@{}:{}'.format(args.psuid, host,
+                                           port or 50000)) as server:
+        if args.command == 'dump':
+            traceEvents = server.getTrace(args.clear)
+            export(args.files[0], traceEvents)
+            print('{} events written to {}'.format(len(traceEvents),
+                                                   args.files[0]))
+        else:
+            server.setTracing(args.command == 'on')
+
+if __name__ == '__main__':
+    main()
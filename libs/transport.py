@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Serial transports of the Voltcraft PSU.
+
+The port name passed to VoltcraftPSU selects the transport:
+    /dev/ttyUSB0, COM3, ...  -> local serial port (pyserial)
+    sim://<model>[?options]  -> simulated PSU (see libs/simulator.py),
+                                options: latency, load
+    replay://<file>[?options]-> captured traffic (see libs/capture.py),
+                                options: speed
+    socket://<host>:<port>[?options], rfc2217://<host>:<port>[?options]
+                             -> serial-over-TCP terminal server (see
+                                libs/netPort.py), options: backoff
+Traffic of any transport can be captured into a file (see libs/capture.py).
+"""
+
+
+class TransportError(Exception):
+    pass
+
+
+def _options(query, **types):
+    """converts url query into keyword arguments of known `types'"""
+    from urllib.parse import parse_qsl
+    options = {}
+    for key, value in parse_qsl(query):
+        if key not in types:
+            raise TransportError('Unknown port option: {}'.format(key))
+        options[key] = types[key](value)
+    return options
+
+
+def stablePath(name, directory='/dev/serial/by-id'):
+    """returns stable path of the local serial port `name' (by-id link of
+    the USB adapter, the same after replug even if the ttyUSB number
+    changes) or `name' if there is no such link (urls, other systems)"""
+    import os
+    if '://' in name or not os.path.isdir(directory):
+        return name
+    real = os.path.realpath(name)
+    for link in sorted(os.listdir(directory)):
+        path = os.path.join(directory, link)
+        if os.path.realpath(path) == real:
+            return path
+    return name
+
+
+def openPort(name, timeout=0.5, capture=None):
+    """opens serial transport of the PSU
+
+    Arguments:
+        name    -> (string) port name or url (see module docs)
+        timeout -> (float, optional) read timeout [s]
+        capture -> (string, optional) capture file of the traffic
+
+    Returns:
+        object with pyserial-like read, write, flushInput, flushOutput and
+        close methods"""
+    port = _open(name, timeout)
+    if capture:
+        from libs.capture import CapturePort
+        port = CapturePort(port, capture)
+    return port
+
+
+def _open(name, timeout):
+    from urllib.parse import urlsplit  # deferred: server startup time
+    url = urlsplit(name)
+    if url.scheme == 'sim':
+        from libs.simulator import SimulatedPort
+        options = _options(url.query, latency=float, load=float)
+        return SimulatedPort(model=url.netloc or '12010', timeout=timeout,
+                             **options)
+    if url.scheme in ('socket', 'rfc2217'):
+        from libs.netPort import NetPort
+        options = _options(url.query, backoff=float)
+        return NetPort(url, timeout=timeout, **options)
+    if url.scheme == 'replay':
+        from libs.capture import ReplayPort
+        options = _options(url.query, speed=float)
+        return ReplayPort(url.netloc + url.path, timeout=timeout, **options)
+    import serial
+    return serial.Serial(port=name, baudrate=2400, bytesize=serial.EIGHTBITS,
+                         timeout=timeout, parity=serial.PARITY_NONE,
+                         stopbits=serial.STOPBITS_ONE)
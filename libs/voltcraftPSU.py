@@ -1,9 +1,14 @@
 #!/usr/bin/env python
 import struct
-import serial
 import time
+import logging
 from libs.modelsDict import commands, specValues, frame_size, models
-from threading import Lock
+from threading import Lock, Event
+import libs.metrics as metrics
+import libs.transport as transport
+import libs.tracing as tracing
+
+logger = logging.getLogger(__name__)
 
 
 #error clases
@@ -23,32 +28,168 @@ class PsuOfflineError(Exception):
     pass
 
 
+serialRtt = metrics.histogram('psu_serial_rtt_seconds',
+                              'Serial query round trip time', 'command')
+serialRetries = metrics.counter('psu_serial_retries_total',
+                                'Reads repeated after no valid reply',
+                                'command')
+serialTimeouts = metrics.counter('psu_serial_timeouts_total',
+                                 'Queries given up (PsuOfflineError)',
+                                 'command')
+framesDiscarded = metrics.counter('psu_serial_frames_discarded_total',
+                                  'Empty, short or unexpected frames read',
+                                  'command')
+_queries = ('get_voltage', 'get_current', 'device')
+_rtt = {com: serialRtt.labels(com) for com in _queries[:2]}
+_retries = {com: serialRetries.labels(com) for com in _queries}
+_timeouts = {com: serialTimeouts.labels(com) for com in _queries}
+_discarded = {com: framesDiscarded.labels(com) for com in _queries}
+portRecoveries = metrics.counter('psu_port_recoveries_total',
+                                 'PSU ports reopened after the port loss')
+recoveryTime = metrics.histogram('psu_port_recovery_seconds',
+                                 'Time from the port loss to the restored '
+                                 'PSU state',
+                                 bounds=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0,
+                                         30.0, 60.0))
+#commands restored after the port recovery (in this order), last sent frames
+_restored = ('keyboard', 'set_max_voltage', 'set_max_current', 'set_voltage',
+             'power')
+_restoredCodes = {commands[name]: name for name in _restored}
+
+
 class VoltcraftPSU():
     _lock = Lock()
 
-    def __init__(self, volt_port):
+    def __init__(self, volt_port, capture=None):
         """voltcraft psp PSU constructor.
 
         Arguments:
-            volt_port->(string) serial device port ID ,for example:/dev/ttyUSB0"""
-        self.device = serial.Serial(port=volt_port, baudrate=2400,
-                                    bytesize=serial.EIGHTBITS, timeout=0.5,
-                                    parity=serial.PARITY_NONE,
-                                    stopbits=serial.STOPBITS_ONE)
+            volt_port->(string) serial device port ID ,for example:/dev/ttyUSB0
+                       or transport url (see transport.openPort)
+            capture  ->(string, optional) capture file of the serial traffic
+                       (see capture.CapturePort)
+
+        INFO: lost port (unplugged USB adapter) is reopened by its stable
+              /dev/serial/by-id path, see _recover"""
+        self.port = transport.stablePath(volt_port)
+        self.capture = capture
+        self.device = transport.openPort(volt_port, timeout=0.5,
+                                         capture=capture)
         self.model = 'Unknown'
         self.myTimeout = 4  # after 4 s of idle state class signaling offline
+        self.recoverTimeout = 60  # port recovery attempts before giving up
+        self.sent = {}            # last frames of the _restored commands
+        self.online = Event()     # cleared during the port recovery
+        self.online.set()
+        self.outage = 0.0         # total time [s] of port recoveries
+        self.listeners = []       # functions called with online flag
 
     def _read(self, *args, **kwargs):
-        """thin serial read wrapper"""
-        self.device.flushInput()
-        self.device.flushOutput()
-        return self.device.read(*args, **kwargs)
+        """thin serial read wrapper (recovers lost port)"""
+        try:
+            with tracing.span('serial read', 'psu'):
+                self.device.flushInput()
+                self.device.flushOutput()
+                return self.device.read(*args, **kwargs)
+        except OSError as error:  # serial.SerialException: port lost
+            self._recover(error)
+            return b''  # callers read again
+
+    def _write(self, data):
+        """thin serial write wrapper (recovers lost port)"""
+        name = _restoredCodes.get(data[:1])
+        if name:
+            self.sent[name] = data  # restored after the port recovery
+        try:
+            with tracing.span('serial write', 'psu'):
+                self.device.flushInput()
+                self.device.flushOutput()
+                return self.device.write(data)
+        except OSError as error:
+            #  restored commands are sent again, other data after them
+            self._recover(error, b'' if name else data)
+            return len(data)
+
+    def _notify(self, online):
+        for listener in self.listeners:
+            listener(online)
+
+    def _recover(self, error, pending=b''):
+        """reopens lost port (by its stable path), checks the model of the PSU
+        and restores the last commanded keyboard mode, max V, max I, V and
+        power state. Called with the lock held, so other calls wait for the
+        end of the recovery. Port lost again during the restore is reopened
+        again.
 
-    def _write(self, *args, **kwargs):
-        """thin serial write wrapper"""
-        self.device.flushInput()
-        self.device.flushOutput()
-        return self.device.write(*args, **kwargs)
+        Arguments:
+            error   -> exception of the lost port
+            pending -> (bytes, optional) frame sent after the restored ones
+
+        Raises:
+            PsuOfflineError if the port is not back after `recoverTimeout'"""
+        logger.warning('PSU port %s lost: %s', self.port, error)
+        lost = time.monotonic()
+        self.online.clear()
+        self._notify(False)
+        try:
+            (self.device.port if self.capture else self.device).close()
+        except OSError:
+            pass
+        delay = 0.1
+        while True:
+            port = None
+            try:
+                port = transport.openPort(self.port, timeout=0.5)
+                if self._identify(port) == self.model:
+                    if self.capture:
+                        self.device.port = port  # keeps the capture file
+                    else:
+                        self.device = port
+                    for name in _restored:
+                        if name in self.sent:
+                            self.device.write(self.sent[name])
+                    if pending:
+                        self.device.write(pending)
+                    break
+                port.close()
+                logger.warning('PSU on port %s is not %s', self.port,
+                               self.model)
+            except OSError as reopenError:
+                logger.debug('PSU port %s reopen: %s', self.port, reopenError)
+                if port is not None:
+                    try:
+                        port.close()
+                    except OSError:
+                        pass
+            if time.monotonic() - lost > self.recoverTimeout:
+                raise PsuOfflineError('PSU port {} lost'.format(self.port))
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+        elapsed = time.monotonic() - lost
+        self.outage += elapsed
+        portRecoveries.inc()
+        recoveryTime.observe(elapsed)
+        logger.warning('PSU port %s recovered after %.2f s', self.port,
+                       elapsed)
+        self.online.set()
+        self._notify(True)
+
+    def _identify(self, port):
+        """returns model ID broadcast on the `port' or None"""
+        stop = time.time() + self.myTimeout
+        while time.time() < stop:
+            frame = port.read(frame_size)
+            if len(frame) == frame_size and frame[0] == 178:  # '\xb2'
+                return self._modelOf(frame)
+        return None
+
+    @staticmethod
+    def _modelOf(frame):
+        """returns model of the ID `frame' or None"""
+        for model in models:
+            if frame[:2] == models[model]['init']:
+                return model
+        return None
 
     def _testDelta(self, testVal, targetVal, delta=0.1):
         """tests if output value fits within error borders -+0.1[V/A]
@@ -74,7 +215,7 @@ class VoltcraftPSU():
         if value < models[self.model]['Vmin'] or value > (40 * models[self.model]['Imul']):
             raise ValueOutOfRange('Voltage is out of range: {}'.format(value))
         v = struct.pack('>h', int(round(value * 100 * models[self.model]['Vmul'], 0)))
-        with VoltcraftPSU._lock:
+        with tracing.locked(VoltcraftPSU._lock):
             self._write(commands['set_voltage'] + v)
         """
         #  unfortunately voltcraft PSU responsivness is to low to use section
@@ -103,7 +244,7 @@ class VoltcraftPSU():
         if value < models[self.model]['Imin'] or value > (40 * models[self.model]['Imul']):
             raise ValueOutOfRange('Voltage is out of range: {}'.format(value))
         v = struct.pack('>h', int(round(value * 10 * models[self.model]['Vmul'], 0)))
-        with VoltcraftPSU._lock:
+        with tracing.locked(VoltcraftPSU._lock):
             self._write(commands['set_max_voltage'] + v)
 
     def setMaxCurrent(self, value):
@@ -116,30 +257,52 @@ class VoltcraftPSU():
         if value < models[self.model]['Imin'] or value > (5 * models[self.model]['Vmul']):
             raise ValueOutOfRange('Current is out of range: {}'.format(value))
         v = struct.pack('>h', int(round(value * 100 * models[self.model]['Imul'], 0)))
-        with VoltcraftPSU._lock:
+        with tracing.locked(VoltcraftPSU._lock):
             self._write(commands['set_max_current'] + v)
 
-    def getVoltage(self):
-        """gets voltage of the voltcraft PSU.
+    def _query(self, command):
+        """sends read request and waits for the response frame.
 
         Arguments:
+            command -> (modelsDict.commands key) `get_voltage' or `get_current'
 
         Returns:
-            float, 2 decimal places"""
+            int, raw value of the response frame"""
+        with tracing.span(command, 'psu'):
+            return self._request(command)
+
+    def _request(self, command):
+        """write and read loop of _query"""
+        code = commands[command]
         now = time.time()
         stop = now + self.myTimeout
         while now < stop:
-            with VoltcraftPSU._lock:
-                self._write(commands['get_voltage'] + specValues['read'])
+            sent = time.perf_counter()
+            with tracing.locked(VoltcraftPSU._lock):
+                self._write(code + specValues['read'])
             while now < stop:  # wait for response
-                with VoltcraftPSU._lock:
+                with tracing.locked(VoltcraftPSU._lock):
                     frame = self._read(frame_size)
-                if len(frame) == frame_size and frame[0] == commands['get_voltage'][0]:
-                    value = frame[1:]
-                    return round((struct.unpack('>h', value)[0]) / 100 / models[self.model]['Vmul'], 2)
+                if len(frame) == frame_size and frame[0] == code[0]:
+                    _rtt[command].observe(time.perf_counter() - sent)
+                    return struct.unpack('>h', frame[1:])[0]
+                if frame:
+                    _discarded[command].inc()
+                _retries[command].inc()  # read again
                 now = time.time()
             now = time.time()
-        raise PsuOfflineError('getVoltage timeout error')
+        _timeouts[command].inc()
+        raise PsuOfflineError('{} timeout error'.format(command))
+
+    def getVoltage(self):
+        """gets voltage of the voltcraft PSU.
+
+        Arguments:
+
+        Returns:
+            float, 2 decimal places"""
+        value = self._query('get_voltage')
+        return round(value / 100 / models[self.model]['Vmul'], 2)
 
     def getCurrent(self):
         """gets current of the voltcraft PSU.
@@ -148,20 +311,8 @@ class VoltcraftPSU():
 
         Returns:
             float, 2 decimal places"""
-        now = time.time()
-        stop = now + self.myTimeout
-        while now < stop:
-            with VoltcraftPSU._lock:
-                self._write(commands['get_current'] + specValues['read'])
-            while now < stop:  # wait for response
-                with VoltcraftPSU._lock:
-                    frame = self._read(frame_size)
-                if len(frame) == frame_size and frame[0] == commands['get_current'][0]:
-                    value = frame[1:]
-                    return round((struct.unpack('>h', value)[0]) / 1000 / models[self.model]['Imul'], 2)
-                now = time.time()
-            now = time.time()
-        raise PsuOfflineError('getCurrent timeout error')
+        value = self._query('get_current')
+        return round(value / 1000 / models[self.model]['Imul'], 2)
 
     def getID(self):
         """checks PSU model and populates self.model variable.
@@ -173,21 +324,19 @@ class VoltcraftPSU():
         now = time.time()
         stop = now + self.myTimeout
         while now < stop:  # my timeout
-            with VoltcraftPSU._lock:
+            with tracing.locked(VoltcraftPSU._lock):
                 frame = self._read(frame_size)
             if len(frame) == frame_size and frame[0] == 178:  # '\xb2'
                 break
+            if frame:
+                _discarded['device'].inc()
+            _retries['device'].inc()
             now = time.time()
 
-        frame = frame[:2]
-        if frame == models['1405']['init']:
-            self.model = '1405'
-        elif frame == models['12010']['init']:
-            self.model = '12010'
-        elif frame == models['1803']['init']:
-            self.model = '1803'
+        self.model = self._modelOf(frame) or self.model
         if self.model in models:
             return self.model
+        _timeouts['device'].inc()
         msg = 'getID timeout error\ncheck connection with PSU or restart PSU'
         raise PsuOfflineError(msg)
 
@@ -214,10 +363,10 @@ class VoltcraftPSU():
             com = "Invalid arg:{}, should be `power_on[off]' or `keyb_on[off]' only".format(what)
             raise ArgumentError(com)
         if what.find('power') == 0:
-            with VoltcraftPSU._lock:
+            with tracing.locked(VoltcraftPSU._lock):
                 self._write(commands['power'] + specValues[what])
         if what.find('keyb') == 0:
-            with VoltcraftPSU._lock:
+            with tracing.locked(VoltcraftPSU._lock):
                 self._write(commands['keyboard'] + specValues[what])
 
     def manualMode(self):
@@ -247,6 +396,7 @@ class VoltcraftPSU():
         self._switch('power_off')
 
 if __name__ == '__main__':
+    import serial
     try:
         port = '/dev/ttyUSB0'
         psu = VoltcraftPSU(port)  # | first step of initialization
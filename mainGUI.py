@@ -1,19 +1,21 @@
 #!/usr/bin/env python
 import tkinter as tk
 from tkinter import ttk
-import Pyro4
 import libs.stylesDict as st
+import libs.rpcClient as rpc
 from tkinter import messagebox
 import logging
 import time
 import datetime
-import threading
 from tkinter import filedialog as fdi
 import os
-import pickle
-from tkinter import TclError
-from collections import deque
-import libs.plotFrame as plot
+import socket
+from libs.history import History
+from libs.jobModel import JobModel
+from libs.jobView import JobView
+import libs.programFile as pf
+import libs.batchCodec as batchCodec
+import libs.tracing as tracing
 
 
 class TimeError(Exception):
@@ -26,8 +28,14 @@ class MainPanel(ttk.Frame):
     def __init__(self, root, **confs):
         ttk.Frame.__init__(self, root, **confs)
         #-------------connect panel variables----------------------------------
-        self.psuServer = None  # server object
+        self.psuServer = None  # AsyncProxy of the server (control calls)
+        self.monitor = None    # AsyncProxy of the server (short calls)
+        self.pending = None    # future of the last polling call
+        self.heartbeat = None  # rpc.Heartbeat of the server lease
+        self.lease = None      # lease id of the controlling connection
+        self.ui = rpc.UiDispatcher(root)  # delivers RPC results to tkinter
         self.server = tk.StringVar()  # sever name in the local network
+        self.observe = tk.BooleanVar()  # read-only observer connection
         self.frequency = tk.StringVar()
         self.frequencies = (1, 0.5, 0.25, 0.1)  # Hz
         self.root = root
@@ -64,6 +72,9 @@ class MainPanel(ttk.Frame):
                                        cursor='exchange',
                                        command=self._disconnect, **st.but)
         self.disconnectBut.grid(row=2, column=1, sticky=tk.EW, padx=5)
+        self.observeBut = ttk.Checkbutton(connectFrame, text='Observer',
+                                          variable=self.observe)
+        self.observeBut.grid(row=2, column=2, sticky=tk.W)
         for child in connectFrame.winfo_children():
             child.grid_configure(padx=5, pady=5)
         connectFrame.grid(row=0, column=0, padx=5, pady=5, sticky=(tk.NSEW))
@@ -83,7 +94,7 @@ class MainPanel(ttk.Frame):
         self.vExitRightValue = tk.StringVar()
         self.iExitLeftValue = tk.StringVar()
         self.iExitRightValue = tk.StringVar()
-        self.batch = []  # all job`s list
+        self.batch = b''  # encoded batch of all jobs (see batchCodec)
         self.firstBatch = []  # first part of the batch cont. maxV and maxI
         schedulerLabel = ttk.Label(self, text='Scheduler control', **st.subFr)
         schedulerFrame = ttk.LabelFrame(self, padding='3 3 12 12',
@@ -188,29 +199,12 @@ class MainPanel(ttk.Frame):
                                        padding='3 3 12 12',
                                        labelwidget=queueLabel)
         queueSubFrame.grid(row=0, column=2, rowspan=2, sticky=(tk.NSEW))
-        #  4 LOGICAL columns (#0 + self.dataCols) , #0 is a main tree root
-        self.dataCols = ('activity', 'value', 'how long', 'vExitLeft',
-                         'vExitRight', 'iExitLeft', 'iExitRight')
-        self.jobTree = ttk.Treeview(columns=self.dataCols,
-                                    displaycolumns=self.dataCols[:3])
-        ysb = ttk.Scrollbar(orient=tk.VERTICAL, command=self.jobTree.yview)
-        xsb = ttk.Scrollbar(orient=tk.HORIZONTAL, command=self.jobTree.xview)
-        self.jobTree['yscroll'] = ysb.set
-        self.jobTree['xscroll'] = xsb.set
-        for col in self.dataCols:
-            self.jobTree.heading(col, text=col, anchor='center')
-            self.jobTree.column(col, stretch=100, width=100, anchor=tk.W)
-        self.jobTree.column('#0', stretch=20, width=20)
-        self.jobTree.grid(in_=queueSubFrame, row=0, column=0, sticky=tk.NSEW)
-        ysb.grid(in_=queueSubFrame, row=0, column=1, sticky=tk.NS)
-        xsb.grid(in_=queueSubFrame, row=1, column=0, sticky=tk.EW)
+        #  jobs live in the typed model, the view shows visible rows only
+        self.jobs = JobModel()
+        self.jobView = JobView(queueSubFrame, self.jobs)
         queueSubFrame.columnconfigure(0, weight=999)
         queueSubFrame.columnconfigure(1, weight=1)
         queueSubFrame.rowconfigure(0, weight=999)
-        self.delCandidate = None  # candidate node to delete
-        self.jobTree.bind('<<TreeviewSelect>>', self._delPrepare)
-        self.rootTree = self.jobTree.insert('', tk.END, open=True)
-        self.firsts = [None, None]  # list of special first nodes
         #-------button section-------------------------------------------------
         schedulerButtonFrame = tk.Frame(schedulerFrame)
         schedulerButtonFrame.grid(row=1, column=3)
@@ -232,16 +226,52 @@ class MainPanel(ttk.Frame):
         schedulerFrame.grid(row=1, column=0, padx=5, pady=5, columnspan=4,
                             sticky=(tk.NSEW))
         self.saveDir = os.path.join(os.getcwd(), 'save')
+        self.traceDir = os.path.join(os.getcwd(), 'traces')
+        self.root.bind('<F12>', self._toggleTracing)
+        self.programTypes = [('binary programs', '*' + pf.BINARY),
+                             ('text programs', '*' + pf.TEXT)]
         #--------------PLOT PANEL----------------------------------------------
         plotLabel = ttk.Label(self, text='Plot window', **st.subFr)
         self.plotFrame = ttk.LabelFrame(self, padding='3 3 12 12',
                                         labelwidget=plotLabel)
         self.plotFrame.grid(row=0, column=1, columnspan=3, padx=5, pady=5,
                             sticky=(tk.NSEW))
-        self.VQueue = deque([0] * 50, maxlen=50)  # last V values from server
-        self.IQueue = deque([0] * 50, maxlen=50)  # last I values from server
-        self.matFrame = plot.PlotFrame(self.plotFrame, self.VQueue,
-                                       self.IQueue, 2000, self.neutral)
+        self.history = History(('V', 'I', 'P'))  # V, I, P values from server
+        self.windows = {'10 min': 600, '1 h': 3600, '8 h': 28800,
+                        '1 day': 86400, '1 week': 604800}  # plotted history
+        self.window = tk.StringVar(value='10 min')
+        #  matplotlib import takes most of the startup time: the plot is
+        #  created after the window is shown
+        self.matFrame = None
+        self.mapped = self.plotFrame.bind('<Map>', self._mapped)
+        windowList = ttk.Combobox(self.plotFrame, width=7, state='readonly',
+                                  textvariable=self.window,
+                                  values=list(self.windows))
+        windowList.grid(row=1, column=0, sticky=tk.E)
+        windowList.bind('<<ComboboxSelected>>', self._setWindow)
+        #--------------STATISTICS PANEL----------------------------------------
+        statsLabel = ttk.Label(self, text='Running statistics', **st.subFr)
+        statsFrame = ttk.LabelFrame(self, padding='3 3 12 12',
+                                    labelwidget=statsLabel)
+        statsFrame.grid(row=2, column=0, columnspan=4, padx=5, pady=5,
+                        sticky=(tk.NSEW))
+        self.statsCols = ('mean', 'std', 'min', 'max', 'ripple')
+        self.statsTree = ttk.Treeview(statsFrame, height=6, show='headings',
+                                      columns=('value',) + self.statsCols,
+                                      selectmode='none')
+        for col in ('value',) + self.statsCols:
+            self.statsTree.heading(col, text=col, anchor='center')
+            self.statsTree.column(col, stretch=100, width=120, anchor=tk.E)
+        self.statsTree.grid(row=0, column=0, sticky=tk.NSEW)
+        self.chargeLabel = ttk.Label(statsFrame, text='charge: -')
+        self.chargeLabel.grid(row=1, column=0, sticky=tk.W)
+        statsFrame.columnconfigure(0, weight=1)
+        self.units = {'V': 'V', 'I': 'A', 'P': 'W'}
+        self.statsRows = {}  # (scope, value name) -> treeview row
+        for scope in ('job', 'run'):
+            for name in self.units:
+                self.statsRows[(scope, name)] = self.statsTree.insert(
+                    '', tk.END, values=(self._statsLabel(scope, name),))
         #--------------THE REST------------------------------------------------
         self.queueWidgets = {self.vVal, self.sVal, self.vExitLeftVal,
                              self.vExitRightVal, self.stopBut, self.loadBut,
@@ -252,59 +282,142 @@ class MainPanel(ttk.Frame):
         topw = self.root.winfo_toplevel()
         topw.columnconfigure(0, weight=1)
         topw.rowconfigure(0, weight=1)
-        self.root.geometry('{}x{}+{}+{}'.format(880, 500, 0, 0))
+        self.root.geometry('{}x{}+{}+{}'.format(880, 680, 0, 0))
         self._blockWidgets(self.initWidgets | self.queueWidgets)
 
     def _connect(self):
-        """connects with local Pyro4 server"""
-        try:
-            if not self.server.get():
-                raise ValueError
-            uri = ''.join(('PYRO:psuServer@', self.server.get(), ':50000'))
-            self.psuServer = Pyro4.Proxy(uri)
-            self.psuServer._pyroBind()
-            self.status.configure(text='online', foreground='green')
-            i = '#---Connection with : {} established.'.format(self.psuServer)
-            logger.debug(i)
-            self.psuServer.keybOff()  # from now on PSU is blocked !!!
-            self.minmax = list(self.psuServer.getMinMax())
-            self._setDefaultStartTime()
-            self._setDefaultMinMaxSpins()
-            self._initiateSchedSpins()
-            self._pressed(self.connectBut)
-            self._blockWidgets(self.queueWidgets | self.initWidgets, False)
-            self._createFirstBatch()  # initiate first part of the batch
-            self.matFrame.plot()
-        except Exception as err:
-            warn = 'Can`t connect to {}:\n{}'.format(self.psuServer, err)
-            self.psuServer = None
-            self.status.configure(text='offline', foreground='red')
-            self._blockWidgets(self.initWidgets | self.queueWidgets)
-            logger.debug('#---{}.'.format(warn))
-            messagebox.showwarning('Connection Error', warn,
+        """connects with local Pyro4 server (remote calls are made by the
+        worker threads of the AsyncProxy objects)"""
+        if self.psuServer:
+            return
+        if not self.server.get():
+            messagebox.showwarning('Connection Error', 'No server name.',
                                    parent=self.root)
-
-    def _disconnect(self):
+            return
+        observer = self.observe.get()
+        uri = self._serverUri(self.server.get(), observer)
+        self.psuServer = rpc.AsyncProxy(uri, 'control')  # long calls
+        self.monitor = rpc.AsyncProxy(uri, 'monitor')    # short calls
+        self._pressed(self.connectBut)
+        self.observeBut['state'] = 'disabled'
+        self.ui.when(self.psuServer.run(self._connectCalls, observer),
+                     self._connected, self._connectError)
+
+    @staticmethod
+    def _serverUri(server, observer):
+        """returns uri of the server: `host', `host:port' or name of the rig
+        in the name server `voltlog.<...>[@nshost]' (see libs/registry.py)"""
+        if server.startswith('voltlog.'):
+            name, _, nsHost = server.partition('@')
+            return ''.join(('PYRONAME:', name, '.observer' if observer else '',
+                            '@' + nsHost if nsHost else ''))
+        host, _, port = server.partition(':')
+        objectId = 'psuObserver' if observer else 'psuServer'
+        return ''.join(('PYRO:', objectId, '@', host, ':', port or '50000'))
+
+    @staticmethod
+    def _connectCalls(proxy, observer):
+        """remote part of the connection (worker thread)"""
+        proxy._pyroBind()
+        lease = None
+        if not observer:
+            #  PSU goes to the safe state when heartbeats of the lease stop
+            lease = proxy.acquireLease('mainGUI@{}'.format(
+                                       socket.gethostname()))
+            proxy.keybOff()  # from now on PSU is blocked !!!
+        minmax = list(proxy.getMinMax())
+        return minmax, proxy.getServerTimeNow(), lease
+
+    def _connected(self, result):
+        """finishes connection on the tkinter thread"""
+        self.minmax, serverNow, lease = result
+        self.status.configure(text='online', foreground='green')
+        i = '#---Connection with : {} established.'.format(self.psuServer)
+        logger.debug(i)
+        self.version = 0  # last seen snapshot version (observer)
+        self.running = False  # last known scheduler state
+        self._poll()
+        if self.observe.get():  # read-only: scheduler panel stays blocked
+            return
+        self.lease = lease['lease']
+        self.heartbeat = rpc.Heartbeat(self.psuServer.uri, self.lease,
+                                       lease['ttl'])
+        self.ui.when(self.heartbeat.lost, None, self._leaseLost)
+        self._setDefaultStartTime(serverNow)
+        self._setDefaultMinMaxSpins()
+        self._initiateSchedSpins()
+        self._blockWidgets(self.queueWidgets | self.initWidgets, False)
+        self._createFirstBatch()  # initiate first part of the batch
+
+    def _connectError(self, err):
+        warn = 'Can`t connect to {}:\n{}'.format(self.psuServer, err)
+        self._closeProxies()
+        self.status.configure(text='offline', foreground='red')
+        self._blockWidgets(self.initWidgets | self.queueWidgets)
+        self._pressed(self.connectBut, False)
+        self.observeBut['state'] = 'normal'
+        logger.debug('#---{}.'.format(warn))
+        messagebox.showwarning('Connection Error', warn, parent=self.root)
+
+    def _leaseLost(self, err):
+        """heartbeats failed, the server has moved (or will move) the PSU to
+        its safe state"""
+        if not self.psuServer:
+            return
+        warn = 'Connection with {} lost:\n{}'.format(self.server.get(), err)
+        logger.debug('#{}.'.format(warn))
+        self._disconnect(panic=False)
+        messagebox.showwarning('Connection Error', warn, parent=self.root)
+
+    def _closeProxies(self):
+        """releases connections (after already submitted calls)"""
+        if self.heartbeat:
+            self.heartbeat.close()
+            self.heartbeat = None
+        self.lease = None
+        for proxy in (self.psuServer, self.monitor):
+            if proxy:
+                proxy.close()
+        self.psuServer = self.monitor = None
+
+    @staticmethod
+    def _panicCalls(proxy, lease):
+        """remote part of the disconnection (worker thread)"""
+        proxy.stopScheduler()
+        proxy.psuManualMode()  # turn off PSU and turn on keyboard
+        if lease:
+            proxy.releaseLease(lease)
+
+    def _disconnect(self, panic=True):
         """disconnects Pyro4 Proxy with the Server,
-           this works also as panic button"""
-        try:
-            if not self.psuServer:
-                raise ValueError
-            info = '#---Connection with : {} closed.'.format(self.psuServer)
-            self.psuServer.stopScheduler()
-            self.psuServer.psuManualMode()  # turn off PSU and turn on keyboard
-            self.psuServer._pyroRelease()
-            self.psuServer = None
-            self.status.configure(text='offline', foreground='red')
-            logger.debug(info)
-            self._blockWidgets(self.queueWidgets | self.initWidgets)
-            self._pressed(self.connectBut, False)
-            self._clearTree()
-        except Exception as err:
-            warn = 'Can`t disconnect {}:\n{}'.format(self.psuServer, err)
-            logger.debug('#{}.'.format(warn))
-            messagebox.showwarning('Disconnection Error', warn,
-                                   parent=self.root)
+           this works also as panic button
+
+        Arguments:
+            panic -> (boolean, optional) stops the PSU, False when the
+                     connection is lost (server takes care of the PSU)"""
+        if not self.psuServer:
+            return None
+        info = '#---Connection with : {} closed.'.format(self.psuServer)
+        future = None
+        if panic and not self.observe.get():  # observers can`t touch the PSU
+            #  monitor proxy: panic must not wait for a pending upload
+            future = self.ui.when(self.monitor.run(self._panicCalls,
+                                                   self.lease),
+                                  lambda result: logger.debug(info),
+                                  self._disconnectError)
+        self._closeProxies()
+        self.status.configure(text='offline', foreground='red')
+        self._blockWidgets(self.queueWidgets | self.initWidgets)
+        self._pressed(self.connectBut, False)
+        self._pressed(self.startBut, False)
+        self.observeBut['state'] = 'normal'
+        self._clearTree()
+        return future
+
+    def _disconnectError(self, err):
+        warn = 'Can`t disconnect {}:\n{}'.format(self.server.get(), err)
+        logger.debug('#{}.'.format(warn))
+        messagebox.showwarning('Disconnection Error', warn, parent=self.root)
 
     def _pressed(self, button, press=True):
         """changes button apperance from normal to pressed and vice versa
@@ -321,15 +434,11 @@ class MainPanel(ttk.Frame):
 
     #-------------------scheduler panel---------------------------------------
     def _updateFirstJobs(self):
-        """updates first two jobs in the treeview(set Max V and set Max I)"""
-        for i in (0, 1):
-            volamp = 'A' if i else 'V'
-            if self.firsts[i]:  # at first remove old job from the treeview
-                self.jobTree.delete(self.firsts[i])
-            self.firsts[i] = self.jobTree.insert(parent=self.rootTree, index=i,
-                             values=(self.firstBatch[i][0][0],
-                             '{} {}'.format(self.firstBatch[i][0][1], volamp),
-                             'always'))
+        """updates first two jobs in the view(set Max V and set Max I)"""
+        self.jobView.heads = [(job[0][0], '{} {}'.format(job[0][1], volamp),
+                               'always')
+                              for job, volamp in zip(self.firstBatch, 'VA')]
+        self.jobView.refresh()
 
     def _createFirstBatch(self):
         """adds first two jobs to the batch, use this function at the end of
@@ -340,86 +449,45 @@ class MainPanel(ttk.Frame):
         self._updateFirstJobs()
 
     def _createBatch(self):
-        """creates batch for server`s scheduler from ttk treeview objects"""
-        self.batch.clear()
-        self.batch = self.firstBatch + self.batch  # add obligatory jobs
-        for record in self._createRecords():
-            self.batch.append(record)
-
-    def _createRecords(self):
-        """yields job records ready to process by outer function
-
-        Arguments:
-
-        Yields:
-            list -> [what(tuple), how_long(float), ...(tuples)]"""
-        for job in self.jobTree.get_children(item=self.rootTree):
-            if job in self.firsts:
-                continue  # ignore obligatory jobs (added previously)
-            what = (self.jobTree.item(item=job)['values'][0],
-                    float(self.jobTree.item(item=job)['values'][1].split()[0]))
-            leng = float(self.jobTree.item(item=job)['values'][2].split()[0])
-            subjob = self.jobTree.get_children(item=job)
-            exitVL = ('V', '>=', float(self.jobTree.item(item=subjob)['values'][3]))
-            exitVR = ('V', '<=', float(self.jobTree.item(item=subjob)['values'][4]))
-            exitIL = ('I', '>=', float(self.jobTree.item(item=subjob)['values'][5]))
-            exitIR = ('I', '<=', float(self.jobTree.item(item=subjob)['values'][6]))
-            yield [what, leng, exitVL, exitVR, exitIL, exitIR]
-
-    def _createNode(self, record):
-        """creates ttk treeview nodes to process by outer function
-
-        Arguments:
-            record -> [what(tuple), how_long(float), ...(tuples)]
-
-        Returns:"""
-        what, leng, exitVL, exitVR, exitIL, exitIR = record
-        cid = self.jobTree.insert(parent=self.rootTree, index=tk.END,
-                                  values=('setv', '{} V'.format(what[1]),
-                                          '{} s'.format(leng)), open=False)
-        strV = '{}>V>{}'.format(exitVL[2], exitVR[2])
-        strI = '{}>I>{}'.format(exitIL[2], exitIR[2])
-        self.jobTree.insert(parent=cid, index=tk.END,
-                            values=('', strV, strI, exitVL[2], exitVR[2],
-                                    exitIL[2], exitIR[2]))
+        """creates encoded batch for server`s scheduler from the job model"""
+        self.batch = batchCodec.encodeJobs(self.jobs, self.firstBatch)
 
     def _addJob(self):
-        """adds job to the treeview(button handler)"""
-        record = [('setv', self.vValue.get()), self.sValue.get(),
-                  ('V', '>=', self.vExitLeftValue.get()),
-                  ('V', '<=', self.vExitRightValue.get()),
-                  ('I', '>=', self.iExitLeftValue.get()),
-                  ('I', '<=', self.iExitRightValue.get())]
-        self._createNode(record)
+        """adds job to the model(button handler)"""
+        try:
+            self.jobs.append(self.vValue.get(), self.sValue.get(),
+                             self.vExitLeftValue.get(),
+                             self.vExitRightValue.get(),
+                             self.iExitLeftValue.get(),
+                             self.iExitRightValue.get())
+        except ValueError as er:
+            logger.debug('#{}.'.format(er))
+            messagebox.showwarning('Job Error', er, parent=self.root)
+            return
+        self.jobView.see(len(self.jobView) - 1)
 
     def _clearTree(self):
-        """clears ttk treeview object from old inputs"""
-        for job in self.jobTree.get_children(item=self.rootTree):
-            self.jobTree.delete(job)
+        """clears job model and its view from old inputs"""
+        self.jobs.clear()
         self.firstBatch.clear()
-        self.batch.clear()
-        self.firsts = [None, None]
-
-    def _delPrepare(self, *event):
-        """returns nodes` ids ready to delete (ttk.treeview event handler)
-
-        Arguments:
-           event -> tkinter Event object (ignored)
-
-        Returns:"""
-        self.delCandidate = self.jobTree.selection()
+        self.batch = b''
+        self.jobView.heads = []
+        self.jobView.selected = None
+        self.jobView.refresh()
 
     def _delJob(self):
-        """removes job from the scheduler list(button handler)"""
-        try:
-            if not self.delCandidate[0] in self.firsts:
-                self.jobTree.delete(self.delCandidate)
-            else:
-                warn = 'Can`t remove obligatory jobs!'
-                logger.debug('#{}.'.format(warn))
-                messagebox.showwarning('Deletion Error', warn, parent=self.root)
-        except (TclError, TypeError):  # no job chosen
-            pass
+        """removes selected job from the scheduler list(button handler)"""
+        index = self.jobView.selected
+        if index is None:  # no job chosen
+            return
+        if index < len(self.jobView.heads):
+            warn = 'Can`t remove obligatory jobs!'
+            logger.debug('#{}.'.format(warn))
+            messagebox.showwarning('Deletion Error', warn, parent=self.root)
+            return
+        self.jobs.delete(index - len(self.jobView.heads))
+        self.jobView.selected = None
+        self.jobView.refresh()
 
     def _initiateSchedSpins(self):
         """prepares scheduler spinboxes"""
@@ -436,41 +504,59 @@ class MainPanel(ttk.Frame):
         self._createFirstBatch()  # always refresh first part of the batch
 
     #--------client-server time handling methods-------------------------------
-    def _setDefaultStartTime(self):
-        """sets default values for start scheduler time"""
-        string = self.psuServer.getServerTimeNow()  # from server host
-        dt = self._decodeSrvTime(string)
+    def _setDefaultStartTime(self, serverNow):
+        """sets default values for start scheduler time
+
+        Arguments:
+            serverNow -> (string) now() time of the server host
+
+        Returns:"""
+        dt = self._decodeSrvTime(serverNow)
         dt += datetime.timedelta(seconds=20)  # add arbitrary amount of time
         self.initHour.set(dt.hour)
         self.initMinute.set(dt.minute)
         self.initSecond.set(dt.second)
 
-    def _checkStartTime(self):
-        """checks if scheduler start time is properly set"""
-        dtCheck = self._getStartTime()
+    @staticmethod
+    def _checkStartTime(dtStart, dtNow):
+        """checks if scheduler start time is properly set
+
+        Arguments:
+            dtStart -> (datetime.datetime) scheduler start time
+            dtNow   -> (datetime.datetime) server now() time
+
+        Returns:"""
         delta = datetime.timedelta(seconds=5)
-        string = self.psuServer.getServerTimeNow()  # from server host
-        dtNow = self._decodeSrvTime(string)
-        if dtCheck - dtNow < delta:  # time incorrectly set
+        if dtStart - dtNow < delta:  # time incorrectly set
             raise TimeError('Start time must be now() + 5 s (at least)')
 
-    def _getStartTime(self):
+    def _getStartClock(self):
+        """gets start time (hour, minute, second) from the spinboxes
+
+        Arguments:
+
+        Returns:
+            tuple of ints"""
+        return (int(self.initHour.get()), int(self.initMinute.get()),
+                int(self.initSecond.get()))
+
+    @staticmethod
+    def _getStartTime(clock, dtNow):
         """gets start time in the form of datetime.datetime object
 
         Arguments:
+            clock -> tuple (hour, minute, second) of the start time
+            dtNow -> (datetime.datetime) server now() time
 
         Returns:
             datetime.datetime object"""
-        hour = int(self.initHour.get())
-        minute = int(self.initMinute.get())
-        second = int(self.initSecond.get())
-        string = self.psuServer.getServerTimeNow()  # from server host
-        dtStart = self._decodeSrvTime(string)
+        hour, minute, second = clock
         #!!!! replace RETURNS (NOT changes in place!!!!!!!!!!!!!!!!!!!)
-        dtStart = dtStart.replace(hour=hour, minute=minute, second=second)
+        dtStart = dtNow.replace(hour=hour, minute=minute, second=second)
         return dtStart
 
-    def _decodeSrvTime(self, timeString):
+    @staticmethod
+    def _decodeSrvTime(timeString):
         """decodes time string from server
 
         Arguments:
@@ -481,16 +567,6 @@ class MainPanel(ttk.Frame):
         dt = datetime.datetime.strptime(timeString, st.dtFormat)
         return dt
 
-    def _getStartTimeString(self):
-        """returns start time in the form of seconds since epoch
-
-        Arguments:
-
-        Returns:
-            formated string"""
-        dt = self._getStartTime()
-        return dt.strftime(st.dtFormat)
-
     def _setDefaultMinMaxSpins(self):
         """sets default values for Max V and Max I
            spinboxes after succesfull connection"""
@@ -519,81 +595,141 @@ class MainPanel(ttk.Frame):
         off = (self.initWidgets | self.queueWidgets)  # turn off all widgets
         off -= set((self.startBut, self.stopBut))     # except Stop button
         try:
-            self._checkStartTime()
-            self._blockWidgets(off)  # block almost all widgets
+            clock = self._getStartClock()
+            frequency = float(self.frequency.get())
             self._createBatch()  # creates batch for server
-            self.psuServer.setQueue(self.batch)  # send the batch to server
-            #  fire batch processing: NOT in the form of independent thread
-            #  because this operation must be performed on the server side,
-            #  fireing new thread here would block client completly!!!
-            self.psuServer.startScheduler(self._getStartTimeString(),
-                                          float(self.frequency.get()))
-            #  fire start button apperance service : this operation could be
-            #  performed in client thread
-            self.thrBut = threading.Thread(target=self._buttonThread, args=(),
-                                        name='buttons', daemon=True)
-            self.thrBut.start()
-            #  data producer thread for matplotlib plot
-            self.dataThr = threading.Thread(target=self._dataThread, args=(),
-                                            name='data producer', daemon=True)
-            self.dataThr.start()
         except Exception as er:
-            logger.debug('#{}.'.format(er))
-            self._blockWidgets(off, False)  # unblock almost all widgets
             messagebox.showwarning('Start Time Error', er, parent=self.root)
-
-    def _buttonThread(self):
-        """threaded function to service start button apperance"""
+            return
+        self._blockWidgets(off)  # block almost all widgets
         self._pressed(self.startBut)
-        while self.psuServer.getSchedulerStatus():
-            time.sleep(float(self.frequency.get()))
-        self._blockWidgets(self.initWidgets | self.queueWidgets, False)
+        #  upload and start are performed by the worker thread, the window
+        #  stays responsive during long uploads
+        future = self.psuServer.run(self._startCalls, clock, self.batch,
+                                    frequency)
+        self.ui.when(future, self._started, lambda er: self._startError(er, off))
+
+    @classmethod
+    def _startCalls(cls, proxy, clock, batch, frequency):
+        """remote part of the scheduler start (worker thread)"""
+        dtNow = cls._decodeSrvTime(proxy.getServerTimeNow())  # from server
+        dtStart = cls._getStartTime(clock, dtNow)
+        cls._checkStartTime(dtStart, dtNow)
+        proxy.setQueue(batch)  # send the batch to server
+        #  fire batch processing: NOT in the form of independent thread
+        #  because this operation must be performed on the server side
+        proxy.startScheduler(dtStart.strftime(st.dtFormat), frequency)
+
+    def _started(self, result):
+        self.running = True  # polling unblocks widgets when scheduler ends
+
+    def _startError(self, er, off):
+        logger.debug('#{}.'.format(er))
+        self._blockWidgets(off, False)  # unblock almost all widgets
         self._pressed(self.startBut, False)
+        messagebox.showwarning('Start Time Error', er, parent=self.root)
 
     def _stop(self):
         """stops scheduler"""
-        self.psuServer.stopScheduler()
-        self._pressed(self.startBut, False)
+        if not self.monitor:
+            self._pressed(self.startBut, False)
+            return
+        #  not queued behind uploads, Start stays pressed until it is done
+        self.ui.when(self.monitor.call('stopScheduler'),
+                     lambda result: self._pressed(self.startBut, False),
+                     self._stopError)
+
+    def _stopError(self, err):
+        """scheduler may still run, Start button stays pressed"""
+        warn = 'Can`t stop the scheduler of {}:\n{}'.format(self.server.get(),
+                                                            err)
+        logger.debug('#{}.'.format(warn))
+        messagebox.showwarning('Stop Error', warn, parent=self.root)
 
     def _load(self):
-        """loads preprepared queue of jobs into scheduler"""
+        """loads preprepared program of jobs into scheduler (binary programs
+        are read lazily, when rows are displayed or submitted)"""
+        path = fdi.askopenfilename(initialdir=self.saveDir, parent=self.root,
+                                   title='Load saved job program.',
+                                   filetypes=self.programTypes)
+        if not path:
+            return
         try:
-            lf = fdi.askopenfile(mode='rb', defaultextension='.sav',
-                                 initialdir=self.saveDir, parent=self.root,
-                                 title='Load saved job queue.',
-                                 filetypes=[('saved jobs', '*sav')])
-            with lf:
-                records = pickle.load(lf)
-            self._clearTree()            # \
-            self._createFirstBatch()     # /  treeview preparing
-            for record in records:
-                self._createNode(record)
-        except Exception as er:
-            msg = '{}\nNo save directory.\nPlease save first.'.format(er)
-            messagebox.showerror(message=msg, parent=self.root)
+            jobs = pf.loadJobs(path)
+        except (OSError, pf.ProgramFileError) as er:
+            messagebox.showerror(message=er, parent=self.root)
+            return
+        self._clearTree()            # \
+        self._createFirstBatch()     # /  view preparing
+        self.jobs = self.jobView.model = jobs
+        self.jobView.refresh()
 
     def _save(self):
-        """saves prepared queue of jobs into file"""
+        """saves prepared program of jobs into file"""
         if(not os.path.exists(self.saveDir)):  # create dir if needed
             os.mkdir(path=self.saveDir)
-        sfd = fdi.asksaveasfilename(title='Saving job queue', parent=self,
+        sfd = fdi.asksaveasfilename(title='Saving job program', parent=self,
                                     initialdir=self.saveDir,
-                                    defaultextension='.sav',
-                                    filetypes=[('saved jobs', '*.sav')],
+                                    defaultextension=pf.BINARY,
+                                    filetypes=self.programTypes,
                                     confirmoverwrite=True)
+        if not sfd:
+            return
         try:
-            records = []  # create ONE object to pickle
-            for record in self._createRecords():
-                records.append(record)
-            with open(sfd, mode='wb') as configFile:
-                pickle.dump(records, configFile)  # pickle ONE object(don`t append)
-        except FileNotFoundError:
-            pass
+            pf.saveJobs(sfd, self.jobs)  # streamed, variant from extension
+        except (OSError, pf.ProgramFileError) as er:
+            messagebox.showerror(message=er, parent=self.root)
+
+    def _toggleTracing(self, *event):
+        """F12: starts tracing of the GUI calls and the server, next F12
+        saves both traces into one file (see libs/tracing.py)"""
+        on = not tracing.enabled
+        if on:
+            tracing.clear()
+        tracing.enable(on)
+        logger.debug('#tracing {}.'.format('on' if on else 'off'))
+        if self.monitor and not self.observe.get():  # server traced too
+            self.ui.when(self.monitor.run(self._tracingCalls, on),
+                         lambda serverEvents: self._saveTrace(on,
+                                                              serverEvents),
+                         lambda er: self._saveTrace(on, [], er))
+        else:
+            self._saveTrace(on, [])
+
+    @staticmethod
+    def _tracingCalls(proxy, on):
+        """remote part of the tracing toggle (worker thread)"""
+        proxy.setTracing(on)
+        return [] if on else proxy.getTrace(True)
+
+    def _saveTrace(self, on, serverEvents, err=None):
+        """writes trace of the GUI (and the server) when tracing ends"""
+        if err is not None:
+            logger.debug('#Server trace not available: {}.'.format(err))
+        if on:
+            return
+        if not os.path.exists(self.traceDir):
+            os.mkdir(path=self.traceDir)
+        path = os.path.join(self.traceDir, 'voltlog-{}.json'.format(
+                            time.strftime('%Y%m%d-%H%M%S')))
+        try:
+            tracing.export(path, tracing.events('mainGUI') + serverEvents)
+        except OSError as er:
+            messagebox.showerror(message=er, parent=self.root)
+            return
+        tracing.clear()
+        messagebox.showinfo('Tracing', 'Trace saved: {}'.format(path),
+                            parent=self.root)
 
     def _safeExit(self):
         """cleanly closes connection with PSU server before program exit"""
         if self.psuServer:
-            self._disconnect()
+            future = self._disconnect()
+            try:
+                if future:
+                    future.result(timeout=5)  # PSU must be safe before exit
+            except Exception as err:
+                logger.debug('#Can`t disconnect: {}.'.format(err))
         logger.debug('#PSU client program exited.')
         self.root.destroy()
 
@@ -610,15 +746,105 @@ class MainPanel(ttk.Frame):
             else:
                 widget['state'] = 'normal'
 
-    def _dataThread(self):
-        """threaded method which populates V an I queues with fresh data"""
-        while self.psuServer.getSchedulerStatus():
-            time.sleep(2)
-            lastVIP = self.psuServer.getVIP()
-            self.VQueue.popleft()
-            self.IQueue.popleft()
-            self.VQueue.append(lastVIP[0])
-            self.IQueue.append(lastVIP[1])
+    def _poll(self):
+        """periodically fetches fresh data from the server (replaces data
+        producer and button threads: results are handled on the tkinter
+        thread, calls are made by the monitor worker thread), the idle
+        controlling client doesn`t poll, its heartbeat watches the server"""
+        if not self.monitor:
+            return
+        idle = self.version and not self.running and not self.observe.get()
+        if not idle and (self.pending is None or self.pending.done()):
+            #  one call returns sample, scheduler state and statistics
+            self.pending = self.monitor.call('getSnapshot', self.version)
+            self.ui.when(self.pending, self._polled, self._pollError)
+        self.root.after(2000, self._poll)
+
+    def _pollError(self, err):
+        """server doesn`t answer, observers have no heartbeat to notice it"""
+        if not self.monitor:
+            return
+        warn = 'Connection with {} lost:\n{}'.format(self.server.get(), err)
+        logger.debug('#{}.'.format(warn))
+        self._disconnect(panic=False)  # offline, frozen values cleared
+        messagebox.showwarning('Connection Error', warn, parent=self.root)
+
+    def _polled(self, snap):
+        """stores sample from the server`s snapshot cache, shows statistics,
+        updates buttons when scheduler ends
+
+        Arguments:
+            snap -> dictionary (see snapshot.Snapshot) or None if nothing new
+
+        Returns:"""
+        if snap is None or not self.monitor:  # nothing new on the server
+            return
+        self.version = snap['version']
+        if snap['running'] and (not len(self.history) or
+                                snap['time'] > self.history.t[-1]):
+            self.history.append(snap['time'], snap['V'], snap['I'], snap['P'])
+        self._showStats(snap['stats'])
+        if self.running and not snap['running'] and not self.observe.get():
+            self._blockWidgets(self.initWidgets | self.queueWidgets, False)
+            self._pressed(self.startBut, False)  # scheduler has finished
+        self.running = snap['running']
+
+    def _statsLabel(self, scope, name, index=None):
+        """returns label of the statistics row (e.x.: `V job 3 [V]')"""
+        if scope == 'job' and index is not None:
+            scope = 'job {}'.format(index + 1)
+        return '{} {} [{}]'.format(name, scope, self.units[name])
+
+    def _showStats(self, stats):
+        """shows running statistics of the job and the run
+
+        Arguments:
+            stats -> dictionary (see MainServer.getStats) or None
+
+        Returns:"""
+        if not stats:
+            return
+        for (scope, name), row in self.statsRows.items():
+            values = stats[scope][name]
+            label = self._statsLabel(scope, name, stats['index'])
+            self.statsTree.item(row, values=(label,) + tuple(
+                '-' if values[col] is None else '{:.3f}'.format(values[col])
+                for col in self.statsCols))
+        charge = stats['charge']
+        self.chargeLabel['text'] = ('charge: job {:.4f} Ah, {:.4f} Wh    '
+                                    'run {:.4f} Ah, {:.4f} Wh'.format(
+                                        charge['job']['Ah'],
+                                        charge['job']['Wh'],
+                                        charge['run']['Ah'],
+                                        charge['run']['Wh']))
+
+    def _mapped(self, *event):
+        """plot frame is visible: creates the plot when Tk is idle
+
+        Arguments:
+           event -> tkinter Event object (ignored)
+
+        Returns:"""
+        self.plotFrame.unbind('<Map>', self.mapped)
+        self.root.after_idle(self._createPlot)
+
+    def _createPlot(self):
+        """imports matplotlib and starts plotting"""
+        import libs.plotFrame as plot
+        self.matFrame = plot.PlotFrame(self.plotFrame, self.history, 2000,
+                                       self.neutral,
+                                       self.windows[self.window.get()])
+        self.matFrame.plot()
+
+    def _setWindow(self, *event):
+        """changes plotted history window (combobox event handler)
+
+        Arguments:
+           event -> tkinter Event object (ignored)
+
+        Returns:"""
+        if self.matFrame:
+            self.matFrame.setWindow(self.windows[self.window.get()])
 #------------------------------------------------------------------------------
 #------------------------------------------------------------------------------
 def main():
@@ -1,47 +1,133 @@
 #!/usr/bin/env python
-import libs.voltcraftPSU as voltcraftPSU
-import libs.scheduler as scheduler
 #import libs.modelsDict as modelsDict
-import libs.job as job
-import libs.condition as condition
+import libs.metrics as metrics
+import libs.tracing as tracing
 import logging
 import datetime
+import os
+import time
 from libs.stylesDict import dtFormat
-from threading import Thread, Event
+from threading import Event
 from collections import deque
+#  PSU device, scheduler, codecs and exporters are imported when used, so
+#  `--help' and importing this module stay fast (see benchStartup.py)
 
 
 logger = logging.getLogger(__name__)
 
+rpcDuration = metrics.histogram('rpc_duration_seconds',
+                                'MainServer method call duration', 'method')
+observerDuration = metrics.histogram('observer_rpc_duration_seconds',
+                                     'ObserverServer method call duration',
+                                     'method')
+leasesExpired = metrics.counter('lease_expired_total',
+                                'Client leases expired (safe state entered)')
+safeStateLatency = metrics.histogram('lease_safe_state_seconds',
+                                     'Time from the lease deadline to the '
+                                     'PSU in the safe state')
+SAFE_STATES = ('manual', 'off')
+
+
+@tracing.traced('server')
+@metrics.instrument(rpcDuration)
 class MainServer():
-    def __init__(self, psu_device, jobs, job_stats, running):
+    def __init__(self, psu_device, jobs, job_stats, running,
+                 records='records', capture=None, worker=None,
+                 safeState='manual', leaseTtl=10.0):
         """creates Pyro4 main server object for RPC of the PSU:)
 
            device    -> (string) device name (e.x: /dev/ttyUSB0)
-           jobs      -> collections.deque object to store batch(input queue)
+           jobs      -> job.JobQueue object to store batch(input queue)
            job_stats -> collections.deque object to store out
            running   -> threading.Event object for scheduler running flag
+           records   -> (string, optional) directory of recorded runs
+           capture   -> (string, optional) capture file of the serial traffic
+           worker    -> (deviceProcess.DeviceProcess, optional) PSU device
+                        and scheduler in the separate process (`running'
+                        is its multiprocessing.Event then), by default they
+                        run in this process (deviceProcess.DeviceWorker)
+           safeState -> (string, optional) state of the PSU after an expired
+                        client lease: `manual' (PSU off, keyboard on) or
+                        `off' (PSU off, keyboard stays locked)
+           leaseTtl  -> (float, optional) default client lease time [s]
 
         INFO: `device' must be properly set&checked (see VoltcraftPSU docs)"""
-        self.jobs = jobs
-        self.job_stats = job_stats
-        self.values = {'V': 0.00, 'I': 0.00, 'P': 0.00}
+        self.records = records
         self.running = running
-        self.device = voltcraftPSU.VoltcraftPSU(psu_device)
-        self.ID = self.device.getID()
-        self.scheduler = scheduler.VoltcraftScheduler(device=self.device,
-                                                      jobs=self.jobs,
-                                                      job_stats=self.job_stats,
-                                                      running=self.running)
-        logger.debug('#---PSU {} server started.'.format(self.device.model))
+        if worker is None:
+            import libs.deviceProcess as deviceProcess
+            worker = deviceProcess.DeviceWorker(psu_device, jobs, job_stats,
+                                                running, records, capture)
+        self.worker = worker
+        self.ID = self.worker.ID
+        self.snapshots = self.worker.snapshots
+        if safeState not in SAFE_STATES:
+            raise ValueError('Wrong safe state: {}'.format(safeState))
+        self.safeState = safeState
+        import libs.lease as lease
+        self.leases = lease.LeaseManager(self._leaseExpired, leaseTtl)
+        metrics.gauge('lease_active', 'Client leases held',
+                      function=self.leases.__len__)
+        logger.debug('#---PSU %s server started.', self.ID)
+
+    def _leaseExpired(self, expired):
+        """moves PSU to the safe state (timer wheel thread), the client of
+        the `expired' lease is lost"""
+        leasesExpired.inc()
+        self.running.clear()  # scheduler resets PSU at its next tick
+        try:
+            if self.safeState == 'manual':
+                self.worker.manualMode()
+            else:
+                self.worker.psuOff()
+        except Exception:
+            logger.exception('PSU not in the safe state after lost client %s',
+                             expired.client)
+            return
+        latency = time.monotonic() - expired.deadline
+        safeStateLatency.observe(latency)
+        logger.warning('client %s lost, PSU in the safe state (%s) %.2f s '
+                       'after the lease deadline', expired.client,
+                       self.safeState, latency)
+
+    def acquireLease(self, client='', ttl=None):
+        """grants a lease to the controlling client, the PSU goes to the safe
+        state when the lease is not renewed (see heartbeat) in time
+
+        Arguments:
+            client -> (string, optional) name of the client (log)
+            ttl    -> (float, optional) lease time [s] (default server
+                      --lease-ttl)
+
+        Returns:
+            dictionary {'lease': lease id, 'ttl': granted lease time}"""
+        granted = self.leases.acquire(client, ttl)
+        return {'lease': granted.id, 'ttl': granted.ttl}
+
+    def heartbeat(self, leaseId):
+        """renews the lease (Pyro4 oneway call, unknown leases are ignored)"""
+        if not self.leases.renew(leaseId):
+            logger.debug('#\theartbeat of unknown lease %s', leaseId)
+
+    def checkLease(self, leaseId):
+        """returns seconds left of the lease or None if it has expired (or
+        was released)"""
+        return self.leases.remaining(leaseId)
+
+    def releaseLease(self, leaseId):
+        """ends the lease of the client leaving the PSU (no safe state)
+
+        Returns:
+            boolean -> False if the lease has already expired"""
+        return self.leases.release(leaseId)
 
     def psuManualMode(self):
         """Set PSU in manual mode"""
-        self.device.manualMode()
+        self.worker.manualMode()
 
     def psuRemoteMode(self):
         """Set PSU in remote mode"""
-        self.device.remoteMode()
+        self.worker.remoteMode()
 
     def getServerTimeNow(self):
         """returns server now() time"""
@@ -54,16 +140,16 @@ class MainServer():
         logger.debug('#\tscheduler stopped.')
 
     def psuOff(self):
-        self.device.psuOff()
+        self.worker.psuOff()
 
     def psuOn(self):
-        self.device.psuOn()
+        self.worker.psuOn()
 
     def keybOn(self):
-        self.device.manualKey()
+        self.worker.manualKey()
 
     def keybOff(self):
-        self.device.remoteKey()
+        self.worker.remoteKey()
 
     def startScheduler(self, start, frequency):
         """Starts scheduler
@@ -75,14 +161,10 @@ class MainServer():
 
         Returns:"""
         st = datetime.datetime.strptime(start, dtFormat)
-        self.scheduler.setStart(st)
-        self.scheduler.setFrequency(frequency)
         #initial job list must be passed to the scheduler!!!
-        info = '#\tscheduler started.\n\tStart time :{}\tfrequency : {}'
-        logger.debug(info.format(start, frequency))
-        self.thrSched = Thread(target=self.scheduler.run,
-                               name='scheduler', daemon=True)
-        self.thrSched.start()
+        self.worker.startScheduler(st, frequency)
+        info = '#\tscheduler started.\n\tStart time :%s\tfrequency : %s'
+        logger.debug(info, start, frequency)
 
     def getSchedulerStatus(self):
         """checks if scheduler is running
@@ -91,7 +173,7 @@ class MainServer():
 
         Returns:
             boolean -> True if scheduler is running , False otherwise"""
-        return self.running.isSet()
+        return self.running.is_set()
 
     def getVIP(self):
         """Returns actual V,I,P values from scheduler object.
@@ -99,12 +181,39 @@ class MainServer():
 
         Returns:
             V,I,P tuple"""
-        if self.running.isSet():
-            output = self.scheduler.values['V'], self.scheduler.values['I'], self.scheduler.values['P']
+        snap = self.snapshots.get()
+        if self.running.is_set():
+            output = snap.V, snap.I, snap.P
         else:
             output = 0.00, 0.00, 0.00
         return output
 
+    def getStats(self):
+        """Returns running statistics of the last (or current) run.
+
+        Arguments:
+
+        Returns:
+            dictionary {'index': job index, 'run': {...}, 'job': {...},
+            'charge': {...}}, `run' and `job' map V, I, P to count, mean,
+            std, min, max and ripple (see runningStats.VIPStats), `charge'
+            maps `run' and `job' to accumulated Ah and Wh, None before the
+            first run"""
+        return self.snapshots.get().stats
+
+    def getSnapshot(self, since=0):
+        """returns latest snapshot of the scheduler state (sample time, V, I,
+        P, running job index and number of queued jobs)
+
+        Arguments:
+            since -> (int, optional) snapshot version known by the client
+
+        Returns:
+            dictionary (see snapshot.Snapshot fields) or None if there is
+            nothing newer than `since'"""
+        snap = self.snapshots.get(since)
+        return None if snap is None else dict(snap._asdict())
+
     def getMinMax(self):
         """gets minima and maxima for V,I,P values of the PSU.
 
@@ -112,7 +221,7 @@ class MainServer():
 
         Returns:
             tuple of values: Vmin, Vmax, Imin, Imax, Pmin, Pmax"""
-        return self.scheduler.getMinMax()
+        return self.worker.getMinMax()
 
     def status(self):
         """returns job statuses queue
@@ -121,7 +230,7 @@ class MainServer():
 
         Returns:
             list of lists of strings for easy Pyro4 Proxy handling"""
-        return list(self.job_stats)
+        return self.worker.status()
 
     def setQueue(self, batch):
         """Pyro4-friendly wrapper for the scheduler`s job queue creator.
@@ -132,35 +241,150 @@ class MainServer():
             batch -> [ [what(tuple(string, float)), how_long(float),
                        ( left(string), operator(string), right(float) ), ...],
                        ...]
+                     or bytes of the encoded batch (see batchCodec.py),
+                     checked at once, much smaller and faster
 
         Returns:"""
-        self.jobs.clear()
         logger.debug('#\t\tload for scheduler started.')
-        for rawJob in batch:
-            what, how_long, *rawConds = rawJob
-            conds = []
-            for rawCond in rawConds:
-                cond = condition.Condition(str(self.ID), rawCond[0],
-                                           rawCond[1], rawCond[2])
-                conds.append(cond)
-            j = job.Job(self.device, what, how_long, conds)
-            self.jobs.append(j)
-            logger.debug('#\t\t\t job :{}'.format(j.getInfo()))
+        import libs.batchCodec as batchCodec
+        encoded = batchCodec.encodedBytes(batch)  # serpent sends base64
+        self.worker.setQueue(batch if encoded is None else encoded)
         logger.debug('#\t\tload for scheduler completed.')
 
+    def checkQueue(self, batch):
+        """checks the `batch' (see setQueue) against the PSU without
+        queueing it (dry run of the clients)
+
+        Returns:
+            number of jobs"""
+        import libs.batchCodec as batchCodec
+        encoded = batchCodec.encodedBytes(batch)
+        return self.worker.checkQueue(batch if encoded is None else encoded)
+
+    def listRuns(self):
+        """returns names of recorded runs
+
+        Arguments:
+
+        Returns:
+            sorted list of strings"""
+        import libs.recorder as recorder
+        if not os.path.isdir(self.records):
+            return []
+        return sorted(name for name in os.listdir(self.records)
+                      if name.endswith(recorder.EXTENSION))
+
+    def exportRun(self, name, fmt='csv', start=None, stop=None, columns=None,
+                  every=1):
+        """streams recorded run (or its time slice) to the client, Pyro4
+        proxy receives an iterator of chunks
+
+        Arguments:
+            name    -> (string) run name (see listRuns)
+            fmt     -> (string, optional) `csv' or `parquet'
+            start   -> (string, optional) slice start time (dtFormat)
+            stop    -> (string, optional) slice end time (dtFormat)
+            columns -> (list of strings, optional) exported columns
+                       (time, job, V, I, P)
+            every   -> (int, optional) decimation, every n-th sample is taken
+
+        Returns:
+            iterator of strings (csv) or bytes (parquet)"""
+        import libs.recorder as recorder
+        import libs.exporter as exporter
+        if os.path.basename(name) != name:
+            raise recorder.RunFileError('Wrong run name: {}'.format(name))
+        path = os.path.join(self.records, name)
+        return exporter.iterExportFile(path, fmt, self._decodeTime(start),
+                                       self._decodeTime(stop), columns,
+                                       every)
+
+    def setTracing(self, enabled):
+        """switches tracing spans of the server and the device process on
+        (off), see libs/tracing.py"""
+        tracing.enable(enabled)
+        self.worker.setTracing(enabled)
+        logger.info('tracing %s', 'on' if enabled else 'off')
+
+    def getTrace(self, clear=False):
+        """returns recorded spans of the server (and of the device process)
+
+        Arguments:
+            clear -> (boolean, optional) empties the trace buffers
+
+        Returns:
+            list of Chrome/Perfetto trace events (dictionaries)"""
+        import libs.deviceProcess as deviceProcess
+        traceEvents = tracing.events('mainServer')
+        if isinstance(self.worker, deviceProcess.DeviceProcess):
+            traceEvents += self.worker.traceEvents(clear)  # own buffer
+        if clear:
+            tracing.clear()
+        return traceEvents
+
+    def _decodeTime(self, string):
+        """converts optional dtFormat string into seconds since epoch"""
+        if string is None:
+            return None
+        return datetime.datetime.strptime(string, dtFormat).timestamp()
+
+
+@tracing.traced('observer')
+@metrics.instrument(observerDuration)
+class ObserverServer():
+    def __init__(self, snapshots, minmax):
+        """creates Pyro4 read-only observer object of the PSU server, all
+        requests are served from the shared snapshot cache (no device I/O)
+
+           snapshots -> snapshot.SnapshotCache object of the MainServer
+           minmax    -> tuple: Vmin, Vmax, Imin, Imax, Pmin, Pmax"""
+        self.snapshots = snapshots
+        self.minmax = tuple(minmax)
+
+    def getSnapshot(self, since=0):
+        """returns latest snapshot of the server state
+
+        Arguments:
+            since -> (int, optional) snapshot version known by the observer
+
+        Returns:
+            dictionary (see snapshot.Snapshot fields) or None if there is
+            nothing newer than `since'"""
+        snap = self.snapshots.get(since)
+        return None if snap is None else dict(snap._asdict())
+
+    def getVIP(self):
+        """Returns last V,I,P values sampled by the scheduler.
+        Arguments:
+
+        Returns:
+            V,I,P tuple"""
+        snap = self.snapshots.get()
+        if snap.running:
+            return snap.V, snap.I, snap.P
+        return 0.00, 0.00, 0.00
+
+    def getStats(self):
+        """returns running statistics of the run (see MainServer.getStats)"""
+        return self.snapshots.get().stats
+
+    def getSchedulerStatus(self):
+        """returns True if scheduler is running , False otherwise"""
+        return self.snapshots.get().running
+
+    def getMinMax(self):
+        """returns tuple of values: Vmin, Vmax, Imin, Imax, Pmin, Pmax"""
+        return self.minmax
+
+    def getServerTimeNow(self):
+        """returns server now() time"""
+        return datetime.datetime.now().strftime(dtFormat)
+
 def main():
     import argparse
-    import Pyro4
     import socket
-
-    #------------------logging section----------------------------------------
-    serverLog = open(file='logs/PSUserver.log', mode='a+')
-    logger.setLevel(logging.DEBUG)
-    handler = logging.StreamHandler(stream=serverLog)
-    FORMAT = '{message}\t\t{asctime} {levelname}'
-    formater = logging.Formatter(FORMAT, style='{')
-    handler.setFormatter(formater)
-    logger.addHandler(handler)
+    import signal
+    import sys
 
     #------------------shell commands parser section--------------------------
     parser = argparse.ArgumentParser(description='Power Supply Unit Server')
@@ -173,18 +397,77 @@ def main():
                         default=socket.gethostname())
     parser.add_argument('-i', '--psuid', default='psuServer',
                         help='unique Pyro4 id for the PSU server (default psuServer)')
-    #not implemented
+    parser.add_argument('-b', '--observerid', default='psuObserver',
+                        help='Pyro4 id of the read-only observer (default psuObserver)')
+    parser.add_argument('-w', '--workers', type=int, default=128,
+                        help='max number of Pyro4 worker threads, one per '
+                             'connected client (default 128)')
+    parser.add_argument('-m', '--metrics', type=int,
+                        help='local HTTP port of the metrics endpoint, '
+                             '0 disables it (default Pyro4 port + 100)')
+    parser.add_argument('-y', '--servertype', default='thread',
+                        choices=('thread', 'multiplex'),
+                        help='Pyro4 server type (default thread pool)')
+    parser.add_argument('-z', '--serializers', nargs='+',
+                        default=['serpent', 'marshal', 'json'],
+                        help='serializers accepted from clients '
+                             '(default serpent marshal json)')
+    parser.add_argument('-r', '--records', default='records',
+                        help='directory of recorded runs (default records)')
+    parser.add_argument('-c', '--capture',
+                        help='capture file of the serial traffic, replay '
+                             'it with -d replay://FILE or replayCapture.py')
+    parser.add_argument('-P', '--io-process', action='store_true',
+                        help='PSU I/O and scheduler in a separate process, '
+                             'samples in the shared memory ring '
+                             'voltlog-<port> (python -m libs.telemetryRing)')
     parser.add_argument('-n', '--nameserver', dest='nameserver',
-                        action='store_true', help='use nameserver (default) - NOT IMPLEMENTED')
+                        action='store_true',
+                        help='register the rig in the Pyro4 name server, '
+                             'model and idle/busy state in its metadata '
+                             '(default, see orchestrator.py)')
     parser.add_argument('-x', '--no-nameserver', dest='nameserver',
-                        action='store_false', help='don`t use nameserver - NOT IMPLEMENTED')
+                        action='store_false', help='don`t use nameserver')
     parser.set_defaults(nameserver=True)
+    parser.add_argument('-N', '--ns-host',
+                        help='name server host or host:port (default '
+                             'broadcast lookup)')
+    parser.add_argument('-g', '--rigname',
+                        help='name of the rig in the name server '
+                             '(default voltlog.<host>.<port>)')
+    parser.add_argument('-S', '--safe-state', default='manual',
+                        choices=SAFE_STATES,
+                        help='PSU state after a lost client (expired lease): '
+                             'manual - PSU off, keyboard on (default), '
+                             'off - PSU off, keyboard locked')
+    parser.add_argument('-T', '--lease-ttl', type=float, default=10,
+                        help='default client lease time [s], the safe state '
+                             'follows the last heartbeat within it '
+                             '(default 10)')
+    #not implemented
     parser.add_argument('-s', '--openssl', dest='openssl', action='store_true',
                         help='use openssl socket wrapper - NOT IMPLEMENTED')
     parser.add_argument('-o', '--no-openssl', dest='openssl', action='store_false',
                         help='don`t use openssl socket wrapper (default) - NOT IMPLEMENTED')
     parser.set_defaults(openssl=False)
+    parser.add_argument('-l', '--log', default='logs/PSUserver.log',
+                        help='log file (default logs/PSUserver.log)')
+    parser.add_argument('-L', '--log-level', default='DEBUG',
+                        choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                        help='logging level (default DEBUG)')
+    parser.add_argument('-j', '--log-json', action='store_true',
+                        help='write log as JSON lines')
     args = parser.parse_args()
+    import Pyro4  # not needed for --help
+    import libs.deviceProcess as deviceProcess
+    import libs.registry as registry
+    from libs.logSetup import setupLogging
+    from libs.job import JobQueue
+
+    #------------------logging section----------------------------------------
+    setupLogging(args.log, (logger, logging.getLogger('libs')),
+                 level=getattr(logging, args.log_level),
+                 structured=args.log_json)
 
     #------------------Pyro 4 section------------------------------------------
     """    multiline Pyro4 :
@@ -197,18 +480,63 @@ def main():
     """
 
     #-----------------global thread-safe objects section-----------------------
-    jobs = deque()                 # queue of jobs to serve
+    jobs = JobQueue()              # queue of jobs to serve
     job_stats = deque()            # output queue of statuses of completed jobs
     runningEvent = Event()         # shared flag of scheduler state
+    worker = None                  # PSU device in this process
+
+    #------------------metrics section----------------------------------------
+    metricsPort = args.port + 100 if args.metrics is None else args.metrics
+    if metricsPort:
+        metrics.serve(metricsPort)
+        logger.debug('#---metrics served at http://127.0.0.1:%s/metrics',
+                     metricsPort)
+
+    #------------------device process section---------------------------------
+    if args.io_process:
+        runningEvent = deviceProcess.processEvent()
+        worker = deviceProcess.DeviceProcess(
+            args.device, runningEvent, args.records, args.capture,
+            ringName='voltlog-{}'.format(args.port),
+            log=(args.log + '.device', getattr(logging, args.log_level),
+                 args.log_json),
+            metricsPort=metricsPort + 1 if metricsPort else None)
+        logger.debug('#---PSU device process %s started.', worker.process.pid)
 
     #------------------Pyro 4 section------------------------------------------
+    Pyro4.config.THREADPOOL_SIZE = args.workers  # observers hold connections
+    Pyro4.config.SERVERTYPE = args.servertype
+    Pyro4.config.SERIALIZERS_ACCEPTED = set(args.serializers)
+    Pyro4.oneway(MainServer.heartbeat)  # clients don`t wait for the reply
+    MS = Pyro4.expose(MainServer)(args.device, jobs, job_stats, runningEvent,
+                                  args.records, args.capture, worker,
+                                  args.safe_state, args.lease_ttl)
+    OS = Pyro4.expose(ObserverServer)(MS.snapshots, MS.getMinMax())
+
+    #------------------name server section------------------------------------
+    registrar = None
+    if args.nameserver:  # registration is retried, not fatal
+        rigname = args.rigname or 'voltlog.{}.{}'.format(args.host, args.port)
+        uri = 'PYRO:{{}}@{}:{}'.format(args.host, args.port)
+        registrar = registry.RigRegistrar(rigname, uri.format(args.psuid),
+                                          uri.format(args.observerid), MS.ID,
+                                          args.port, MS.snapshots,
+                                          nsHost=args.ns_host)
+        registrar.start()
+
+    # SIGTERM (kill, systemd) leaves by the `finally' below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     # another way to build and start server (oneliner without NameServer)
-    Pyro4.Daemon.serveSimple({MainServer(args.device,
-                                         jobs,
-                                         job_stats,
-                                         runningEvent): args.psuid},
-                             host=args.host, port=args.port, ns=False,
-                             verbose=True)
+    try:
+        Pyro4.Daemon.serveSimple({MS: args.psuid, OS: args.observerid},
+                                 host=args.host, port=args.port, ns=False,
+                                 verbose=True)
+    finally:
+        MS.leases.close()
+        if registrar is not None:
+            registrar.close()  # removes the rig from the name server
+        if worker is not None:
+            worker.close()  # removes the telemetry ring
 
 if __name__ == '__main__':
     main()
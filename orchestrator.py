@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+"""Fleet orchestrator: runs a queue of job programs on the idle PSU rigs.
+
+Rigs are discovered in the Pyro4 name server (mainServer.py --nameserver,
+see libs/registry.py). Every idle rig takes the next program of the queue
+and runs it as psuClient.py would, rigs work in parallel. Rigs becoming
+idle later (end of a manual run, new server) are discovered every
+--discover seconds. A program is returned to the queue when its rig is
+lost or busy (taken by another client) before the program started. The
+telemetry of every program and summary.json (program, rig, result, times)
+are collected in the --results directory:
+
+    ./orchestrator.py save/*.vlp --model 12010 --results lab-run
+
+Local fleet of emulated rigs (five Pyro4 ports are allowed):
+    python -m Pyro4.naming -n 127.0.0.1 &
+    for port in 50000 50001 50002 50003 50004; do
+        ./mainServer.py -d sim://12010 -t 127.0.0.1 -p $port -m 0 \\
+            -N 127.0.0.1 -l logs/rig$port.log -r records &
+    done
+    ./orchestrator.py programs/ -N 127.0.0.1 --at +6
+
+Exit codes: 0 all programs completed, 1 some programs failed, 2 wrong
+arguments, 3 name server not found, 5 interrupted (Ctrl-C), 8 programs
+left without a rig (see --patience).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import deque
+import psuClient
+from libs.registry import discoverRigs, IDLE
+
+UNSCHEDULED = 8
+QUARANTINE = 60.0  # [s] lost rig is not used (stale name server entry)
+results = ('completed', 'error', 'usage', 'connection', 'aborted',
+           'interrupted', 'timeout', 'busy')
+
+
+class Orchestrator():
+    """queue of programs served by the rig threads"""
+    def __init__(self, programs, args):
+        """Arguments:
+            programs -> list of program files
+            args     -> parsed command line arguments (psuClient options
+                        of the runs included)"""
+        self.args = args
+        self.queue = deque((index, program, 0) for index, program in
+                           enumerate(programs))
+        self.results = []
+        self.active = {}  # rig name: Rig of the running thread
+        self.lost = {}    # rig name: monotonic time of the lost connection
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def _next(self):
+        with self._lock:
+            return self.queue.popleft() if self.queue else None
+
+    def _requeue(self, item, attempts):
+        index, program, _ = item
+        with self._lock:
+            self.queue.appendleft((index, program, attempts))
+
+    def _report(self, message):
+        if not self.args.quiet:
+            print('{} {}'.format(time.strftime('%H:%M:%S'), message),
+                  file=sys.stderr)
+
+    def _serve(self, rig):
+        """rig thread: runs programs until the queue is empty or the rig
+        fails"""
+        try:
+            while not self.stopped.is_set():
+                item = self._next()
+                if item is None:
+                    return
+                if not self._runProgram(rig, item):
+                    return
+        finally:
+            with self._lock:
+                del self.active[rig.name]
+
+    def _runProgram(self, rig, item):
+        """runs one program on the rig, returns False if the rig must be
+        left"""
+        index, program, attempts = item
+        name = os.path.splitext(os.path.basename(program))[0]
+        output = os.path.join(self.args.results, '{:04d}-{}.{}'.format(
+                              index, name, self.args.format))
+        runArgs = argparse.Namespace(**vars(self.args))
+        runArgs.program, runArgs.output, runArgs.server = program, output, \
+            rig.name
+        runArgs.no_wait, runArgs.dry_run = False, False
+        runArgs.quiet = not self.args.verbose
+        self._report('{} -> {}'.format(program, rig.name))
+        started = time.time()
+        try:
+            code = psuClient.run(runArgs, rig.uri)
+            message = results[code]
+        except psuClient.ClientError as er:
+            code, message = er.code, str(er)
+        if code == psuClient.CONNECTION:
+            with self._lock:
+                self.lost[rig.name] = time.monotonic()
+        if code == psuClient.BUSY or (code == psuClient.CONNECTION and
+                                      attempts < self.args.retries):
+            self._requeue(item, attempts + (code != psuClient.BUSY))
+            self._report('{} returned to the queue: {}'.format(program,
+                                                                message))
+            return False
+        self._report('{} on {}: {}'.format(program, rig.name, message))
+        with self._lock:
+            self.results.append({'program': program, 'rig': rig.name,
+                                 'model': rig.model, 'result': results[code],
+                                 'message': message, 'telemetry': output,
+                                 'started': started, 'finished': time.time(),
+                                 'attempts': attempts + 1})
+        return code != psuClient.CONNECTION
+
+    def _discover(self):
+        """starts threads of the new idle rigs, returns number of them"""
+        rigs = discoverRigs(self.args.ns_host, self.args.model, IDLE)
+        started = 0
+        with self._lock:
+            for rig in rigs:
+                if rig.name in self.active or not self.queue:
+                    continue
+                if time.monotonic() - self.lost.get(rig.name,
+                                                    -QUARANTINE) < QUARANTINE:
+                    continue
+                self.active[rig.name] = rig
+                threading.Thread(target=self._serve, args=(rig,),
+                                 name=rig.name, daemon=True).start()
+                started += 1
+        return started
+
+    def run(self):
+        """serves the queue, returns exit code"""
+        import Pyro4
+        os.makedirs(self.args.results, exist_ok=True)
+        lastRig = time.monotonic()  # last time a rig was available
+        nsError = None  # reported once until the name server answers
+        try:
+            while True:
+                with self._lock:
+                    if not self.queue and not self.active:
+                        break
+                    waiting = bool(self.queue)
+                if waiting:
+                    try:
+                        if self._discover():
+                            lastRig = time.monotonic()
+                        nsError = None
+                    except Pyro4.errors.PyroError as er:
+                        if str(er) != nsError:
+                            self._report('name server: {}'.format(er))
+                        nsError = str(er)
+                    with self._lock:
+                        if self.active:
+                            lastRig = time.monotonic()
+                    if time.monotonic() - lastRig > self.args.patience:
+                        self._report('no idle rig for {} s'.format(
+                                     self.args.patience))
+                        break
+                time.sleep(self.args.discover)
+        except KeyboardInterrupt:
+            self.stopped.set()
+            self._abort()
+            self._report('interrupted')
+            return psuClient.INTERRUPTED
+        finally:
+            self._summary()
+        if self.queue:
+            return UNSCHEDULED
+        if any(result['result'] != 'completed' for result in self.results):
+            return psuClient.ERROR
+        return psuClient.OK
+
+    def _abort(self):
+        """stops the batches of the rig threads (as psuClient does after
+        Ctrl-C)"""
+        import Pyro4
+        with self._lock:
+            rigs = list(self.active.values())
+        for rig in rigs:
+            try:
+                with Pyro4.Proxy(rig.uri) as psuServer:
+                    psuServer.stopScheduler()
+                    psuServer.psuManualMode()
+            except Pyro4.errors.PyroError as er:
+                self._report('{} not stopped: {}'.format(rig.name, er))
+
+    def _summary(self):
+        with self._lock:
+            unscheduled = [program for index, program, attempts in self.queue]
+            done = sorted(self.results, key=lambda result: result['started'])
+        with open(os.path.join(self.args.results, 'summary.json'),
+                  mode='w') as out:
+            json.dump({'results': done, 'unscheduled': unscheduled}, out,
+                      indent=1)
+        counts = {}
+        for result in done:
+            counts[result['result']] = counts.get(result['result'], 0) + 1
+        rigs = len({result['rig'] for result in done})
+        print('{} programs on {} rigs: {}{}'.format(
+              len(done), rigs, ', '.join('{} {}'.format(count, name) for
+                                         name, count in sorted(counts.items())),
+              ', {} unscheduled'.format(len(unscheduled)) if unscheduled
+              else ''))
+
+
+def programFiles(paths):
+    """returns program files of the `paths' (directories are expanded)"""
+    from libs.programFile import TEXT, BINARY
+    programs = []
+    for path in paths:
+        if os.path.isdir(path):
+            programs.extend(sorted(os.path.join(path, name) for name in
+                                   os.listdir(path)
+                                   if name.endswith((TEXT, BINARY))))
+        else:
+            programs.append(path)
+    return programs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs job programs on the '
+                                     'idle PSU rigs of the name server')
+    parser.add_argument('programs', nargs='*',
+                        help='program files (.vlp, .vlb) or directories')
+    parser.add_argument('-N', '--ns-host',
+                        help='name server host or host:port (default '
+                             'broadcast lookup)')
+    parser.add_argument('-m', '--model', help='only rigs of the PSU model')
+    parser.add_argument('-l', '--list', action='store_true',
+                        help='list registered rigs and exit')
+    parser.add_argument('-R', '--results', default='results',
+                        help='directory of telemetry files and summary.json '
+                             '(default results)')
+    parser.add_argument('-r', '--retries', type=int, default=1,
+                        help='runs of a program again after lost connection '
+                             'with its rig (default 1)')
+    parser.add_argument('-D', '--discover', type=float, default=5,
+                        help='period of the rig discovery [s] (default 5)')
+    parser.add_argument('-P', '--patience', type=float, default=60,
+                        help='max time without any rig [s] (default 60)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='progress messages of every program')
+    psuClient.addRunArguments(parser)
+    args = parser.parse_args()
+    import Pyro4
+
+    try:
+        if args.list:
+            for rig in discoverRigs(args.ns_host, args.model):
+                print('{:<32} {:<8} {:<8} {}'.format(rig.name, rig.model,
+                                                     rig.state, rig.uri))
+            sys.exit(psuClient.OK)
+        programs = programFiles(args.programs)
+        if not programs:
+            parser.error('no programs')
+        sys.exit(Orchestrator(programs, args).run())
+    except Pyro4.errors.PyroError as er:  # name server not found
+        print('orchestrator: {}'.format(er), file=sys.stderr)
+        sys.exit(psuClient.CONNECTION)
+
+if __name__ == '__main__':
+    main()
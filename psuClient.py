@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+"""Headless PSU client for scripted batch runs (cron, CI rigs).
+
+Loads a job program (see libs/programFile.py), submits it to the PSU
+server, starts the scheduler and streams telemetry until the batch ends:
+
+    ./psuClient.py save/myjob.vlp -s psuhost --at +30 -o run.csv
+
+No GUI or plotting modules are imported. Exit codes:
+    0 batch completed, 1 program or runtime error, 2 wrong arguments,
+    3 server connection error, 4 batch stopped before its end (by another
+    client or the server), 5 interrupted (Ctrl-C), 6 timeout, 7 scheduler
+    of the server already running (nothing submitted)
+"""
+import sys
+import json
+import socket
+import time
+import datetime
+from libs.stylesDict import dtFormat
+from libs.modelsDict import slopeWindow
+import libs.batchCodec as batchCodec
+
+OK, ERROR, USAGE, CONNECTION, ABORTED, INTERRUPTED, TIMEOUT, BUSY = range(8)
+columns = ('time', 'job', 'queued', 'V', 'I', 'P')
+LEASE = 10.0  # [s] shortest lease of the followed batch
+
+
+class ClientError(Exception):
+    def __init__(self, message, code=ERROR):
+        Exception.__init__(self, message)
+        self.code = code
+
+
+def startTime(at, serverNow):
+    """computes scheduler start time
+
+    Arguments:
+        at        -> (string) `+SECONDS' (offset from the server time),
+                     `HH:MM:SS' (today on the server) or dtFormat string
+        serverNow -> (datetime.datetime) server now() time
+
+    Returns:
+        datetime.datetime object"""
+    try:
+        if at.startswith('+'):
+            start = serverNow + datetime.timedelta(seconds=float(at[1:]))
+        elif len(at.split()) == 1:
+            clock = datetime.datetime.strptime(at, '%H:%M:%S')
+            start = serverNow.replace(hour=clock.hour, minute=clock.minute,
+                                      second=clock.second, microsecond=0)
+        else:
+            start = datetime.datetime.strptime(at, dtFormat)
+    except ValueError as er:
+        raise ClientError('Wrong start time: {}'.format(er), USAGE)
+    if start - serverNow < datetime.timedelta(seconds=5):
+        raise ClientError('Start time must be now() + 5 s (at least)', USAGE)
+    return start
+
+
+def makeBatch(jobs, maxV, maxI, limits=()):
+    """creates encoded scheduler batch (see libs/batchCodec.py): obligatory
+    max V and max I jobs (as the GUI does) followed by the jobs of the program
+
+    Arguments:
+        jobs       -> jobModel.JobModel object
+        maxV, maxI -> (float) max voltage and current of the run
+        limits     -> (sequence, optional) conditions added to every job of
+                      the program, e.x.: (('Ah', '<=', 2.0),)
+
+    Returns:
+        bytes"""
+    first = [[('maxv', maxV), 0.05], [('maxi', maxI), 0.05]]
+    return batchCodec.encodeJobs(jobs, first, limits)
+
+
+class TelemetryWriter():
+    """writes snapshots as csv or json lines"""
+    def __init__(self, out, fmt):
+        self.out = out
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.out.write(','.join(columns) + '\n')
+
+    def write(self, snap):
+        if self.fmt == 'csv':
+            self.out.write('{:.3f},{},{},{},{},{}\n'.format(
+                           *(snap[name] for name in columns)))
+        else:
+            self.out.write(json.dumps({name: snap[name] for name in columns})
+                           + '\n')
+        self.out.flush()  # tail -f friendly
+
+
+def progress(args, message):
+    if not args.quiet:
+        print('{} {}'.format(time.strftime('%H:%M:%S'), message),
+              file=sys.stderr)
+
+
+def follow(psuServer, baseline, total, writer, args, lease=None):
+    """streams telemetry until the scheduler stops, renews the lease
+
+    Arguments:
+        psuServer -> Pyro4 proxy of the PSU server
+        baseline  -> (int) snapshot version before the start
+        total     -> (int) number of jobs in the batch
+        writer    -> TelemetryWriter object
+        args      -> parsed command line arguments
+        lease     -> (string, optional) lease id (see
+                     MainServer.acquireLease)
+
+    Returns:
+        exit code"""
+    version, sampled, job, online = baseline, 0.0, -1, True
+    deadline = time.monotonic() + args.timeout if args.timeout else None
+    while True:
+        if lease:
+            psuServer.heartbeat(lease)  # oneway
+        snap = psuServer.getSnapshot(version)
+        if snap is not None:
+            version = snap['version']
+            if snap.get('online', True) != online:
+                online = not online
+                progress(args, 'PSU port recovered, batch resumed' if online
+                         else 'PSU port lost, batch paused')
+            if snap['job'] != job and snap['job'] >= 0:
+                job = snap['job']
+                progress(args, 'job {}/{} started'.format(job + 1, total))
+            if snap['running'] and snap['time'] > sampled:
+                sampled = snap['time']
+                writer.write(snap)
+            if not snap['running'] and snap['job'] >= 0:
+                if snap['queued']:
+                    progress(args, 'batch stopped, {} jobs not done'.format(
+                             snap['queued']))
+                    return ABORTED
+                progress(args, 'batch completed')
+                return OK
+        if deadline and time.monotonic() > deadline:
+            psuServer.stopScheduler()
+            progress(args, 'timeout, batch stopped')
+            return TIMEOUT
+        time.sleep(args.interval)
+
+
+def run(args, uri=None):
+    """loads the program, connects with the server and runs the program
+
+    Arguments:
+        args -> parsed command line arguments
+        uri  -> (string, optional) Pyro4 uri of the server (default from
+                args.psuid, args.server and args.port)
+
+    Returns:
+        exit code"""
+    import libs.programFile as pf
+    import libs.rpcClient as rpc
+    import Pyro4
+    rpc.registerErrors()  # messages of the server exceptions
+    try:
+        jobs = pf.loadJobs(args.program)
+    except (OSError, pf.ProgramFileError) as er:
+        raise ClientError('Can`t load program: {}'.format(er))
+    uri = uri or 'PYRO:{}@{}:{}'.format(args.psuid, args.server, args.port)
+    try:
+        psuServer = Pyro4.Proxy(uri)
+        psuServer._pyroBind()
+    except Pyro4.errors.CommunicationError as er:
+        raise ClientError('Can`t connect to {}: {}'.format(uri, er),
+                          CONNECTION)
+    try:
+        with psuServer:
+            return submit(psuServer, jobs, args)
+    except ClientError:
+        raise
+    except rpc.RemoteError as er:  # exception of the server modules
+        raise ClientError('Server error: {}'.format(er))
+    except Pyro4.errors.SerializeError as er:  # remote exception
+        raise ClientError('Server error: {}'.format(er))
+    except Pyro4.errors.CommunicationError as er:
+        raise ClientError('Connection with {} lost: {}'.format(uri, er),
+                          CONNECTION)
+    except Exception as er:  # remote exception (re-raised by Pyro4 as is)
+        raise ClientError('Server error: {!r}'.format(er))
+
+
+def submit(psuServer, jobs, args):
+    """submits, starts and follows the program
+
+    Arguments:
+        psuServer -> Pyro4 proxy of the PSU server
+        jobs      -> jobModel.JobModel object
+        args      -> parsed command line arguments
+
+    Returns:
+        exit code"""
+    if psuServer.getSchedulerStatus():
+        raise ClientError('Scheduler is already running', BUSY)
+    Vmin, Vmax, Imin, Imax, Pmin, Pmax = psuServer.getMinMax()
+    serverNow = datetime.datetime.strptime(psuServer.getServerTimeNow(),
+                                           dtFormat)
+    start = startTime(args.at, serverNow)
+    limits = [(name, '<=', value) for name, value in
+              (('Ah', args.max_ah), ('Wh', args.max_wh)) if value]
+    if args.min_dvdt is not None:  # e.x. end of charge: voltage flattens
+        limits.append(('dV', '>=', args.min_dvdt))
+    batch = makeBatch(jobs, args.maxv or Vmax, args.maxi or Imax, limits)
+    total = len(jobs) + 2  # with max V and max I
+    if args.dry_run:  # server checks the batch as setQueue does
+        psuServer.checkQueue(batch)
+        progress(args, '{} jobs valid, start {}'.format(total, start))
+        return OK
+    lease = None
+    if not args.no_wait:  # PSU goes to the safe state if the client dies
+        lease = psuServer.acquireLease('psuClient@{}'.format(
+            socket.gethostname()), max(LEASE, 3 * args.interval))['lease']
+    psuServer.keybOff()  # from now on PSU is blocked !!!
+    try:
+        psuServer.setQueue(batch)
+        baseline = psuServer.getSnapshot(-1)['version']  # always returned
+        psuServer.startScheduler(start.strftime(dtFormat), args.frequency)
+    except BaseException:  # rejected batch or start, unblock the PSU
+        try:
+            psuServer.psuManualMode()
+            psuServer.releaseLease(lease)
+        except Exception:  # connection lost, the first error is reported
+            pass
+        raise
+    progress(args, '{} jobs submitted to {}, start {}'.format(
+             total, args.server, start))
+    if args.no_wait:
+        return OK
+    out = open(args.output, mode='w') if args.output else sys.stdout
+    try:
+        with out:
+            code = follow(psuServer, baseline, total,
+                          TelemetryWriter(out, args.format), args, lease)
+    except KeyboardInterrupt:
+        psuServer.stopScheduler()
+        progress(args, 'interrupted, batch stopped')
+        code = INTERRUPTED
+    psuServer.psuManualMode()  # turn off PSU and turn on keyboard
+    psuServer.releaseLease(lease)
+    return code
+
+
+def addRunArguments(parser):
+    """adds options of the run (start, limits, telemetry) to the argparse
+    `parser' (shared with orchestrator.py)"""
+    parser.add_argument('-a', '--at', default='+10',
+                        help='start time: +SECONDS from now, HH:MM:SS or '
+                        '"{}" (server clock, default +10)'.format(
+                            dtFormat.replace('%', '%%')))
+    parser.add_argument('-f', '--frequency', type=float, default=1,
+                        choices=(1, 0.5, 0.25, 0.1),
+                        help='scheduler frequency [Hz] (default 1)')
+    parser.add_argument('--maxv', type=float,
+                        help='max voltage of the run (default PSU maximum)')
+    parser.add_argument('--maxi', type=float,
+                        help='max current of the run (default PSU maximum)')
+    parser.add_argument('--max-ah', type=float,
+                        help='stop every job after charge MAX_AH [Ah]')
+    parser.add_argument('--max-wh', type=float,
+                        help='stop every job after energy MAX_WH [Wh]')
+    parser.add_argument('--min-dvdt', type=float,
+                        help='stop every job when dV/dt over the last {:.0f} '
+                        's falls below MIN_DVDT [V/s]'.format(slopeWindow))
+    parser.add_argument('-F', '--format', default='csv',
+                        choices=('csv', 'jsonl'),
+                        help='telemetry format (default csv)')
+    parser.add_argument('-I', '--interval', type=float, default=2,
+                        help='telemetry polling period [s] (default 2)')
+    parser.add_argument('-t', '--timeout', type=float,
+                        help='stop the batch after TIMEOUT seconds')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='no progress messages on stderr')
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Headless PSU client: '
+                                     'submits and runs a job program')
+    parser.add_argument('program', help='program file (.vlp or .vlb)')
+    parser.add_argument('-s', '--server', default='localhost',
+                        help='PSU server host (default localhost)')
+    parser.add_argument('-p', '--port', type=int, default=50000,
+                        help='Pyro4 port of the server (default 50000)')
+    parser.add_argument('-i', '--psuid', default='psuServer',
+                        help='Pyro4 id of the server (default psuServer)')
+    parser.add_argument('-o', '--output', help='telemetry file '
+                        '(default stdout)')
+    parser.add_argument('-n', '--no-wait', action='store_true',
+                        help='exit after the start (no telemetry)')
+    parser.add_argument('-d', '--dry-run', action='store_true',
+                        help='check program and server, do not start')
+    addRunArguments(parser)
+    args = parser.parse_args()
+    try:
+        code = run(args)
+    except ClientError as er:
+        print('psuClient: {}'.format(er), file=sys.stderr)
+        code = er.code
+    except KeyboardInterrupt:
+        code = INTERRUPTED
+    sys.exit(code)
+
+if __name__ == '__main__':
+    main()
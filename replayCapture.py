@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""Replay of captured PSU serial traffic (regression benchmark, profiling).
+
+Reconstructs the VoltcraftPSU calls of a capture (mainServer.py -c FILE)
+from the captured writes and issues them against replay://FILE at the
+captured times divided by --speed, the device answers with the captured
+frames after the captured delays. Prints calls and durations (replayed and
+captured) per command and the slowest calls with their capture time, so a
+stall of the rig can be located and profiled, for example:
+
+    ./replayCapture.py rig.vlc --speed 10 --profile
+"""
+import sys
+import json
+import time
+import struct
+from libs.capture import readCapture, WRITE
+from libs.modelsDict import commands, specValues, models
+from libs.voltcraftPSU import VoltcraftPSU, PsuOfflineError
+
+codes = {code[0]: name for name, code in commands.items()}
+
+
+def decodeCall(psu, data):
+    """returns (name, function) of the VoltcraftPSU call which wrote `data'"""
+    name = codes.get(data[0])
+    raw = data[1:3]
+    value = struct.unpack('>h', raw)[0]
+    mul = models[psu.model]
+    if name == 'set_voltage':
+        return name, lambda: psu.setVoltage(value / 100 / mul['Vmul'])
+    if name == 'set_max_voltage':
+        return name, lambda: psu.setMaxVoltage(value / 10 / mul['Vmul'])
+    if name == 'set_max_current':
+        return name, lambda: psu.setMaxCurrent(value / 100 / mul['Imul'])
+    if name == 'get_voltage':
+        return name, psu.getVoltage
+    if name == 'get_current':
+        return name, psu.getCurrent
+    if name == 'power':
+        on = raw == specValues['power_on']
+        return name, psu.psuOn if on else psu.psuOff
+    if name == 'keyboard':
+        remote = raw == specValues['keyb_off']
+        return name, psu.remoteKey if remote else psu.manualKey
+    return None, None
+
+
+def capturedCalls(records):
+    """returns list of (capture time, data, captured duration) of the writes,
+    duration lasts until the last read before the next write"""
+    calls = []
+    for t, kind, data in records:
+        if kind == WRITE:
+            calls.append([t, data, 0.0])
+        elif calls:
+            calls[-1][2] = t - calls[-1][0]
+    return calls
+
+
+def replay(path, speed):
+    """replays the capture, returns (results per command, calls, mismatches)
+
+    Returns:
+        tuple: {name: {'calls', 'replayed', 'captured', 'max'...}},
+               list of (replayed duration, capture time, name), mismatches"""
+    started, records = readCapture(path)
+    psu = VoltcraftPSU('replay://{}?speed={}'.format(path, speed))
+    psu.getID()
+    results = {}
+    calls = []
+    start = time.monotonic()
+    for t, data, captured in capturedCalls(records):
+        name, call = decodeCall(psu, data)
+        if call is None:
+            continue
+        if speed:
+            delay = start + t / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        begin = time.perf_counter()
+        try:
+            call()
+        except PsuOfflineError:
+            pass  # captured timeout
+        duration = time.perf_counter() - begin
+        result = results.setdefault(name, {'calls': 0, 'replayed': 0.0,
+                                           'replayedMax': 0.0, 'captured': 0.0,
+                                           'capturedMax': 0.0})
+        result['calls'] += 1
+        result['replayed'] += duration
+        result['replayedMax'] = max(result['replayedMax'], duration)
+        result['captured'] += captured
+        result['capturedMax'] = max(result['capturedMax'], captured)
+        calls.append((duration, t, name))
+    return results, calls, psu.device.mismatches
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Replay of captured PSU '
+                                                 'serial traffic')
+    parser.add_argument('capture', help='capture file (mainServer.py -c)')
+    parser.add_argument('-s', '--speed', type=float, default=1.0,
+                        help='speed up of the captured timing, 0 replays '
+                             'without delays (default 1)')
+    parser.add_argument('-t', '--top', type=int, default=5,
+                        help='slowest calls shown (default 5)')
+    parser.add_argument('-p', '--profile', action='store_true',
+                        help='print cProfile statistics of the replay')
+    parser.add_argument('-o', '--output', help='JSON file with results')
+    args = parser.parse_args()
+
+    if args.profile:
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.perf_counter()
+    results, calls, mismatches = replay(args.capture, args.speed)
+    total = time.perf_counter() - start
+    if args.profile:
+        profiler.disable()
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+
+    print('{:<16} {:>7} {:>12} {:>12} {:>12} {:>12}'.format(
+          'command', 'calls', 'mean[ms]', 'max[ms]', 'capt.mean', 'capt.max'))
+    for name, result in sorted(results.items()):
+        print('{:<16} {:>7} {:>12.3f} {:>12.3f} {:>12.3f} {:>12.3f}'.format(
+              name, result['calls'],
+              result['replayed'] / result['calls'] * 1000,
+              result['replayedMax'] * 1000,
+              result['captured'] / result['calls'] * 1000,
+              result['capturedMax'] * 1000))
+    print('# slowest calls [ms] at capture time [s]')
+    for duration, t, name in sorted(calls, reverse=True)[:args.top]:
+        print('{:>10.3f}  {:>10.3f}  {}'.format(duration * 1000, t, name))
+    print('replayed {} calls in {:.3f} s, {} mismatches'.format(
+          len(calls), total, mismatches))
+    if args.output:
+        with open(args.output, mode='w') as out:
+            json.dump({'total': total, 'mismatches': mismatches,
+                       'commands': results}, out, indent=1)
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == '__main__':
+    main()